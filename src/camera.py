@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional
+
+import requests
+
+
+log = logging.getLogger("Camera")
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+PART_HEADER_END = b"\r\n\r\n"
+
+
+class Frame(NamedTuple):
+    seq: int
+    timestamp: float
+    jpeg: bytes
+
+
+class MJPEGParser:
+    """Incremental multipart/x-mixed-replace parser, fed arbitrary chunks of the stream body."""
+
+    MAX_BUFFER = 4 * 1024 * 1024  # a single ESP32-CAM frame is well under this
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.in_body = False
+        self.content_length: Optional[int] = None
+        self.scan_from = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        self.buffer += data
+        frames = []
+        while True:
+            if not self.in_body:
+                end = self.buffer.find(PART_HEADER_END, self.scan_from)
+                if end < 0:
+                    # the marker may be split across chunks, so rescan the last few bytes next time
+                    self.scan_from = max(0, len(self.buffer) - len(PART_HEADER_END) + 1)
+                    break
+                self.content_length = self._content_length(bytes(self.buffer[:end]))
+                del self.buffer[:end + len(PART_HEADER_END)]
+                self.in_body = True
+                self.scan_from = 0
+
+            if self.content_length is not None:
+                if len(self.buffer) < self.content_length:
+                    break
+                size = self.content_length
+            else:
+                end = self.buffer.find(JPEG_EOI, self.scan_from)
+                if end < 0:
+                    self.scan_from = max(0, len(self.buffer) - 1)
+                    break
+                size = end + len(JPEG_EOI)
+
+            frame = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            self.in_body = False
+            self.scan_from = 0
+            if frame.startswith(JPEG_SOI):
+                frames.append(frame)
+            else:
+                log.debug("Dropping part that is not a JPEG (%d bytes)", len(frame))
+
+        if len(self.buffer) > self.MAX_BUFFER:
+            log.warning("MJPEG buffer overflow, resynchronising")
+            self.reset()
+        return frames
+
+    def reset(self):
+        self.buffer.clear()
+        self.in_body = False
+        self.content_length = None
+        self.scan_from = 0
+
+    @staticmethod
+    def _content_length(headers: bytes) -> Optional[int]:
+        for line in headers.split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                try:
+                    return int(value.strip())
+                except ValueError:
+                    return None
+        return None
+
+
+class MJPEGGrabber:
+    """Keeps one MJPEG stream open on a background thread and publishes the newest frames into a ring."""
+
+    def __init__(self, url: str, ring_size: int = 4, chunk_size: int = 4096,
+                 connect_timeout: float = 5, read_timeout: float = 5, reconnect_delay: float = 1.0):
+        self.url = url
+        self.chunk_size = chunk_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.reconnect_delay = reconnect_delay
+        self.ring: Deque[Frame] = deque(maxlen=ring_size)
+        self.seq = 0
+        self.connections = 0
+        self._new_frame = threading.Condition()
+        self._stop = threading.Event()
+        self._response = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MJPEGGrabber":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="MJPEGGrabber", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[Frame]:
+        """Newest frame without waiting, or None if there is none (or it is older than max_age seconds)."""
+        try:
+            frame = self.ring[-1]
+        except IndexError:
+            return None
+        if max_age is not None and time.monotonic() - frame.timestamp > max_age:
+            return None
+        return frame
+
+    def wait_for_frame(self, after_seq: int = 0, timeout: Optional[float] = None) -> Optional[Frame]:
+        """Block until a frame newer than after_seq is published."""
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self.seq > after_seq or self._stop.is_set(), timeout)
+        frame = self.latest()
+        return frame if frame is not None and frame.seq > after_seq else None
+
+    def _publish(self, jpeg: bytes):
+        with self._new_frame:
+            self.seq += 1
+            self.ring.append(Frame(self.seq, time.monotonic(), jpeg))
+            self._new_frame.notify_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with requests.get(self.url, stream=True, timeout=self.timeout) as response:
+                    self._response = response
+                    response.raise_for_status()
+                    self.connections += 1
+                    log.debug("MJPEG stream connected to %s", self.url)
+                    parser = MJPEGParser()
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if self._stop.is_set():
+                            break
+                        for jpeg in parser.feed(chunk):
+                            self._publish(jpeg)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                log.warning("MJPEG stream from %s interrupted: %s", self.url, e)
+            finally:
+                self._response = None
+            self._stop.wait(self.reconnect_delay)
@@ -0,0 +1,73 @@
+import logging
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Hashable, NamedTuple, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+log = logging.getLogger("ChangeDetector")
+
+
+class ChangeDecision(NamedTuple):
+    changed: bool
+    score: float  # fraction of the downscaled image that changed
+
+
+class ChangeDetector:
+    """
+    Decides whether two camera frames show a different scene, by comparing downscaled grayscale copies.
+    Each copy has its mean brightness removed, so exposure drift and JPEG noise do not count as a change,
+    and a pixel only counts as changed when it moves by more than pixel_delta grey levels.
+    """
+
+    def __init__(self, threshold: float = 0.001, size: Tuple[int, int] = (64, 48), pixel_delta: int = 8,
+                 cache_size: int = 4):
+        self.threshold = threshold
+        self.size = size
+        self.pixel_delta = pixel_delta
+        self.cache_size = cache_size
+        self.signatures: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+
+    def signature(self, jpeg: bytes) -> np.ndarray:
+        image = Image.open(BytesIO(jpeg))
+        # let the JPEG decoder skip straight to a reduced scale, then finish the downscale
+        image.draft("L", (self.size[0] * 2, self.size[1] * 2))
+        pixels = np.asarray(image.convert("L").resize(self.size, Image.BILINEAR), dtype=np.float32)
+        return pixels - pixels.mean()
+
+    def score(self, before: np.ndarray, after: np.ndarray) -> float:
+        return float(np.count_nonzero(np.abs(after - before) > self.pixel_delta)) / before.size
+
+    def compare(self, before: bytes, after: bytes) -> ChangeDecision:
+        score = self.score(self.signature(before), self.signature(after))
+        return ChangeDecision(score > self.threshold, score)
+
+    def compare_keys(self, before: Hashable, after: Hashable, load: Callable[[Hashable], bytes]) -> ChangeDecision:
+        """Like compare, for frames identified by keys; load(key) is only called for frames not seen recently."""
+        score = self.score(self._signature_for(before, load), self._signature_for(after, load))
+        decision = ChangeDecision(score > self.threshold, score)
+        log.debug("Frames %s -> %s changed %.4f (threshold %.4f)", before, after, score, self.threshold)
+        return decision
+
+    def _signature_for(self, key: Hashable, load: Callable[[Hashable], bytes]) -> np.ndarray:
+        signature = self.signatures.get(key)
+        if signature is None:
+            signature = self.signatures[key] = self.signature(load(key))
+            if len(self.signatures) > self.cache_size:
+                self.signatures.popitem(last=False)
+        return signature
+
+
+def perceptual_hash(jpeg: bytes, size: int = 8) -> int:
+    """64 bit difference hash (for size 8): whether each pixel of a tiny grayscale copy is brighter than its right neighbour."""
+    image = Image.open(BytesIO(jpeg))
+    image.draft("L", ((size + 1) * 4, size * 4))
+    pixels = np.asarray(image.convert("L").resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
@@ -0,0 +1,114 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+
+import prompts
+
+
+log = logging.getLogger("Context")
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(message: Dict) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + len(message.get("content") or "") // CHARS_PER_TOKEN
+
+
+def assistant_summary(message: Dict) -> Optional[str]:
+    # the model is asked to summarise its actions in the "message" field, so that is what gets remembered
+    if message.get("role") != "assistant":
+        return None
+    try:
+        content = json.loads(message.get("content") or "")
+    except ValueError:
+        return None
+    summary = content.get("message") if isinstance(content, dict) else None
+    return summary.strip() if isinstance(summary, str) and summary.strip() else None
+
+
+class BudgetPolicy(ABC):
+    """Decides how dropped turns are folded into the rolling digest."""
+
+    @abstractmethod
+    def fold(self, dropped: List[Dict], digest: str) -> str:
+        """The new digest, with what matters of dropped added to digest."""
+
+
+class DropOldestPolicy(BudgetPolicy):
+    """Keeps the assistant's own summaries of dropped turns, trimmed to max_digest_tokens."""
+
+    def __init__(self, max_digest_tokens: int = 256):
+        self.max_digest_tokens = max_digest_tokens
+
+    def fold(self, dropped: List[Dict], digest: str) -> str:
+        lines = digest.splitlines() if digest else []
+        lines.extend("- " + summary for summary in map(assistant_summary, dropped) if summary)
+        while lines and sum(len(line) + 1 for line in lines) // CHARS_PER_TOKEN > self.max_digest_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+
+
+class SummarizePolicy(BudgetPolicy):
+    """Asks a chat backend to merge the dropped turns into the digest."""
+
+    def __init__(self, summarize: Callable[[List[Dict], str], str], fallback: Optional[BudgetPolicy] = None):
+        self.summarize = summarize
+        self.fallback = fallback or DropOldestPolicy()
+
+    def fold(self, dropped: List[Dict], digest: str) -> str:
+        try:
+            return self.summarize(dropped, digest).strip()
+        except Exception:
+            log.warning("Summarising dropped turns failed, keeping their summaries instead", exc_info=True)
+            return self.fallback.fold(dropped, digest)
+
+
+class ChatContext:
+    """
+    Keeps a chat message list within an approximate token budget.
+    The first `pinned` messages (the prompts.START preamble) are never dropped; once the budget is exceeded the
+    oldest turns are removed and folded by the policy into a digest message that sits right after them.
+    """
+
+    def __init__(self, max_tokens: int = 4096, target_ratio: float = 0.75, keep_recent: int = 4,
+                 pinned: int = 1, policy: Optional[BudgetPolicy] = None):
+        self.max_tokens = max_tokens
+        self.target_tokens = int(max_tokens * target_ratio)
+        self.keep_recent = keep_recent
+        self.pinned = pinned
+        self.policy = policy or DropOldestPolicy()
+        self.digest = ""
+        self.dropped = 0
+
+    def tokens(self, messages: List[Dict]) -> int:
+        return sum(estimate_tokens(message) for message in messages)
+
+    def compact(self, messages: List[Dict]) -> bool:
+        """Compacts messages in place, returns whether anything was dropped."""
+        if self.tokens(messages) <= self.max_tokens:
+            return False
+
+        has_digest = bool(self.digest) and len(messages) > self.pinned and messages[self.pinned].get("role") == "system"
+        first_turn = self.pinned + (1 if has_digest else 0)
+        last_droppable = len(messages) - self.keep_recent
+        total = self.tokens(messages)
+        end = first_turn
+        while end < last_droppable and total > self.target_tokens:
+            total -= estimate_tokens(messages[end])
+            end += 1
+        # never leave an assistant reply without the user message that prompted it
+        while end < last_droppable and messages[end].get("role") != "user":
+            end += 1
+        if end == first_turn:
+            return False
+
+        dropped = messages[first_turn:end]
+        self.digest = self.policy.fold(dropped, self.digest)
+        self.dropped += len(dropped)
+        replacement = [{"role": "system", "content": prompts.DIGEST + self.digest}] if self.digest else []
+        messages[self.pinned:end] = replacement
+        log.info("Compacted chat history: dropped %d messages, %d remain, ~%d tokens",
+                 len(dropped), len(messages), self.tokens(messages))
+        return True
@@ -0,0 +1,128 @@
+import logging
+import mmap
+import os
+import struct
+from array import array
+from collections import deque
+from typing import Deque, Iterator, List, Optional, Tuple
+
+
+log = logging.getLogger("FrameStore")
+
+
+class FrameStore:
+    """
+    Fixed-capacity history of raw JPEG frames.
+    With a spill_path, frames evicted from memory are appended to a segment file
+    (plus an offset index alongside it) and remain readable through a memory map.
+    """
+
+    INDEX_ENTRY = struct.Struct("<QI")  # segment offset, frame length
+
+    def __init__(self, capacity: int = 16, spill_path: Optional[str] = None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.frames: Deque[bytes] = deque()
+        self.first_index = 0  # index of self.frames[0]
+        self.offsets = array("Q")
+        self.lengths = array("I")
+        self._segment = None
+        self._index = None
+        self._map: Optional[mmap.mmap] = None
+        if spill_path:
+            self._open_segment(spill_path)
+
+    @property
+    def index_path(self) -> Optional[str]:
+        return self.spill_path + ".idx" if self.spill_path else None
+
+    def __len__(self) -> int:
+        return self.first_index + len(self.frames)
+
+    def append(self, jpeg: bytes) -> int:
+        if len(self.frames) == self.capacity:
+            self._evict()
+        self.frames.append(bytes(jpeg))
+        return len(self) - 1
+
+    def get(self, index: int) -> bytes:
+        if index < 0:
+            index += len(self)
+        if self.first_index <= index < len(self):
+            return self.frames[index - self.first_index]
+        if 0 <= index < len(self.offsets):
+            return self._read_spilled(index)
+        raise IndexError(f"Frame {index} is not retained")
+
+    def last_indices(self, count: int) -> range:
+        return range(max(self.first_index, len(self) - count), len(self))
+
+    def latest(self, count: int = 1) -> List[bytes]:
+        return [self.get(i) for i in self.last_indices(count)]
+
+    def replay(self, start: int = 0) -> Iterator[Tuple[int, bytes]]:
+        """Every retained frame from start onwards, spilled ones first."""
+        for index in range(start, len(self)):
+            if index < self.first_index and index >= len(self.offsets):
+                continue
+            yield index, self.get(index)
+
+    def memory_bytes(self) -> int:
+        return sum(len(frame) for frame in self.frames)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        for f in (self._segment, self._index):
+            if f is not None:
+                f.close()
+        self._segment = self._index = None
+
+    def _open_segment(self, path: str):
+        usable = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % self.INDEX_ENTRY.size
+            for offset, length in self.INDEX_ENTRY.iter_unpack(data[:usable]):
+                self.offsets.append(offset)
+                self.lengths.append(length)
+            # frames from an earlier run are replayable and new ones are numbered after them
+            self.first_index = len(self.offsets)
+            log.info("Reopened frame segment %s with %d frames", path, len(self.offsets))
+        self._segment = open(path, "ab")
+        self._index = open(self.index_path, "ab")
+        # and a torn index entry, or the entries appended after it would be read misaligned
+        self._index.truncate(usable)
+        if self.offsets:
+            # drop any frame bytes written after the last complete index entry
+            end = self.offsets[-1] + self.lengths[-1]
+            if self._segment.tell() != end:
+                self._segment.truncate(end)
+                self._segment.seek(end)
+        else:
+            self._segment.truncate(0)
+
+    def _evict(self):
+        frame = self.frames.popleft()
+        if self._segment is not None:
+            offset = self._segment.tell()
+            self._segment.write(frame)
+            self._segment.flush()
+            self._index.write(self.INDEX_ENTRY.pack(offset, len(frame)))
+            self._index.flush()
+            self.offsets.append(offset)
+            self.lengths.append(len(frame))
+        self.first_index += 1
+
+    def _read_spilled(self, index: int) -> bytes:
+        offset, length = self.offsets[index], self.lengths[index]
+        if self._map is None or offset + length > len(self._map):
+            if self._map is not None:
+                self._map.close()
+            with open(self.spill_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
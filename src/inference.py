@@ -0,0 +1,258 @@
+"""
+Routes a chat prompt to several inference backends at once and takes the first reply that matches
+ollama.FORMAT, discarding the others.
+
+Losing requests are only stopped where the HTTP exchange allows it: an Ollama stream is closed at its next
+line, which makes Ollama stop generating. A request still waiting for its response headers, i.e. Ollama
+evaluating the prompt or an OpenAI-compatible server generating its whole reply, runs to completion on
+the server and its reply is dropped when it arrives.
+
+Backends speak either Ollama's /api/chat or an OpenAI-compatible /v1/chat/completions. Each keeps a
+moving average of its latency and how often its replies were unusable, and the router sends each prompt
+to the fanout backends expected to answer soonest, so a backend that turns slow or unreliable drops out
+of the race while the others keep being measured. Replies come back shaped like Ollama's, whichever
+backend gave them.
+"""
+import base64
+import json
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+import ollama
+from request_builder import ChatRequest
+from response_validator import ResponseValidator
+from stream_parser import ToolCallStreamParser
+from telemetry import TELEMETRY
+from transport import Endpoint, RetryPolicy, StreamError
+
+
+log = logging.getLogger("Inference")
+
+APIS = ("ollama", "openai")
+
+VALIDATOR = ResponseValidator()
+
+
+class Backend:
+    def __init__(self, name: str, url: str, model: Optional[str] = None, api: str = "ollama",
+                 api_key: Optional[str] = None, timeouts=(5, 300), endpoint: Optional[Endpoint] = None,
+                 smoothing: float = 0.3):
+        if api not in APIS:
+            raise ValueError(f"Unknown api {api}, expected one of {APIS}")
+        self.name = name
+        self.url = url
+        self.model = model  # None keeps the prompt's
+        self.api = api
+        self.api_key = api_key
+        # a racing backend has others to fall back on, so it does not wait long retrying
+        self.endpoint = endpoint if endpoint is not None else Endpoint(name, *timeouts, retry=RetryPolicy(attempts=2))
+        self.smoothing = smoothing
+        self.latency: Optional[float] = None  # seconds, exponential moving average
+        self.requests = 0
+        self.wins = 0
+        self.failures = 0  # errors and replies that did not match the format
+        self.cancelled = 0
+
+    @property
+    def available(self) -> bool:
+        return self.endpoint.breaker.state != "open"
+
+    def expected(self) -> float:
+        """
+        Expected seconds to a usable reply; unmeasured backends come first so they get measured, unless all
+        they have done so far is fail (e.g. a wrong API key or model), then they come last.
+        """
+        if self.latency is None:
+            return float("inf") if self.failures else 0.0
+        reliability = (self.requests - self.failures + 1) / (self.requests + 1)
+        return self.latency / max(reliability, 0.1)
+
+    def observe(self, seconds: float):
+        self.latency = seconds if self.latency is None else \
+            self.smoothing * seconds + (1 - self.smoothing) * self.latency
+
+    def complete(self, prompt: Dict, cancel: threading.Event,
+                 on_delta: Optional[Callable[[str], None]] = None) -> Optional[Dict]:
+        """
+        The reply to prompt in Ollama's shape, or None if cancel was set before it was complete. cancel is
+        checked as the reply arrives, it does not interrupt a request still waiting for the server.
+        """
+        if self.api == "openai":
+            return self._complete_openai(prompt, cancel)
+        return self._complete_ollama(prompt, cancel, on_delta)
+
+    def _complete_ollama(self, prompt: Dict, cancel: threading.Event,
+                         on_delta: Optional[Callable[[str], None]]) -> Optional[Dict]:
+        # always streamed, closing the connection is what makes Ollama stop generating
+        body = ChatRequest(dict(prompt, stream=True, model=self.model or prompt.get("model")))
+        content = []
+        with self.endpoint.post(self.url, data=body, headers=body.headers(), stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if cancel.is_set():
+                    return None
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise StreamError(f"{self.name} error: {chunk['error']}")
+                delta = chunk.get("message", {}).get("content", "")
+                content.append(delta)
+                if on_delta is not None and delta:
+                    on_delta(delta)
+                if chunk.get("done"):
+                    chunk["message"] = {"role": "assistant", "content": "".join(content)}
+                    return chunk
+        raise StreamError(f"{self.name} stream ended before completion")
+
+    def _complete_openai(self, prompt: Dict, cancel: threading.Event) -> Optional[Dict]:
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        with self.endpoint.post(self.url, json=openai_body(prompt, self.model), headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if cancel.is_set():
+                return None  # the server has already done the work, only the download is saved
+            reply = response.json()
+        usage = reply.get("usage", {})
+        return ollama_shaped(reply["choices"][0]["message"].get("content") or "", reply.get("model", self.model),
+                             prompt_eval_count=usage.get("prompt_tokens", 0), eval_count=usage.get("completion_tokens", 0))
+
+
+def openai_body(prompt: Dict, model: Optional[str]) -> Dict:
+    messages = [dict(message) for message in prompt["messages"]]
+    images = prompt.get("images") or []
+    if images and messages:
+        # Ollama takes the images beside the messages, OpenAI as parts of the last message
+        parts = [{"type": "text", "text": messages[-1]["content"]}]
+        for image in images:
+            encoded = image if isinstance(image, str) else base64.b64encode(image).decode("ascii")
+            parts.append({"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + encoded}})
+        messages[-1]["content"] = parts
+    body = {"model": model or prompt.get("model"), "messages": messages,
+            "response_format": {"type": "json_schema",
+                                "json_schema": {"name": "arm_reply", "schema": prompt.get("format", ollama.FORMAT)}}}
+    if "temperature" in prompt.get("options", {}):
+        body["temperature"] = prompt["options"]["temperature"]
+    return body
+
+
+def ollama_shaped(content: str, model: Optional[str], **counts) -> Dict:
+    # durations are unknown, zero keeps the timing logs working
+    reply = {"model": model, "message": {"role": "assistant", "content": content}, "done": True,
+             "total_duration": 0, "load_duration": 0, "prompt_eval_duration": 0, "eval_duration": 0}
+    reply.update(counts)
+    return reply
+
+
+def usable(reply: Dict) -> bool:
+    # repairable replies count, the caller repairs them again
+    content = reply.get("message", {}).get("content")
+    return isinstance(content, str) and VALIDATOR.parse(content).valid
+
+
+class InferenceRouter:
+    def __init__(self, backends: List[Backend], fanout: int = 2):
+        if not backends:
+            raise ValueError("At least one backend is needed")
+        self.backends = backends
+        self.fanout = fanout
+        self.pool = ThreadPoolExecutor(max_workers=len(backends) * 2, thread_name_prefix="inference")
+        self.lock = threading.Lock()
+
+    def ranked(self) -> List[Backend]:
+        with self.lock:
+            return sorted((backend for backend in self.backends if backend.available), key=Backend.expected)
+
+    def chat(self, prompt: Dict, on_tool_call: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        The first usable reply among the fastest backends, or else the last unusable one, for the caller's
+        validator to ask again about; only raises when no backend replied at all. Tool calls are only
+        streamed to on_tool_call when a single backend is asked, otherwise a losing reply could already have
+        moved the arm.
+        """
+        candidates = self.ranked()[:self.fanout]
+        if not candidates:
+            raise requests.exceptions.ConnectionError("No inference backend available, all circuits are open")
+        on_delta = None
+        if on_tool_call is not None and len(candidates) == 1:
+            parser = ToolCallStreamParser()
+
+            def on_delta(delta: str):
+                for tool_call in parser.feed(delta):
+                    on_tool_call(tool_call)
+
+        cancel = threading.Event()
+        futures = {self.pool.submit(self._attempt, backend, prompt, cancel, on_delta): backend
+                   for backend in candidates}
+        pending = set(futures)
+        error: Optional[Exception] = None
+        unusable: Optional[Dict] = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        reply, ok = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if reply is not None and not ok:
+                        unusable = reply
+                    elif reply is not None:
+                        backend = futures[future]
+                        with self.lock:
+                            backend.wins += 1
+                        log.info("%s answered first of %s", backend.name, [b.name for b in candidates])
+                        return reply
+        finally:
+            cancel.set()
+        if unusable is not None:
+            return unusable
+        if error is not None:
+            raise error
+        raise ValueError(f"No reply from {[backend.name for backend in candidates]}")
+
+    def _attempt(self, backend: Backend, prompt: Dict, cancel: threading.Event,
+                 on_delta: Optional[Callable[[str], None]]) -> Tuple[Optional[Dict], bool]:
+        """The reply, None if cancelled, and whether it is usable."""
+        started = monotonic()
+        with self.lock:
+            backend.requests += 1
+        try:
+            reply = backend.complete(prompt, cancel, on_delta)
+        except Exception:
+            with self.lock:
+                backend.failures += 1
+            log.warning("%s failed", backend.name, exc_info=True)
+            raise
+        seconds = monotonic() - started
+        with self.lock:
+            if reply is None:
+                # it took at least this long, which still tells the ranking something
+                backend.cancelled += 1
+                backend.observe(max(seconds, backend.latency or 0))
+                return None, False
+            backend.observe(seconds)
+            reply["backend"] = backend.name
+            if not usable(reply):
+                backend.failures += 1
+                log.warning("%s reply does not match the format: %.100s", backend.name, reply["message"]["content"])
+                return reply, False
+        TELEMETRY.record(f"inference.{backend.name}", seconds * 1000)
+        return reply, True
+
+    def stats(self) -> Dict[str, Dict]:
+        with self.lock:
+            return {backend.name: {"latency_s": round(backend.latency, 2) if backend.latency is not None else None,
+                                   "requests": backend.requests, "wins": backend.wins,
+                                   "failures": backend.failures, "cancelled": backend.cancelled}
+                    for backend in self.backends}
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        for backend in self.backends:
+            backend.endpoint.close()
@@ -0,0 +1,293 @@
+"""
+Listens all the time on a background thread so a spoken command is already transcribed when the arm loop
+asks for the next one.
+
+Captured audio is split into phrases by energy: a frame is speech when it is well above the noise floor,
+a phrase ends after a pause. The noise floor is measured once, saved to calibration_path and reused on the
+next start; after that it is only measured again when the ambient level drifts away from it for a while.
+Phrases are transcribed by a pluggable, offline by default, recognizer backend on a second thread.
+"""
+import json
+import logging
+import math
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Callable, Deque, List, NamedTuple, Optional
+
+import numpy as np
+import speech_recognition as sr
+
+from supervisor import atomic_write_json
+from telemetry import TELEMETRY
+
+
+log = logging.getLogger("Listener")
+
+
+class RecognizerBackend(ABC):
+    """Turns a phrase into text, None if nothing was understood."""
+
+    @abstractmethod
+    def transcribe(self, audio: sr.AudioData) -> Optional[str]:
+        """The text of audio, None if nothing was understood."""
+
+
+class VoskBackend(RecognizerBackend):
+    """Offline recognition with a Vosk model directory, see https://alphacephei.com/vosk/models"""
+
+    def __init__(self, model_path: str = "model", sample_rate: int = 16000):
+        from vosk import Model
+
+        self.model = Model(model_path)
+        self.sample_rate = sample_rate
+
+    def transcribe(self, audio: sr.AudioData) -> Optional[str]:
+        from vosk import KaldiRecognizer
+
+        recognizer = KaldiRecognizer(self.model, self.sample_rate)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+        return json.loads(recognizer.FinalResult()).get("text") or None
+
+
+class SpeechRecognitionBackend(RecognizerBackend):
+    """Any of speech_recognition's recognize_<method> functions, e.g. "sphinx", "whisper" or "faster_whisper"."""
+
+    def __init__(self, method: str, recognizer: Optional[sr.Recognizer] = None, **options):
+        self.recognizer = recognizer if recognizer is not None else sr.Recognizer()
+        self.recognize = getattr(self.recognizer, f"recognize_{method}")
+        self.options = options
+
+    def transcribe(self, audio: sr.AudioData) -> Optional[str]:
+        try:
+            text = self.recognize(audio, **self.options)
+        except sr.UnknownValueError:
+            return None
+        return (text.strip() or None) if isinstance(text, str) else None
+
+
+def make_backend(name: str, **options) -> RecognizerBackend:
+    if name == "vosk":
+        return VoskBackend(**options)
+    return SpeechRecognitionBackend(name, **options)
+
+
+def frame_energy(frame: bytes) -> float:
+    """RMS of 16 bit samples."""
+    samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+    return math.sqrt(float(np.dot(samples, samples)) / len(samples)) if len(samples) else 0.0
+
+
+class Phrase(NamedTuple):
+    audio: sr.AudioData
+    ended: float  # monotonic time the pause after it was detected
+
+
+class Command(NamedTuple):
+    text: str
+    heard: float  # monotonic time the phrase ended
+
+
+class Listener:
+    """
+    Capture and transcription threads feeding a queue of commands for get().
+    muted() is checked every frame, audio heard while it is True is dropped (e.g. while the robot talks).
+    Everything else is queued, get(since=...) skips what was said before the robot asked for it.
+    """
+
+    def __init__(self, source: sr.AudioSource, backend: RecognizerBackend, calibration_path: Optional[str] = None,
+                 muted: Callable[[], bool] = lambda: False, calibration_seconds: float = 1.0,
+                 speech_ratio: float = 3.0, min_floor: float = 50.0, start_seconds: float = 0.1,
+                 pause_seconds: float = 0.8, min_phrase_seconds: float = 0.3, max_phrase_seconds: float = 10.0,
+                 pre_roll_seconds: float = 0.3, drift_ratio: float = 1.5, drift_seconds: float = 3.0,
+                 ambient_seconds: float = 2.0):
+        self.source = source
+        self.backend = backend
+        self.calibration_path = calibration_path
+        self.muted = muted
+        self.calibration_seconds = calibration_seconds
+        self.speech_ratio = speech_ratio
+        self.min_floor = min_floor
+        self.start_seconds = start_seconds
+        self.pause_seconds = pause_seconds
+        self.min_phrase_seconds = min_phrase_seconds
+        self.max_phrase_seconds = max_phrase_seconds
+        self.pre_roll_seconds = pre_roll_seconds
+        self.drift_ratio = drift_ratio
+        self.drift_seconds = drift_seconds
+        self.ambient_seconds = ambient_seconds  # time constant of the ambient level's moving average
+
+        self.floor: Optional[float] = self.load_calibration()
+        self.ambient = self.floor
+        self.calibrations = 0
+        self.frames = 0
+        self.phrases = 0
+        self.commands: "queue.Queue[Command]" = queue.Queue()
+        self.stale = 0  # commands dropped for being heard before they were asked for
+        self._phrases: "queue.Queue[Optional[Phrase]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._capture: Optional[threading.Thread] = None
+        self._recognition: Optional[threading.Thread] = None
+
+    def load_calibration(self) -> Optional[float]:
+        if not self.calibration_path:
+            return None
+        try:
+            with open(self.calibration_path) as f:
+                floor = float(json.load(f)["floor"])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            log.warning("Ignoring unreadable noise calibration %s", self.calibration_path)
+            return None
+        log.info("Noise floor %.0f from %s", floor, self.calibration_path)
+        return floor
+
+    def save_calibration(self):
+        if self.calibration_path:
+            atomic_write_json(self.calibration_path, {"floor": self.floor, "saved": time.time()})
+
+    def start(self) -> "Listener":
+        if self.is_alive():
+            return self
+        self._stop.clear()
+        if self._recognition is None or not self._recognition.is_alive():
+            self._recognition = threading.Thread(target=self._recognize, name="Listener-recognition", daemon=True)
+            self._recognition.start()
+        if self._capture is None or not self._capture.is_alive():
+            self._capture = threading.Thread(target=self._listen, name="Listener-capture", daemon=True)
+            self._capture.start()
+        return self
+
+    def is_alive(self) -> bool:
+        return all(thread is not None and thread.is_alive() for thread in (self._capture, self._recognition))
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        for thread in (self._capture, self._recognition):
+            if thread is not None:
+                thread.join(timeout)
+
+    def join(self, timeout: Optional[float] = None):
+        """Waits for a finite source to run out and everything heard to be transcribed."""
+        for thread in (self._capture, self._recognition):
+            if thread is not None:
+                thread.join(timeout)
+
+    def get(self, timeout: Optional[float] = None, since: Optional[float] = None) -> Optional[str]:
+        """
+        The oldest command heard, waiting up to timeout seconds for one; None if there is none. Commands heard
+        before since (monotonic time), e.g. talk in the room while the arm was working, are dropped.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            try:
+                command = self.commands.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return None
+            if since is None or command.heard >= since:
+                return command.text
+            self.stale += 1
+            log.info("Dropping %.60r, heard %.1fs before it was asked for", command.text, since - command.heard)
+
+    def _listen(self):
+        try:
+            with self.source as source:
+                if source.SAMPLE_WIDTH != 2:
+                    raise ValueError(f"Only 16 bit audio is supported, not {source.SAMPLE_WIDTH * 8} bit")
+                self._segment(source)
+        except Exception:
+            log.exception("Listening failed")
+        finally:
+            self._phrases.put(None)
+
+    def _segment(self, source: sr.AudioSource):
+        frame_seconds = source.CHUNK / source.SAMPLE_RATE
+        pre_roll: Deque[bytes] = deque(maxlen=max(1, round(self.pre_roll_seconds / frame_seconds)))
+        start_frames = max(1, round(self.start_seconds / frame_seconds))
+        pause_frames = max(1, round(self.pause_seconds / frame_seconds))
+        max_frames = round(self.max_phrase_seconds / frame_seconds)
+        min_frames = round(self.min_phrase_seconds / frame_seconds)
+        smoothing = math.exp(-frame_seconds / self.ambient_seconds)
+        calibration: List[float] = []
+        phrase: List[bytes] = []
+        loud = quiet = drifting = 0
+
+        while not self._stop.is_set():
+            frame = source.stream.read(source.CHUNK)
+            if not frame:
+                break  # the source ran out
+            self.frames += 1
+            if self.muted():
+                phrase.clear()
+                pre_roll.clear()
+                loud = quiet = 0
+                continue
+            energy = frame_energy(frame)
+
+            if self.floor is None:
+                calibration.append(energy)
+                if len(calibration) * frame_seconds >= self.calibration_seconds:
+                    self._calibrate(float(np.median(calibration)))
+                continue
+
+            threshold = max(self.floor, self.min_floor) * self.speech_ratio
+            if not phrase:
+                pre_roll.append(frame)
+                loud = loud + 1 if energy > threshold else 0
+                if loud >= start_frames:
+                    phrase.extend(pre_roll)
+                    pre_roll.clear()
+                    quiet = 0
+                    continue
+                # only audio outside phrases counts towards the ambient level
+                self.ambient = smoothing * self.ambient + (1 - smoothing) * energy
+                ratio = max(self.ambient, 1.0) / max(self.floor, 1.0)
+                drifting = drifting + 1 if not 1 / self.drift_ratio <= ratio <= self.drift_ratio else 0
+                if drifting * frame_seconds >= self.drift_seconds:
+                    log.info("Ambient noise drifted from %.0f to %.0f", self.floor, self.ambient)
+                    self._calibrate(self.ambient)
+                    drifting = 0
+                continue
+
+            phrase.append(frame)
+            quiet = quiet + 1 if energy <= threshold else 0
+            if quiet >= pause_frames or len(phrase) >= max_frames:
+                spoken = len(phrase) - quiet
+                if spoken >= min_frames:
+                    self._emit(phrase, source)
+                phrase = []
+                loud = quiet = 0
+
+        if len(phrase) >= min_frames:
+            self._emit(phrase, source)
+
+    def _calibrate(self, floor: float):
+        self.floor = self.ambient = floor
+        self.calibrations += 1
+        log.info("Noise floor calibrated to %.0f", floor)
+        self.save_calibration()
+
+    def _emit(self, frames: List[bytes], source: sr.AudioSource):
+        self.phrases += 1
+        self._phrases.put(Phrase(sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH),
+                                 time.monotonic()))
+
+    def _recognize(self):
+        while True:
+            phrase = self._phrases.get()
+            if phrase is None:
+                return
+            try:
+                text = self.backend.transcribe(phrase.audio)
+            except Exception:
+                log.exception("Speech recognition failed")
+                continue
+            TELEMETRY.record("stt", (time.monotonic() - phrase.ended) * 1000)
+            if not text:
+                log.warning("I didn't understand.")
+                continue
+            log.warning("Heard: %s", text)
+            self.commands.put(Command(text, phrase.ended))
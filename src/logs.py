@@ -1,4 +1,7 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 
 class ColorFormatter(logging.Formatter):
     COLORS = {
@@ -10,20 +13,50 @@ class ColorFormatter(logging.Formatter):
     }
     RESET = "\033[0m"
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.levels = {name: f"{color}{name}{self.RESET}" for name, color in self.COLORS.items()}
+
     def format(self, record):
-        record.data = record.data if hasattr(record, 'data') else ""
-        log_color = self.COLORS.get(record.levelname, self.RESET)
-        record.levelname = f"{log_color}{record.levelname}{self.RESET}"
-        return super().format(record)
+        # the record is shared with every other handler, so anything changed here is put back
+        levelname = record.levelname
+        record.levelname = self.levels.get(levelname, levelname)
+        if not hasattr(record, 'data'):
+            record.data = ""
+        try:
+            return super().format(record)
+        finally:
+            record.levelname = levelname
+
+
+_listener = None
 
 
 def setup_logging():
+    """
+    Records are handed to a queue on the logging thread and written to the terminal by a listener thread,
+    so a slow terminal never holds up the control loop.
+    """
+    global _listener
     handler = logging.StreamHandler()
     formatter = ColorFormatter(
         "%(asctime)s.%(msecs)03d\t%(levelname)s\t%(name)s\t%(message)s\t%(data)s",
         datefmt="%Y-%m-%d %H:%M:%S"
     )
     handler.setFormatter(formatter)
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(queue.SimpleQueue(), handler, respect_handler_level=True)
+    _listener.start()
     logger = logging.getLogger()
-    logger.handlers = [handler]
+    logger.handlers = [logging.handlers.QueueHandler(_listener.queue)]
     logging.getLogger("connectionpool").setLevel(logging.DEBUG)
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Writes out whatever is still queued."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,192 @@
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+HEADER = b"\x55\x55"
+
+CMD_SERVO_MOVE = 3
+CMD_ACTION_GROUP_RUN = 6
+CMD_ACTION_STOP = 7
+CMD_ACTION_SPEED = 11
+CMD_GET_BATTERY_VOLTAGE = 15
+CMD_MULT_SERVO_UNLOAD = 20
+CMD_MULT_SERVO_POS_READ = 21
+
+# header, length, command, servo count, time (ms); followed by one SERVO per servo
+MOVE_HEAD = struct.Struct("<2sBBBH")
+SERVO = struct.Struct("<BH")
+U16 = struct.Struct("<H")
+
+
+def packet_size(param_count: int) -> int:
+    return len(HEADER) + 2 + param_count
+
+
+def encode_packet(command: int, params: Sequence[int], out: Optional[bytearray] = None) -> bytearray:
+    size = packet_size(len(params))
+    if out is None or len(out) != size:
+        out = bytearray(size)
+    out[0:2] = HEADER
+    out[2] = len(params) + 2  # Length includes command and length byte itself
+    out[3] = command
+    out[4:] = bytes(params)
+    return out
+
+
+def encode_servo_move(servo_ids: Sequence[int], positions: Sequence[int], time_ms: int,
+                      out: Optional[bytearray] = None) -> bytearray:
+    count = len(servo_ids)
+    if count != len(positions):
+        raise ValueError(f"{count} servo ids but {len(positions)} positions")
+    size = MOVE_HEAD.size + SERVO.size * count
+    if out is None or len(out) != size:
+        out = bytearray(size)
+    MOVE_HEAD.pack_into(out, 0, HEADER, size - 2, CMD_SERVO_MOVE, count, time_ms)
+    for i in range(count):
+        SERVO.pack_into(out, MOVE_HEAD.size + SERVO.size * i, servo_ids[i], positions[i])
+    return out
+
+
+def encode_servo_moves(servo_ids: Sequence[int], positions, times_ms, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Encodes a batch of moves of the same servos in one go.
+    positions has one row per packet and one column per servo; the result has one packet per row,
+    so result.tobytes() is the byte stream for the whole batch.
+    """
+    positions = np.asarray(positions, dtype=np.uint16)
+    times_ms = np.asarray(times_ms, dtype=np.uint16)
+    frames, count = positions.shape
+    if count != len(servo_ids) or times_ms.shape != (frames,):
+        raise ValueError("positions must be (packets, servos) and times_ms (packets,)")
+    size = MOVE_HEAD.size + SERVO.size * count
+    if out is None or out.shape != (frames, size):
+        out = np.empty((frames, size), dtype=np.uint8)
+    out[:, 0] = HEADER[0]
+    out[:, 1] = HEADER[1]
+    out[:, 2] = size - 2
+    out[:, 3] = CMD_SERVO_MOVE
+    out[:, 4] = count
+    out[:, 5] = times_ms & 0xFF
+    out[:, 6] = times_ms >> 8
+    servos = out[:, MOVE_HEAD.size:].reshape(frames, count, SERVO.size)
+    servos[:, :, 0] = np.asarray(servo_ids, dtype=np.uint8)
+    servos[:, :, 1] = positions & 0xFF
+    servos[:, :, 2] = positions >> 8
+    return out
+
+
+class LimitTable:
+    """Position limits indexed by servo id, for checking whole batches of moves at once."""
+
+    def __init__(self, limits: Dict[int, Sequence[int]]):
+        self.ranges = {servo_id: (low, high) for servo_id, (low, high) in limits.items()}
+        size = max(limits) + 1
+        # unknown ids get an empty range so every position fails
+        self.low = np.full(size, 1, dtype=np.int32)
+        self.high = np.zeros(size, dtype=np.int32)
+        for servo_id, (low, high) in limits.items():
+            self.low[servo_id] = low
+            self.high[servo_id] = high
+
+    def invalid(self, servo_ids, positions) -> np.ndarray:
+        """Boolean mask, broadcast like positions, of entries that are out of range or for unknown servos."""
+        ids = np.asarray(servo_ids)
+        positions = np.asarray(positions)
+        known = (ids >= 0) & (ids < len(self.low))
+        safe_ids = np.where(known, ids, 0)
+        return ~known | (positions < self.low[safe_ids]) | (positions > self.high[safe_ids])
+
+    def validate(self, servo_ids, positions):
+        if isinstance(positions, list) and len(positions) <= 8 and all(type(p) is int for p in positions):
+            # a single packet checks faster without the array round trip
+            for servo_id, position in zip(servo_ids, positions):
+                low, high = self.ranges.get(servo_id, (1, 0))
+                if not low <= position <= high:
+                    break
+            else:
+                return
+        bad = self.invalid(servo_ids, positions)
+        if bad.any():
+            ids = np.broadcast_to(np.asarray(servo_ids), bad.shape)[bad]
+            values = np.asarray(positions)[bad]
+            raise ValueError("Positions outside of servo limits: %s" % ", ".join(
+                f"servo {servo_id}={position}" for servo_id, position in zip(ids.tolist(), values.tolist())))
+
+    def clamp(self, servo_ids, positions) -> np.ndarray:
+        ids = np.asarray(servo_ids)
+        return np.clip(positions, self.low[ids], self.high[ids])
+
+
+def decode_frame(data: bytes) -> Tuple[int, bytes]:
+    """Command and parameters of one complete packet."""
+    if len(data) < 4 or data[:2] != HEADER:
+        raise ValueError("Not a packet: [%s]" % ", ".join(hex(n) for n in data))
+    length = data[2]
+    if len(data) != length + 2:
+        raise ValueError(f"Packet length {length} does not match {len(data)} bytes")
+    return data[3], bytes(data[4:])
+
+
+def decode_servo_move(params: bytes) -> Tuple[int, Dict[int, int]]:
+    count = params[0]
+    time_ms = U16.unpack_from(params, 1)[0]
+    return time_ms, {servo_id: position for servo_id, position in SERVO.iter_unpack(params[3:3 + SERVO.size * count])}
+
+
+def decode_action_group_run(params: bytes) -> Tuple[int, int]:
+    return params[0], U16.unpack_from(params, 1)[0]
+
+
+def decode_no_params(params: bytes) -> None:
+    return None
+
+
+def decode_action_speed(params: bytes) -> Tuple[int, int]:
+    return params[0], U16.unpack_from(params, 1)[0]
+
+
+def decode_battery_voltage(params: bytes) -> int:
+    if len(params) != 2:
+        raise ValueError("Failed to get battery voltage: [%s]" % ", ".join(hex(n) for n in params))
+    return U16.unpack(params)[0]
+
+
+def decode_servo_ids(params: bytes) -> List[int]:
+    """Parameters of CMD_MULT_SERVO_UNLOAD and of a CMD_MULT_SERVO_POS_READ request."""
+    return list(params[1:1 + params[0]])
+
+
+def decode_servo_positions(params: bytes) -> Dict[int, int]:
+    """Parameters of a CMD_MULT_SERVO_POS_READ reply: count, then servo id and position (high byte first)."""
+    if len(params) < 1 or len(params) != 1 + 3 * params[0]:
+        raise ValueError("Invalid response: [%s]" % ", ".join(hex(n) for n in params))
+    return {params[i]: (params[i + 1] << 8) | params[i + 2] for i in range(1, len(params), 3)}
+
+
+# what the controller is sent, by command
+REQUEST_DECODERS = {
+    CMD_SERVO_MOVE: decode_servo_move,
+    CMD_ACTION_GROUP_RUN: decode_action_group_run,
+    CMD_ACTION_STOP: decode_no_params,
+    CMD_ACTION_SPEED: decode_action_speed,
+    CMD_GET_BATTERY_VOLTAGE: decode_no_params,
+    CMD_MULT_SERVO_UNLOAD: decode_servo_ids,
+    CMD_MULT_SERVO_POS_READ: decode_servo_ids,
+}
+
+# what the controller replies, by command
+REPLY_DECODERS = {
+    CMD_GET_BATTERY_VOLTAGE: decode_battery_voltage,
+    CMD_MULT_SERVO_POS_READ: decode_servo_positions,
+}
+
+
+def decode(data: bytes, reply: bool = False):
+    """Decodes a complete packet into (command, value)."""
+    command, params = decode_frame(data)
+    decoders = REPLY_DECODERS if reply else REQUEST_DECODERS
+    if command not in decoders:
+        raise ValueError(f"Unknown command {command}")
+    return command, decoders[command](params)
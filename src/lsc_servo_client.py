@@ -1,9 +1,12 @@
 import logging
 import serial
-import struct
 import time
 
-from typing import List
+from typing import List, Tuple
+
+import lsc_codec
+import telemetry
+from lsc_codec import LimitTable, decode_battery_voltage, decode_servo_positions, encode_packet, encode_servo_move
 
 # Obtained from Device Manager (Windows), lsusb (Linux)
 COM_PORT_NAME = "Arduino Leonardo"
@@ -12,18 +15,60 @@ COM_PORT_NAME = "Arduino Leonardo"
 log = logging.getLogger("LSCServoController")
 
 
+class FrameParser:
+    """Incremental parser for controller frames: 0x55 0x55, length, command, parameters (length - 2 bytes)."""
+
+    HEADER = lsc_codec.HEADER
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Tuple[int, bytes]]:
+        self.buffer += data
+        frames = []
+        while True:
+            start = self.buffer.find(self.HEADER)
+            if start < 0:
+                # keep a trailing 0x55, it may be the first half of the next header
+                del self.buffer[:-1 if self.buffer.endswith(self.HEADER[:1]) else len(self.buffer)]
+                return frames
+            if start:
+                log.debug("Skipping %d bytes before frame header", start)
+                del self.buffer[:start]
+            if len(self.buffer) < 3:
+                return frames
+            length = self.buffer[2]
+            if length < 2:
+                # not a real header, resync on the next byte
+                del self.buffer[:1]
+                continue
+            if len(self.buffer) < 2 + length:
+                return frames
+            frames.append((self.buffer[3], bytes(self.buffer[4:2 + length])))
+            del self.buffer[:2 + length]
+
+    def needed(self) -> int:
+        """Bytes still missing from the frame being assembled, at least 1."""
+        if len(self.buffer) < 3:
+            return 3 - len(self.buffer)
+        return max(1, 2 + self.buffer[2] - len(self.buffer))
+
+    def reset(self):
+        self.buffer.clear()
+
+
 class LSCServoController:
-    HEADER = [0x55, 0x55]  # Packet header
+    HEADER = lsc_codec.HEADER  # Packet header
     BAUD_RATE = 9600
 
     # Command Constants
-    CMD_SERVO_MOVE = 3
-    CMD_ACTION_GROUP_RUN = 6
-    CMD_ACTION_STOP = 7
-    CMD_ACTION_SPEED = 11
-    CMD_GET_BATTERY_VOLTAGE = 15
-    CMD_MULT_SERVO_UNLOAD = 20
-    CMD_MULT_SERVO_POS_READ = 21
+    CMD_SERVO_MOVE = lsc_codec.CMD_SERVO_MOVE
+    CMD_ACTION_GROUP_RUN = lsc_codec.CMD_ACTION_GROUP_RUN
+    CMD_ACTION_STOP = lsc_codec.CMD_ACTION_STOP
+    CMD_ACTION_SPEED = lsc_codec.CMD_ACTION_SPEED
+    CMD_GET_BATTERY_VOLTAGE = lsc_codec.CMD_GET_BATTERY_VOLTAGE
+    CMD_MULT_SERVO_UNLOAD = lsc_codec.CMD_MULT_SERVO_UNLOAD
+    CMD_MULT_SERVO_POS_READ = lsc_codec.CMD_MULT_SERVO_POS_READ
 
     SERVO_LIMITS = {
         1: [1200, 1800],
@@ -34,12 +79,51 @@ class LSCServoController:
         6: [500, 2500],
     }
 
-    def __init__(self, port: str = "auto"):
+    def __init__(self, port: str = "auto", background_io: bool = False, ready_timeout: float = 2.0):
         # https://pyserial.readthedocs.io/en/latest/pyserial_api.html
         if port is None or port == "auto":
             port = LSCServoController.detect_serial_port()
         self.ser = serial.Serial(port, self.BAUD_RATE, timeout=3, write_timeout=3)
-        time.sleep(2)  # Allow time for serial to initialize
+        self.parser = FrameParser()
+        self.transport = None
+        self.limits = LimitTable(self.SERVO_LIMITS)
+        self.move_buffers = {}  # one packet buffer per servo count, reused for every move
+        self.ready = self.wait_until_ready(ready_timeout)
+        if background_io:
+            # all port access moves to the transport thread, commands no longer wait for the write
+            from serial_transport import SerialTransport
+            self.transport = SerialTransport(self.ser)
+
+    def wait_until_ready(self, timeout: float = 2.0, poll: float = 0.1) -> bool:
+        """
+        Asks for the first servo's position every poll seconds until the controller answers, rather than sleeping
+        through a fixed settle time. Position reads are what the arm relies on, battery readings are unreliable.
+        Returns False if it has not answered within timeout (0 to not ask at all), the controller is then used anyway.
+        """
+        if timeout <= 0:
+            return False
+        started = time.monotonic()
+        deadline = started + timeout
+        read_timeout = self.ser.timeout
+        probe = [1, next(iter(self.SERVO_LIMITS))]
+        try:
+            while True:
+                try:
+                    self.request(self.CMD_MULT_SERVO_POS_READ, probe)
+                    self.read_frame(self.CMD_MULT_SERVO_POS_READ, max(0.0, min(poll, deadline - time.monotonic())))
+                    break
+                except (TimeoutError, serial.SerialException):
+                    if time.monotonic() >= deadline:
+                        log.warning("Servo controller did not answer within %.1fs, carrying on", timeout)
+                        return False
+        finally:
+            self.ser.timeout = read_timeout
+        # answers to earlier probes may still be on their way
+        self.ser.reset_input_buffer()
+        self.parser.reset()
+        telemetry.record("serial.ready", (time.monotonic() - started) * 1000)
+        log.info("Servo controller ready in %.2fs", time.monotonic() - started)
+        return True
 
     @staticmethod
     def detect_serial_port() -> str:
@@ -53,34 +137,35 @@ class LSCServoController:
 
 
     def send_command(self, command: int, params: list[int]):
-        length = len(params) + 2  # Length includes command and length byte itself
-        packet = self.HEADER + [length, command] + params
+        if self.transport is not None:
+            self.transport.send(command, params)
+            return
+        packet = encode_packet(command, params)
         # self.ser.reset_input_buffer()
         # self.ser.reset_output_buffer()
-        bytes_written = self.ser.write(bytearray(packet))
-        assert bytes_written == len(packet), f"{bytes_written} != {len(packet)}"
-        self.ser.flush()
+        self.write_packet(packet)
+
+    def write_packet(self, packet: bytearray):
+        with telemetry.timed("serial.write"):
+            bytes_written = self.ser.write(packet)
+            assert bytes_written == len(packet), f"{bytes_written} != {len(packet)}"
+            self.ser.flush()
 
     def move_servo(self, servo_id: int, position: int, time_ms: int):
-        assert servo_id in self.SERVO_LIMITS, f"{servo_id} not in {self.SERVO_LIMITS}"
-        assert self.SERVO_LIMITS[servo_id][0] <= position >= self.SERVO_LIMITS[servo_id][0], f"For servo {servo_id}, {position} is outside of {self.SERVO_LIMITS[servo_id]}"
-        params = [1, time_ms & 0xFF, (time_ms >> 8) & 0xFF,
-                  servo_id, position & 0xFF, (position >> 8) & 0xFF]
-        self.send_command(self.CMD_SERVO_MOVE, params)
+        self.move_servos([servo_id], [position], time_ms)
 
     def move_servos(self, servo_ids: List[int], positions: List[int], time_ms: int):
         # servo count and time is fixed for all
-        all_params = [len(servo_ids), time_ms & 0xFF, (time_ms >> 8) & 0xFF]
-        assert len(servo_ids) == len(positions)
-        for idx in range(0, len(servo_ids)):
-            servo_id = servo_ids[idx]
-            position = positions[idx]
-            assert servo_id in self.SERVO_LIMITS, f"{servo_id} not in {self.SERVO_LIMITS}"
-            assert self.SERVO_LIMITS[servo_id][0] <= position >= self.SERVO_LIMITS[servo_id][0], f"For servo {servo_id}, {position} is outside of {self.SERVO_LIMITS[servo_id]}"
-            all_params.append(servo_id)
-            all_params.append(position & 0xFF)
-            all_params.append((position >> 8) & 0xFF)
-        self.send_command(self.CMD_SERVO_MOVE, all_params)
+        if len(servo_ids) != len(positions):
+            raise ValueError(f"{len(servo_ids)} servo ids but {len(positions)} positions")
+        self.limits.validate(servo_ids, positions)
+        packet = encode_servo_move(servo_ids, positions, time_ms, out=self.move_buffers.get(len(servo_ids)))
+        self.move_buffers[len(servo_ids)] = packet
+        if self.transport is not None:
+            # the transport may still hold the params after this returns, so it gets its own copy
+            self.transport.send(self.CMD_SERVO_MOVE, list(packet[4:]))
+            return
+        self.write_packet(packet)
 
     def run_action_group(self, group_id: int, times: int):
         params = [group_id, times & 0xFF, (times >> 8) & 0xFF]
@@ -93,44 +178,61 @@ class LSCServoController:
         params = [group_id, speed_percent & 0xFF, (speed_percent >> 8) & 0xFF]
         self.send_command(self.CMD_ACTION_SPEED, params)
 
-    # def get_battery_voltage(self) -> int:
-    #     packet = bytearray(self.HEADER + [2, self.CMD_GET_BATTERY_VOLTAGE])
-    #     self.ser.reset_input_buffer()
-    #     self.ser.reset_output_buffer()
-    #     assert self.ser.write(packet) == len(packet)
-    #     self.ser.flush()
-    #     response = self.ser.read(4)  # Read expected response length
-    #     if len(response) != 4:
-    #         raise ValueError("Failed to get battery voltage: [%s]" % ", ".join(hex(n) for n in response))
-    #     return response[2] | (response[3] << 8)
+    def get_battery_voltage(self, timeout: float = 1.0) -> int:
+        return decode_battery_voltage(self.query(self.CMD_GET_BATTERY_VOLTAGE, [], timeout))
 
     def unload_servos(self, servo_ids: list[int]):
         params = [len(servo_ids)] + servo_ids
         self.send_command(self.CMD_MULT_SERVO_UNLOAD, params)
 
-    def read_servo_positions(self, servo_ids: list[int] = list(SERVO_LIMITS.keys())) -> dict[int, int]:
-        params = [len(servo_ids)] + servo_ids
-        packet = bytearray(self.HEADER + [len(params) + 2, self.CMD_MULT_SERVO_POS_READ] + params)
-        # self.ser.reset_input_buffer()
-        # self.ser.reset_output_buffer()
-        assert self.ser.write(packet) == len(packet)
-        self.ser.flush()
-        time.sleep(1)
-        response = self.ser.read(len(self.HEADER) + 3 + 3 * len(servo_ids))
-        if len(response) < 5:
-            raise ValueError("Invalid response: [%s]" % ", ".join(hex(n) for n in response))
-        positions = {}
-        for i in range(len(servo_ids)):
-            servo_id = response[len(self.HEADER) + 3 + i * 3]
-            position = response[len(self.HEADER) + 5 + i * 3] | (response[len(self.HEADER) + 4 + i * 3] << 8)
-            positions[servo_id] = position
-        return positions
+    def read_servo_positions(self, servo_ids: list[int] = list(SERVO_LIMITS.keys()), timeout: float = 1.0) -> dict[int, int]:
+        with telemetry.timed("serial.position_read"):
+            params = self.query(self.CMD_MULT_SERVO_POS_READ, [len(servo_ids)] + servo_ids, timeout)
+        return decode_servo_positions(params)
+
+    def query(self, command: int, params: list[int], timeout: float) -> bytes:
+        """Sends command and returns the parameters of the controller's reply to it."""
+        if self.transport is not None:
+            reply = self.transport.request(command, params)
+            try:
+                return reply.result(timeout)
+            except TimeoutError:
+                reply.cancel()
+                raise TimeoutError("No response to command %d" % command)
+        self.request(command, params)
+        return self.read_frame(command, timeout)
+
+    def request(self, command: int, params: list[int]):
+        # anything still buffered belongs to an earlier request that timed out
+        self.ser.reset_input_buffer()
+        self.parser.reset()
+        self.send_command(command, params)
+
+    def read_frame(self, command: int, timeout: float = 1.0) -> bytes:
+        """Returns the parameters of the next frame for command as soon as it has fully arrived."""
+        deadline = time.monotonic() + timeout
+        frames = self.parser.feed(b"")
+        while True:
+            for frame_command, params in frames:
+                if frame_command == command:
+                    return params
+                log.debug("Ignoring frame for command %d while waiting for %d", frame_command, command)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("No response to command %d: [%s]" % (command, ", ".join(hex(n) for n in self.parser.buffer)))
+            self.ser.timeout = remaining
+            frames = self.parser.feed(self.ser.read(self.parser.needed()))
 
     def __del__(self):
         try:
             self.unload_servos(list(self.SERVO_LIMITS.keys()))
         except Exception:
             pass
+        try:
+            if self.transport is not None:
+                self.transport.close()
+        except Exception:
+            pass
         try:
             self.ser.close()
         except Exception:
@@ -0,0 +1,104 @@
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, Deque, Hashable, Iterable, Optional, Tuple
+
+from PIL import Image
+
+from preprocess import ImageSettings, Preprocessor
+
+
+log = logging.getLogger("Montage")
+
+
+class MontageBuilder:
+    """
+    Mosaic of the latest frames, latest top-left, that only decodes frames it has not seen before.
+    settings pick the layout (a 2x2 grid or the latest frame alone) and how each frame is preprocessed.
+    """
+
+    SLOTS = 4  # the most any layout uses
+
+    def __init__(self, debug_path: Optional[str] = None, quality: int = 75, settings: Optional[ImageSettings] = None):
+        self.debug_path = debug_path
+        self.settings = settings if settings is not None else ImageSettings(quality=quality)
+        self.quality = self.settings.quality
+        self.preprocessor = Preprocessor(self.settings)
+        self.slots = self.preprocessor.slots
+        self.frames: Deque[Tuple[Hashable, Image.Image]] = deque(maxlen=self.slots)
+        self.canvas: Optional[Image.Image] = None
+        self.decoded = 0
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._last_write: Optional[Future] = None
+
+    def build(self, keys: Iterable[Hashable], load: Callable[[Hashable], bytes]) -> bytes:
+        """keys identify frames oldest to newest; load(key) is only called for frames not already decoded."""
+        keys = list(keys)[-self.slots:]
+        if not keys:
+            raise ValueError("No frames to build a montage from")
+        self._update_frames(keys, load)
+
+        images = [img for _, img in reversed(self.frames)]
+        cell_width = max(img.width for img in images)
+        cell_height = max(img.height for img in images)
+        columns, rows = self.preprocessor.columns, self.preprocessor.rows
+        canvas = self._canvas(cell_width * columns, cell_height * rows)
+        for slot in range(self.slots):
+            box = ((slot % columns) * cell_width, (slot // columns) * cell_height)
+            if slot < len(images) and images[slot].size == (cell_width, cell_height):
+                canvas.paste(images[slot], box)
+                continue
+            canvas.paste(0, box + (box[0] + cell_width, box[1] + cell_height))
+            if slot < len(images):
+                canvas.paste(images[slot], box)
+
+        output_buffer = BytesIO()
+        canvas.save(output_buffer, format="JPEG", quality=self.quality)
+        jpeg = output_buffer.getvalue()
+        if self.debug_path:
+            self._write_debug(jpeg)
+        return jpeg
+
+    def flush(self, timeout: Optional[float] = None):
+        if self._last_write is not None:
+            self._last_write.result(timeout)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+
+    def _update_frames(self, keys, load):
+        if [key for key, _ in self.frames] == keys:
+            return
+        # usually one new frame arrived and the others shift along a slot, already decoded
+        cached = dict(self.frames)
+        self.frames.clear()
+        for key in keys:
+            self.frames.append((key, cached[key] if key in cached else self._decode(load(key))))
+
+    def _decode(self, jpeg: bytes) -> Image.Image:
+        self.decoded += 1
+        return self.preprocessor.decode(jpeg)
+
+    def _canvas(self, width: int, height: int) -> Image.Image:
+        if self.canvas is None or self.canvas.size != (width, height):
+            self.canvas = Image.new(self.preprocessor.mode, (width, height))
+        return self.canvas
+
+    def _write_debug(self, jpeg: bytes):
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="MontageDebugWriter")
+        if self._last_write is not None and not self._last_write.done():
+            log.debug("Previous debug montage still being written, skipping")
+            return
+        self._last_write = self._writer.submit(self._write_file, self.debug_path, jpeg)
+
+    @staticmethod
+    def _write_file(path: str, jpeg: bytes):
+        try:
+            with open(path, "wb") as f:
+                f.write(jpeg)
+        except OSError:
+            log.exception("Failed writing debug montage to %s", path)
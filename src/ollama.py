@@ -1,5 +1,25 @@
 from typing import Dict
 
+TOOL_CALL = {
+    "type": "object",
+    "properties": {
+        "servo_id": {
+            "type": "integer",
+            "minimum": 1,
+            "maximum": 6,
+        },
+        "position": {
+            "type": "integer",
+            "minimum": 500,
+            "maximum": 2500,
+        }
+    },
+    "required": [
+        "servo_id",
+        "position"
+    ]
+}
+
 FORMAT = {
     "type": "object",
     "properties": {
@@ -7,25 +27,14 @@ FORMAT = {
             "type": "string",
         },
         "tool_calls": {
+            "type": "array",
+            "items": TOOL_CALL
+        },
+        "waypoints": {
             "type": "array",
             "items": {
-                "type": "object",
-                "properties": {
-                "servo_id": {
-                    "type": "integer",
-                    "minimum": 1,
-                    "maximum": 6,
-                },
-                "position": {
-                    "type": "integer",
-                    "minimum": 500,
-                    "maximum": 2500,
-                }
-                },
-                "required": [
-                    "servo_id",
-                    "position"
-                ]
+                "type": "array",
+                "items": TOOL_CALL
             }
         }
     }
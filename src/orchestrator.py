@@ -0,0 +1,530 @@
+"""
+Runs several workcells, each an arm, a camera and a conversation of its own, from one config, sharing one
+model through an InferenceScheduler instead of separate processes fighting over the GPU.
+
+The scheduler queues every cell's prompts and sends at most `slots` to the backend at a time, which Ollama
+runs as one batch when started with OLLAMA_NUM_PARALLEL of at least `slots`. Cells are served in weighted
+fair order, except that a prompt that would otherwise miss its cell's deadline goes first. Every request
+carries the same keep_alive and an idle scheduler refreshes it, so the model stays loaded between turns.
+
+    python src/orchestrator.py cells.json
+
+with cells.json like
+
+    {"url": "http://localhost:11434/api/chat", "model": "llama3.2-vision", "slots": 2,
+     "cells": [{"name": "left", "camera_url": "http://10.0.0.27", "serial_port": "/dev/ttyUSB0",
+                "instructions": ["Sort the blocks by colour"], "repeat": true, "weight": 1, "deadline": 120}]}
+"""
+import json
+import logging
+import sys
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from time import monotonic, sleep
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import ollama
+import prompts
+from camera import MJPEGGrabber
+from change_detector import ChangeDetector
+from context import ChatContext
+from frame_store import FrameStore
+from inference import Backend
+from montage import MontageBuilder
+from response_validator import ResponseValidator
+from telemetry import TELEMETRY
+from trajectory import TrajectoryPlanner
+from transport import warm_up
+
+
+log = logging.getLogger("Orchestrator")
+
+
+class DeadlineExceeded(TimeoutError):
+    """A cell's prompt was not answered within its deadline, the reply would be about a stale frame."""
+
+
+class _Request:
+    def __init__(self, cell: str, prompt: Dict, deadline: Optional[float], on_delta: Optional[Callable[[str], None]]):
+        self.cell = cell
+        self.prompt = prompt
+        self.deadline = deadline  # monotonic
+        self.on_delta = on_delta
+        self.submitted = monotonic()
+        self.future: Future = Future()
+        self.cancel = threading.Event()
+        self.charged = 0.0
+
+
+class _CellShare:
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.virtual = 0.0  # inference seconds received, divided by weight
+        self.requests = 0
+        self.missed = 0
+        self.busy = 0.0
+
+
+class InferenceScheduler:
+    """
+    Weighted fair queuing of chat prompts from several cells onto one backend: the cell that has received
+    the least inference time for its weight goes next, so a cell sending prompts back to back cannot starve
+    the others. A prompt whose slack, the time left before its deadline less the expected inference time,
+    is shorter than one more inference goes first (earliest deadline first), and one whose deadline passes,
+    queued or running, fails with DeadlineExceeded.
+    The model and keep_alive of every prompt are the scheduler's; other options that make Ollama load the
+    model again (e.g. num_ctx) must match across cells.
+    """
+
+    def __init__(self, backend: Backend, slots: int = 1, model: Optional[str] = None, keep_alive: int = 20 * 60,
+                 default_service: float = 10.0):
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        self.backend = backend
+        self.slots = slots
+        self.model = model or backend.model
+        self.keep_alive = keep_alive
+        self.default_service = default_service  # seconds an inference is expected to take before any is measured
+        self.cells: Dict[str, _CellShare] = {}
+        self.pending: List[_Request] = []
+        self.running: List[_Request] = []
+        self.virtual = 0.0
+        self.refreshes = 0
+        self._last_active = monotonic()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, cell: str, weight: float = 1.0):
+        if weight <= 0:
+            raise ValueError("weight must be positive")
+        with self._cond:
+            self.cells[cell] = _CellShare(weight)
+
+    def start(self) -> "InferenceScheduler":
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._closed = False
+                self._thread = threading.Thread(target=self._dispatch, name="InferenceScheduler", daemon=True)
+                self._thread.start()
+        return self
+
+    def close(self, timeout: float = 5):
+        with self._cond:
+            self._closed = True
+            for request in self.pending:
+                request.future.cancel()
+            self.pending.clear()
+            for request in self.running:
+                request.cancel.set()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, cell: str, prompt: Dict, deadline: Optional[float] = None,
+               on_delta: Optional[Callable[[str], None]] = None) -> Future:
+        """Queues prompt, the future gets the reply; deadline is in seconds from now."""
+        prompt = dict(prompt, model=self.model or prompt.get("model"), keep_alive=self.keep_alive)
+        request = _Request(cell, prompt, monotonic() + deadline if deadline is not None else None, on_delta)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The scheduler is closed")
+            share = self.cells.get(cell)
+            if share is None:
+                share = self.cells[cell] = _CellShare(1.0)
+            if not any(queued.cell == cell for queued in self.pending + self.running):
+                # a cell that was idle starts level with the others rather than with saved-up credit
+                share.virtual = max(share.virtual, self.virtual)
+            share.requests += 1
+            self.pending.append(request)
+            self._cond.notify_all()
+        return request.future
+
+    def chat(self, cell: str, prompt: Dict, deadline: Optional[float] = None,
+             on_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        return self.submit(cell, prompt, deadline, on_delta).result()
+
+    def expected(self) -> float:
+        return self.backend.latency if self.backend.latency is not None else self.default_service
+
+    def refresh(self):
+        """Loads the model, or keeps it loaded for another keep_alive seconds."""
+        if self.backend.api != "ollama":
+            return
+        warm_up(self.backend.endpoint, self.backend.url, self.model, self.keep_alive)
+        self.refreshes += 1
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._cond:
+            return {cell: {"weight": share.weight, "requests": share.requests, "missed": share.missed,
+                           "busy_s": round(share.busy, 2)}
+                    for cell, share in self.cells.items()}
+
+    def _next(self, now: float) -> Optional[_Request]:
+        if not self.pending:
+            return None
+        expected = self.expected()
+        urgent = [request for request in self.pending
+                  if request.deadline is not None and request.deadline - now - expected < expected]
+        if urgent:
+            return min(urgent, key=lambda request: request.deadline)
+        return min(self.pending, key=lambda request: (self.cells[request.cell].virtual, request.submitted))
+
+    def _expire(self, now: float) -> Optional[float]:
+        """Fails overdue requests, returns the earliest deadline still ahead."""
+        earliest = None
+        for request in list(self.pending):
+            if request.deadline is None:
+                continue
+            if request.deadline <= now:
+                self.pending.remove(request)
+                self.cells[request.cell].missed += 1
+                log.warning("%s prompt missed its deadline after %.1fs in the queue", request.cell, now - request.submitted)
+                request.future.set_exception(DeadlineExceeded(f"{request.cell} prompt was not sent in time"))
+            elif earliest is None or request.deadline < earliest:
+                earliest = request.deadline
+        for request in self.running:
+            if request.deadline is None or request.cancel.is_set():
+                continue
+            if request.deadline <= now:
+                request.cancel.set()
+            elif earliest is None or request.deadline < earliest:
+                earliest = request.deadline
+        return earliest
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                now = monotonic()
+                earliest = self._expire(now)
+                if self.pending and len(self.running) < self.slots:
+                    request = self._next(now)
+                    self.pending.remove(request)
+                    self.running.append(request)
+                    share = self.cells[request.cell]
+                    # charged what it is expected to cost now and corrected once it is known
+                    request.charged = self.expected() / share.weight
+                    share.virtual += request.charged
+                    self.virtual = max(self.virtual, share.virtual - request.charged)
+                    threading.Thread(target=self._run, args=(request,), name=f"inference-{request.cell}",
+                                     daemon=True).start()
+                    continue
+                idle = not self.pending and not self.running
+                refresh_at = self._last_active + self.keep_alive / 2
+                if idle and now >= refresh_at:
+                    self._last_active = now
+                else:
+                    timeout = min(t for t in (earliest, refresh_at if idle else None, now + 1) if t is not None) - now
+                    self._cond.wait(max(timeout, 0.001))
+                    continue
+            try:
+                self.refresh()
+            except Exception:
+                log.warning("Keeping the model loaded failed", exc_info=True)
+
+    def _run(self, request: _Request):
+        started = monotonic()
+        TELEMETRY.record("scheduler.wait", (started - request.submitted) * 1000, cell=request.cell)
+        try:
+            reply = self.backend.complete(request.prompt, request.cancel, request.on_delta)
+        except Exception as e:
+            self._finish(request, started, error=e)
+            return
+        if reply is None:
+            self._finish(request, started, error=CancelledError() if self._closed else
+                         DeadlineExceeded(f"{request.cell} reply took longer than its deadline"))
+            return
+        TELEMETRY.record("scheduler.inference", (monotonic() - started) * 1000, cell=request.cell)
+        self._finish(request, started, reply=reply)
+
+    def _finish(self, request: _Request, started: float, reply: Optional[Dict] = None,
+                error: Optional[BaseException] = None):
+        seconds = monotonic() - started
+        with self._cond:
+            self.running.remove(request)
+            share = self.cells[request.cell]
+            share.virtual += seconds / share.weight - request.charged
+            share.busy += seconds
+            self.backend.requests += 1
+            if reply is not None:
+                self.backend.observe(seconds)
+            elif isinstance(error, DeadlineExceeded):
+                share.missed += 1
+                self.backend.cancelled += 1
+            elif not isinstance(error, CancelledError):
+                self.backend.failures += 1
+            self._last_active = monotonic()
+            self._cond.notify_all()
+        if error is not None:
+            request.future.set_exception(error)
+        else:
+            request.future.set_result(reply)
+
+
+class CellConfig(NamedTuple):
+    name: str
+    camera_url: str
+    serial_port: str = "auto"
+    instructions: Tuple[str, ...] = ()  # worked through in order after the introduction
+    repeat: bool = False  # start the instructions over once they are done, e.g. for a sorting cell
+    weight: float = 1.0  # share of inference time relative to the other cells
+    deadline: float = 120.0  # seconds a prompt may take, queueing included, before it is asked again with a new frame
+    max_turns: int = 50  # per instruction
+    retries: int = 2  # unusable replies asked again in a row
+    max_missed: int = 3  # deadlines missed in a row before the instruction is given up
+    scene_unchanged: str = "stop"  # or "infer", see server.SCENE_UNCHANGED_ACTION
+
+
+class Workcell:
+    """
+    One arm, camera and conversation, taking turns the way server.loop does but asking the shared scheduler.
+    Frames, montage, chat context and change detection are the cell's own.
+    """
+
+    def __init__(self, config: CellConfig, scheduler: InferenceScheduler, arm, camera: MJPEGGrabber,
+                 model: str, camera_timeout: float = 5.0):
+        self.config = config
+        self.name = config.name
+        self.scheduler = scheduler
+        self.arm = arm
+        self.camera = camera
+        self.camera_timeout = camera_timeout
+        self.frames = FrameStore()
+        self.montage = MontageBuilder()
+        self.context = ChatContext()
+        self.change_detector = ChangeDetector()
+        self.validator = ResponseValidator(limits=getattr(arm, "SERVO_LIMITS", None))
+        self.chat = ollama.build_prompt(model)
+        self.turns = 0
+        self.missed = 0
+        self.instructions = 0
+        self.error: Optional[BaseException] = None
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        try:
+            self.work(prompts.START)
+            while not self._stop.is_set():
+                for instruction in self.config.instructions:
+                    if self._stop.is_set():
+                        return
+                    log.info("%s: %s", self.name, instruction)
+                    self.work(instruction)
+                    self.instructions += 1
+                if not self.config.repeat or not self.config.instructions:
+                    return
+        except Exception as e:
+            self.error = e
+            log.exception("%s stopped", self.name)
+
+    def work(self, user_prompt: str):
+        """Turns until the model stops sending commands, the scene stops changing or max_turns is reached."""
+        planner = TrajectoryPlanner(self.arm)
+        inferred_frame = answered_frame = None  # the frame last sent, and the last one the model answered about
+        arrival = None
+        retries = 0
+        missed = 0
+        same_image = False
+        for _ in range(self.config.max_turns):
+            if self._stop.is_set():
+                return
+            turn_started = monotonic()
+            if not same_image:
+                frame = self.capture(arrival)
+                if inferred_frame is not None and not self.scene_changed(inferred_frame, frame):
+                    return
+                inferred_frame = frame
+                self.chat["images"] = [self.montage.build(self.frames.last_indices(self.montage.slots), self.frames.get)]
+
+            messages = self.chat["messages"]
+            messages.append({"role": "user", "content": user_prompt})
+            self.context.compact(messages)
+            try:
+                response = self.scheduler.chat(self.name, self.chat, self.config.deadline)
+            except DeadlineExceeded:
+                messages.pop()  # never answered, asked again about a new frame
+                self.missed += 1
+                missed += 1
+                if missed >= self.config.max_missed:
+                    log.error("%s: giving up after %d missed deadlines in a row", self.name, missed)
+                    return
+                # the model never saw the frame, so the next one is compared with the last it did see
+                inferred_frame = answered_frame
+                same_image = False
+                continue
+            missed = 0
+            answered_frame = inferred_frame
+
+            message = response["message"]
+            checked = self.validator.parse(message["content"])
+            messages.append(message)
+            if not checked.valid:
+                retries += 1
+                if retries > self.config.retries:
+                    log.error("%s: giving up after %d unusable replies: %s", self.name, retries, checked.errors)
+                    return
+                user_prompt = self.validator.retry_prompt(checked)
+                same_image = True
+                continue
+            retries = 0
+            same_image = False
+            content = checked.content
+            if checked.repairs:
+                messages[-1] = dict(message, content=json.dumps(content))
+            log.info("%s: %s", self.name, content.get("message", ""))
+            if not content.get("tool_calls") and not content.get("waypoints"):
+                return
+            arrival = self.move(planner, content.get("tool_calls", []), content.get("waypoints", []))
+            user_prompt = prompts.CONTINUE
+            self.turns += 1
+            TELEMETRY.record("cell.turn", (monotonic() - turn_started) * 1000, cell=self.name)
+        log.warning("%s: stopping after %d turns", self.name, self.config.max_turns)
+
+    def capture(self, arrival: Optional[float] = None) -> int:
+        """Index of a frame taken after the arm arrived."""
+        if arrival is not None and arrival > monotonic():
+            sleep(arrival - monotonic())
+        latest = self.camera.latest()
+        frame = self.camera.wait_for_frame(latest.seq if latest is not None and arrival is not None else 0,
+                                           self.camera_timeout)
+        if frame is None:
+            raise RuntimeError(f"{self.name}: no frame from {self.config.camera_url}")
+        return self.frames.append(frame.jpeg)
+
+    def scene_changed(self, before: int, after: int) -> bool:
+        decision = self.change_detector.compare_keys(before, after, self.frames.get)
+        if decision.changed or self.config.scene_unchanged == "infer":
+            return True
+        log.warning("%s: scene unchanged %.4f, the last commands had no effect. Stopping", self.name, decision.score)
+        return False
+
+    def move(self, planner: TrajectoryPlanner, tool_calls: List[Dict], waypoints: List[List[Dict]]) -> Optional[float]:
+        path = []
+        for pose in [tool_calls] + list(waypoints):
+            positions = dict(command for command in map(self.validator.command, pose) if command is not None)
+            if positions:
+                path.append(positions)
+        return planner.follow(path) if path else None
+
+    def close(self):
+        self.camera.stop()
+        transport = getattr(self.arm, "transport", None)
+        if transport is not None:
+            transport.close()
+        self.montage.close()
+        self.frames.close()
+
+
+def open_arm(config: CellConfig):
+    from lsc_servo_client import LSCServoController
+
+    return LSCServoController(config.serial_port, background_io=True)
+
+
+def open_camera(config: CellConfig) -> MJPEGGrabber:
+    return MJPEGGrabber(config.camera_url).start()
+
+
+class Orchestrator:
+    """Starts every cell on its own thread and reports turns per hour, per cell and across cells."""
+
+    def __init__(self, cells: List[CellConfig], scheduler: InferenceScheduler, model: str,
+                 open_arm: Callable[[CellConfig], object] = open_arm,
+                 open_camera: Callable[[CellConfig], MJPEGGrabber] = open_camera, report_interval: float = 300):
+        if len({cell.name for cell in cells}) != len(cells):
+            raise ValueError("Cell names must be unique")
+        self.configs = cells
+        self.scheduler = scheduler
+        self.model = model
+        self.open_arm = open_arm
+        self.open_camera = open_camera
+        self.report_interval = report_interval
+        self.cells: List[Workcell] = []
+        self.started: Optional[float] = None
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, config: Dict, **kwargs) -> "Orchestrator":
+        backend = Backend("ollama", config["url"], config["model"], timeouts=tuple(config.get("timeouts", (5, 300))))
+        scheduler = InferenceScheduler(backend, config.get("slots", 1), keep_alive=config.get("keep_alive", 20 * 60))
+        cells = [CellConfig(**dict(cell, instructions=tuple(cell.get("instructions", ())))) for cell in config["cells"]]
+        return cls(cells, scheduler, config["model"], report_interval=config.get("report_interval", 300), **kwargs)
+
+    def start(self) -> "Orchestrator":
+        for config in self.configs:
+            self.scheduler.register(config.name, config.weight)
+        self.scheduler.start()
+        # every cell's devices come up at the same time, while the model loads
+        with ThreadPoolExecutor(max_workers=2 * len(self.configs) + 1, thread_name_prefix="open") as pool:
+            loading = pool.submit(self._warm_up)
+            arms = [pool.submit(self.open_arm, config) for config in self.configs]
+            cameras = [pool.submit(self.open_camera, config) for config in self.configs]
+            for config, arm, camera in zip(self.configs, arms, cameras):
+                self.cells.append(Workcell(config, self.scheduler, arm.result(), camera.result(), self.model))
+            loading.result()
+        self.started = monotonic()
+        for cell in self.cells:
+            thread = threading.Thread(target=cell.run, name=f"cell-{cell.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        threading.Thread(target=self._report, name="orchestrator-report", daemon=True).start()
+        return self
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Waits for every cell to finish its instructions, returns False on timeout."""
+        deadline = monotonic() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def stop(self):
+        self._stop.set()
+        for cell in self.cells:
+            cell.stop()
+        self.scheduler.close()
+        self.join(10)
+        log.info("Throughput: %s", self.throughput())
+        for cell in self.cells:
+            cell.close()
+        self.scheduler.backend.endpoint.close()
+
+    def throughput(self) -> Dict:
+        """Turns per hour since the cells started, per cell and in total."""
+        hours = (monotonic() - self.started) / 3600 if self.started is not None else 0
+        cells = {cell.name: round(cell.turns / hours, 1) if hours else 0.0 for cell in self.cells}
+        return {"cells": cells, "total": round(sum(cells.values()), 1),
+                "turns": sum(cell.turns for cell in self.cells), "missed": sum(cell.missed for cell in self.cells)}
+
+    def _warm_up(self):
+        try:
+            self.scheduler.refresh()
+        except Exception:
+            log.warning("The model is not answering yet, the first prompts will wait for it", exc_info=True)
+
+    def _report(self):
+        while not self._stop.wait(self.report_interval):
+            log.info("Throughput: %s Scheduler: %s", self.throughput(), self.scheduler.stats())
+
+
+def main(path: str):
+    from logs import setup_logging
+
+    setup_logging()
+    with open(path) as f:
+        orchestrator = Orchestrator.from_config(json.load(f)).start()
+    try:
+        orchestrator.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        orchestrator.stop()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,137 @@
+"""
+Worker stages for overlapping the perception, inference, speech and actuation parts of a turn.
+
+Each stage is a single thread fed by a bounded queue, so jobs on one stage run strictly in order
+while different stages run concurrently. Submitting to a full stage blocks the caller (backpressure)
+until a slot frees up or the optional timeout expires with queue.Full. Results and exceptions come
+back through concurrent.futures.Future; cancelling a pipeline cancels jobs that have not started,
+jobs already running are left to finish.
+"""
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from time import monotonic
+from typing import Callable, Dict, Optional
+
+
+log = logging.getLogger("Pipeline")
+
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.busy = 0.0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, busy: float, waited: float = 0.0):
+        with self.lock:
+            self.count += 1
+            self.busy += busy
+            self.waited += waited
+
+    def as_dict(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "count": self.count,
+                "busy_ms": round(self.busy * 1000),
+                "queued_ms": round(self.waited * 1000),
+                "mean_ms": round(self.busy * 1000 / self.count) if self.count else 0,
+            }
+
+
+class Stage:
+    def __init__(self, name: str, maxsize: int = 1, on_job: Optional[Callable[[str, float], None]] = None):
+        self.name = name
+        self.jobs: queue.Queue = queue.Queue(maxsize)
+        self.stats = StageStats()
+        self.on_job = on_job
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name=f"Stage-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Future:
+        if self.closed:
+            raise RuntimeError(f"Stage {self.name} is closed")
+        future = Future()
+        self.jobs.put((future, fn, args, kwargs, monotonic()), timeout=timeout)
+        return future
+
+    def cancel_pending(self) -> int:
+        cancelled = 0
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                return cancelled
+            if job is not None and job[0].cancel():
+                cancelled += 1
+
+    def close(self, cancel: bool = False, timeout: Optional[float] = None):
+        if self.closed:
+            return
+        self.closed = True
+        if cancel:
+            self.cancel_pending()
+        self.jobs.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            future, fn, args, kwargs, queued = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = monotonic()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                busy = monotonic() - started
+                self.stats.record(busy, started - queued)
+                if self.on_job:
+                    self.on_job(self.name, busy)
+
+
+class Pipeline:
+    """A set of named stages plus timing of work done inline on the caller's thread."""
+
+    def __init__(self, stages: Dict[str, int], on_job: Optional[Callable[[str, float], None]] = None):
+        self.started = monotonic()
+        self.on_job = on_job
+        self.stages = {name: Stage(name, maxsize, on_job) for name, maxsize in stages.items()}
+        self.inline: Dict[str, StageStats] = {}
+
+    def submit(self, stage: str, fn: Callable, *args, **kwargs) -> Future:
+        return self.stages[stage].submit(fn, *args, **kwargs)
+
+    @contextmanager
+    def timed(self, name: str):
+        started = monotonic()
+        try:
+            yield
+        finally:
+            busy = monotonic() - started
+            self.inline.setdefault(name, StageStats()).record(busy)
+            if self.on_job:
+                self.on_job(name, busy)
+
+    def timings(self) -> Dict[str, Dict[str, float]]:
+        timings = {name: stage.stats.as_dict() for name, stage in self.stages.items()}
+        timings.update({name: stats.as_dict() for name, stats in self.inline.items()})
+        return timings
+
+    def overlap(self) -> float:
+        """Busy time summed over all stages divided by wall time; above 1.0 means stages ran concurrently."""
+        wall = monotonic() - self.started
+        busy = sum(stage.stats.busy for stage in self.stages.values()) + sum(s.busy for s in self.inline.values())
+        return busy / wall if wall > 0 else 0.0
+
+    def close(self, cancel: bool = False, timeout: Optional[float] = None):
+        for stage in self.stages.values():
+            stage.close(cancel, timeout)
@@ -0,0 +1,157 @@
+"""
+Image settings that trade detail for a smaller image payload, and with it less prompt-eval time.
+
+Frames are cropped to a region of interest, optionally made grayscale and scaled so the finished
+montage fits within max_size, before the montage is JPEG encoded at the given quality.
+
+Run as a script to sweep the settings over recorded frames and compare payload size and encode time,
+and, given an Ollama URL, the prompt-eval time the model reports for each:
+    python src/preprocess.py --session session.jsonl [--ollama http://127.0.0.1:11434/api/chat]
+    python src/preprocess.py --frames some/dir/of/jpegs
+"""
+import argparse
+import base64
+import itertools
+import logging
+import os
+import time
+from io import BytesIO
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+
+log = logging.getLogger("Preprocess")
+
+LAYOUTS = {"grid": 4, "latest": 1}  # frames per montage
+
+
+class ImageSettings(NamedTuple):
+    layout: str = "grid"
+    # left, top, right, bottom as fractions of the frame, e.g. (0.2, 0.1, 0.9, 1.0) around the workspace
+    roi: Optional[Tuple[float, float, float, float]] = None
+    max_size: Optional[Tuple[int, int]] = None  # of the finished montage, None keeps the frames' resolution
+    grayscale: bool = False
+    quality: int = 75
+
+
+class Preprocessor:
+    def __init__(self, settings: ImageSettings = ImageSettings()):
+        if settings.layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout {settings.layout}, expected one of {list(LAYOUTS)}")
+        self.settings = settings
+        self.slots = LAYOUTS[settings.layout]
+        self.columns = 2 if self.slots > 1 else 1
+        self.rows = (self.slots + self.columns - 1) // self.columns
+        self.mode = "L" if settings.grayscale else "RGB"
+        if settings.max_size is not None:
+            self.cell = (settings.max_size[0] // self.columns, settings.max_size[1] // self.rows)
+
+    def decode(self, jpeg: bytes) -> Image.Image:
+        image = Image.open(BytesIO(jpeg))
+        if self.settings.max_size is not None and self.settings.roi is None:
+            # the JPEG decoder can skip straight to a power of two scale no smaller than the cell
+            image.draft(self.mode, self.cell)
+        return self.frame(image)
+
+    def frame(self, image: Image.Image) -> Image.Image:
+        """Crops, converts and scales one decoded frame, ready to be pasted into a montage cell."""
+        roi = self.settings.roi
+        if roi is not None:
+            width, height = image.size
+            image = image.crop((round(roi[0] * width), round(roi[1] * height),
+                                round(roi[2] * width), round(roi[3] * height)))
+        image = image.convert(self.mode)
+        if self.settings.max_size is not None:
+            scale = min(self.cell[0] / image.width, self.cell[1] / image.height)
+            if scale < 1:
+                image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                     Image.BILINEAR)
+        return image
+
+
+class CalibrationResult(NamedTuple):
+    settings: ImageSettings
+    payload_bytes: int  # base64, as sent to Ollama
+    encode_ms: float
+    prompt_eval_ms: Optional[float]
+
+
+def sweep(layouts: Iterable[str] = LAYOUTS, rois: Iterable = (None,),
+          max_sizes: Iterable = (None, (640, 480), (448, 336), (320, 240)),
+          grayscale: Iterable[bool] = (False, True), qualities: Iterable[int] = (50, 75, 90)) -> List[ImageSettings]:
+    return [ImageSettings(*values) for values in itertools.product(layouts, rois, max_sizes, grayscale, qualities)]
+
+
+def calibrate(frames: List[bytes], candidates: List[ImageSettings], ollama_url: Optional[str] = None,
+              model: Optional[str] = None) -> List[CalibrationResult]:
+    """Builds a montage of the frames with each candidate setting, smallest payload first."""
+    from montage import MontageBuilder
+
+    results = []
+    for settings in candidates:
+        builder = MontageBuilder(settings=settings)
+        keys = range(max(0, len(frames) - builder.slots), len(frames))
+        started = time.perf_counter()
+        montage = base64.b64encode(builder.build(keys, frames.__getitem__))
+        encode_ms = (time.perf_counter() - started) * 1000
+        prompt_eval_ms = _prompt_eval_ms(ollama_url, model, montage.decode("ascii")) if ollama_url else None
+        results.append(CalibrationResult(settings, len(montage), encode_ms, prompt_eval_ms))
+    results.sort(key=lambda result: result.payload_bytes)
+    return results
+
+
+def _prompt_eval_ms(url: str, model: str, image: str) -> float:
+    import requests
+    import ollama
+    import prompts
+
+    body = ollama.build_prompt(model)
+    body["messages"].append({"role": "user", "content": prompts.START})
+    body["images"] = [image]
+    body["options"]["num_predict"] = 1  # only the prompt evaluation is of interest
+    response = requests.post(url, json=body, timeout=300)
+    response.raise_for_status()
+    return response.json().get("prompt_eval_duration", 0) / 1000000
+
+
+def load_frames(session: Optional[str] = None, directory: Optional[str] = None) -> List[bytes]:
+    if session:
+        from session_recorder import load_session
+        return load_session(session).frames
+    frames = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".jpg", ".jpeg")):
+            with open(os.path.join(directory, name), "rb") as f:
+                frames.append(f.read())
+    return frames
+
+
+def main(argv: Optional[List[str]] = None) -> List[CalibrationResult]:
+    parser = argparse.ArgumentParser(description="Compare image settings by payload size and encode time")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--session", help="session recorded with server.SESSION_RECORD_PATH")
+    source.add_argument("--frames", help="directory of JPEG frames, in name order")
+    parser.add_argument("--ollama", help="chat URL to also measure prompt-eval time, e.g. a local Ollama or stub")
+    parser.add_argument("--model", default="llama3.2-vision")
+    parser.add_argument("--roi", type=float, nargs=4, metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"),
+                        help="also try this region of interest, as fractions of the frame")
+    args = parser.parse_args(argv)
+
+    frames = load_frames(args.session, args.frames)
+    if not frames:
+        parser.error("No frames found")
+    rois = (None, tuple(args.roi)) if args.roi else (None,)
+    results = calibrate(frames, sweep(rois=rois), args.ollama, args.model)
+    print(f"{'layout':7} {'roi':24} {'max_size':10} {'gray':5} {'q':>3} {'payload':>9} {'encode':>8} {'prompt_eval':>11}")
+    for result in results:
+        s = result.settings
+        size = "x".join(map(str, s.max_size)) if s.max_size else "full"
+        prompt_eval = f"{result.prompt_eval_ms:.0f}ms" if result.prompt_eval_ms is not None else "-"
+        print(f"{s.layout:7} {str(s.roi):24} {size:10} {str(s.grayscale):5} {s.quality:>3} "
+              f"{result.payload_bytes:>9,} {result.encode_ms:>6.1f}ms {prompt_eval:>11}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
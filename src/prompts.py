@@ -11,11 +11,15 @@ Responses must be strictly formatted as JSON, structure as follows:
       "servo_id": 1,          // A number between 1 and 6 indicating the servo to move. 1 is the pincer.
       "position": 1500,       // A number between 500 and 2500 representing the target position, except servo 1 which is limited to the range 1200 to 1800.
     }
+  ],
+  "waypoints": [              // Optional further poses, each a list like tool_calls, visited in order after tool_calls.
+    [{"servo_id": 2, "position": 1400}]
   ]
 }
 Guidelines:
-- Each reponse creates a single arm movement, of 1 or more servos
-- Both the "message" and "tool_calls" keys are optional
+- Each reponse creates a single arm movement, of 1 or more servos, optionally continuing through the waypoints
+- The "message", "tool_calls" and "waypoints" keys are optional
+- Use waypoints to follow a path in one response instead of waiting for a new image after every small move
 - If you include tool_calls, each tool_call object must have the fields servo_id & position
 - You can include zero, one, or multiple tool_call objects in the tool_calls array
 - Use the "message" field to summarise your actions and help rememeber what you have done.
@@ -26,4 +30,10 @@ You should move the arm around to see which direction the servos move.
 Ready? Please confirm that you can see the robot arm in the image, and move the arm.
 """
 
-CONTINUE = "Here's the latest image from the webcam. Please continue..."
\ No newline at end of file
+CONTINUE = "Here's the latest image from the webcam. Please continue..."
+
+DIGEST = "Summary of earlier turns that were dropped to save space:\n"
+
+RETRY = """Your last reply could not be used:
+{errors}
+Please reply again, for the same image, with only the JSON object described at the start."""
@@ -0,0 +1,54 @@
+"""
+Streams an Ollama /api/chat body without building it in memory.
+
+Images stay raw JPEG bytes in the chat dict until the body is written: the rest of the dict is serialised
+once, then each image is base64-encoded a chunk at a time straight into the outgoing stream. The length is
+known up front, so requests sends a Content-Length rather than a chunked body.
+"""
+import base64
+import json
+from typing import Dict, Iterator, List, Union
+
+
+CHUNK_SIZE = 48 * 1024  # raw bytes per piece, a multiple of 3 so the pieces' base64 joins up without padding
+
+
+def encoded_length(size: int) -> int:
+    return (size + 2) // 3 * 4
+
+
+class ChatRequest:
+    """Iterable JSON body for requests.post(data=...); images may be raw bytes or already base64 strings."""
+
+    def __init__(self, prompt: Dict, chunk_size: int = CHUNK_SIZE):
+        if chunk_size % 3:
+            raise ValueError("chunk_size must be a multiple of 3")
+        self.images: List[Union[bytes, str]] = list(prompt.get("images") or [])
+        rest = {key: value for key, value in prompt.items() if key != "images"}
+        head = json.dumps(rest).encode()
+        # reopen the object to append the images array
+        self.head = head[:-1] + (b', "images": [' if rest else b'"images": [')
+        self.chunk_size = chunk_size
+
+    def __len__(self) -> int:
+        size = len(self.head) + 2  # ]}
+        for i, image in enumerate(self.images):
+            size += 2 + (encoded_length(len(image)) if isinstance(image, (bytes, bytearray, memoryview)) else len(image))
+            size += 2 if i else 0  # ", "
+        return size
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self.head
+        for i, image in enumerate(self.images):
+            yield b', "' if i else b'"'
+            if isinstance(image, str):
+                yield image.encode("ascii")
+            else:
+                view = memoryview(image)
+                for start in range(0, len(view), self.chunk_size):
+                    yield base64.b64encode(view[start:start + self.chunk_size])
+            yield b'"'
+        yield b"]}"
+
+    def headers(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json", "Content-Length": str(len(self))}
@@ -0,0 +1,143 @@
+"""
+Persistent cache of model replies for scenes the arm has already been in.
+
+An entry is found by the normalised instruction and prompt (a follow-up prompt such as "continue" means
+something else under each instruction) and the servo pose rounded to pose_quantum, then the closest
+entry by perceptual hash of the montage wins if it is similar enough (confidence = share of matching
+hash bits). Entries expire after ttl seconds and the least recently used ones are evicted past
+max_entries. Only replies that carry commands are stored, a reply that ends the turn sequence is
+always asked for again.
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from change_detector import hamming_distance
+
+
+log = logging.getLogger("ResponseCache")
+
+HASH_BITS = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replies (
+    id INTEGER PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    pose TEXT NOT NULL,
+    image_hash INTEGER NOT NULL,
+    reply TEXT NOT NULL,
+    latency REAL NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS replies_lookup ON replies (prompt, pose);
+CREATE INDEX IF NOT EXISTS replies_used ON replies (used);
+"""
+
+
+class CacheKey(NamedTuple):
+    prompt: str
+    pose: str
+    image_hash: int
+
+
+class CacheHit(NamedTuple):
+    reply: Dict
+    confidence: float
+    latency: float  # seconds the original request took
+
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt).strip().lower()
+
+
+def quantize_pose(pose: Dict[int, int], quantum: int) -> str:
+    return ",".join(f"{servo_id}:{round(position / quantum)}" for servo_id, position in sorted(pose.items()))
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64 bit
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def _unsigned(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+class ResponseCache:
+    def __init__(self, path: str, confidence: float = 0.95, ttl: float = 7 * 24 * 3600, max_entries: int = 10000,
+                 pose_quantum: int = 50):
+        self.path = path
+        self.confidence = confidence
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.pose_quantum = pose_quantum
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lookups = 0
+        self.hits = 0
+        self.saved = 0.0
+
+    def key(self, prompt: str, image_hash: int, pose: Dict[int, int], instruction: str = "") -> CacheKey:
+        text = normalize_prompt(prompt)
+        if instruction:
+            text = f"{normalize_prompt(instruction)}\n{text}"
+        return CacheKey(text, quantize_pose(pose, self.pose_quantum), image_hash)
+
+    def get(self, key: CacheKey) -> Optional[CacheHit]:
+        now = time.time()
+        with self.lock:
+            self.lookups += 1
+            rows = self.db.execute(
+                "SELECT id, image_hash, reply, latency FROM replies WHERE prompt = ? AND pose = ? AND created > ?",
+                (key.prompt, key.pose, now - self.ttl)).fetchall()
+            best = None
+            for row_id, image_hash, reply, latency in rows:
+                confidence = 1 - hamming_distance(_unsigned(image_hash), key.image_hash) / HASH_BITS
+                if best is None or confidence > best[1]:
+                    best = (row_id, confidence, reply, latency)
+            if best is None or best[1] < self.confidence:
+                log.debug("Miss for %s, best confidence %s", key.pose, best and round(best[1], 3))
+                return None
+            row_id, confidence, reply, latency = best
+            self.db.execute("UPDATE replies SET used = ?, hits = hits + 1 WHERE id = ?", (now, row_id))
+            self.db.commit()
+            self.hits += 1
+            self.saved += latency
+        return CacheHit(json.loads(reply), confidence, latency)
+
+    def put(self, key: CacheKey, reply: Dict, latency: float):
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO replies (prompt, pose, image_hash, reply, latency, created, used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key.prompt, key.pose, _signed(key.image_hash), json.dumps(reply), latency, now, now))
+            self._evict(now)
+            self.db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM replies").fetchone()[0]
+            return {
+                "entries": entries,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "saved_s": round(self.saved, 1),
+            }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _evict(self, now: float):
+        self.db.execute("DELETE FROM replies WHERE created <= ?", (now - self.ttl,))
+        self.db.execute(
+            "DELETE FROM replies WHERE id IN (SELECT id FROM replies ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
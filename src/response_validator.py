@@ -0,0 +1,223 @@
+"""
+Checks model replies against ollama.FORMAT before they reach the arm, repairing what can be repaired.
+
+The schema is compiled once into nested checks, so a reply is validated without walking the schema;
+the schema is only walked to describe what is wrong with a reply that failed.
+Common slips are repaired and noted: code fences or prose around the JSON, trailing commas, a single
+tool call not wrapped in a list, numbers sent as strings or floats, and positions beyond a servo's limits
+(clamped). A reply that is still invalid gives a retry prompt listing what was wrong, so the model can
+correct itself in the next turn instead of the session ending.
+"""
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import ollama
+import prompts
+
+
+log = logging.getLogger("ResponseValidator")
+
+Check = Callable[[Any], bool]
+
+TYPES = {"object": dict, "array": list, "string": str, "integer": int, "number": (int, float), "boolean": bool}
+
+FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+_decoder = json.JSONDecoder()
+
+
+def _type_check(kind: str) -> Optional[Check]:
+    expected = TYPES.get(kind)
+    if expected is None:
+        return None
+    if kind == "boolean":
+        return lambda value: value is True or value is False
+    if kind in ("integer", "number"):
+        return lambda value: isinstance(value, expected) and not isinstance(value, bool)
+    return lambda value: isinstance(value, expected)
+
+
+def compile_schema(schema: Dict) -> Check:
+    """
+    A predicate for values matching schema, for the subset of JSON schema FORMAT uses. Everything
+    that can be looked up in the schema is looked up once here, the predicate only tests the value.
+    """
+    type_ok = _type_check(schema.get("type"))
+    ranged = "minimum" in schema or "maximum" in schema
+    low, high = schema.get("minimum", float("-inf")), schema.get("maximum", float("inf"))
+    required = tuple(schema.get("required", ()))
+    properties = tuple((key, compile_schema(value)) for key, value in schema.get("properties", {}).items())
+    items = compile_schema(schema["items"]) if "items" in schema else None
+    is_object = schema.get("type") == "object"
+    is_array = schema.get("type") == "array"
+
+    def check(value) -> bool:
+        if type_ok is not None and not type_ok(value):
+            return False
+        if ranged and not low <= value <= high:
+            return False
+        if is_object or (type_ok is None and isinstance(value, dict)):
+            for key in required:
+                if key not in value:
+                    return False
+            for key, check_property in properties:
+                if key in value and not check_property(value[key]):
+                    return False
+        elif items is not None and (is_array or isinstance(value, list)):
+            for item in value:
+                if not items(item):
+                    return False
+        return True
+    return check
+
+
+def schema_errors(value: Any, schema: Dict, path: str = "reply") -> List[str]:
+    """What is wrong with value, walking schema; only needed once the compiled check has failed."""
+    kind = schema.get("type")
+    type_ok = _type_check(kind)
+    if type_ok is not None and not type_ok(value):
+        return [f"{path} must be {'an' if kind[0] in 'aeiou' else 'a'} {kind}"]
+    errors = []
+    if ("minimum" in schema or "maximum" in schema) and \
+            not schema.get("minimum", float("-inf")) <= value <= schema.get("maximum", float("inf")):
+        errors.append(f"{path} must be between {schema.get('minimum')} and {schema.get('maximum')}, not {value}")
+    if isinstance(value, dict):
+        errors += [f"{path}.{key} is missing" for key in schema.get("required", ()) if key not in value]
+        for key, item in value.items():
+            if key in schema.get("properties", {}):
+                errors += schema_errors(item, schema["properties"][key], f"{path}.{key}")
+    elif isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors += schema_errors(item, schema["items"], f"{path}[{i}]")
+    return errors
+
+
+class Validation(NamedTuple):
+    content: Optional[Dict]  # the repaired reply, None if it could not be parsed
+    errors: Tuple[str, ...]
+    repairs: Tuple[str, ...]
+
+    @property
+    def valid(self) -> bool:
+        return self.content is not None and not self.errors
+
+
+def schema_limits(schema: Dict) -> Dict[int, Tuple[int, int]]:
+    # the tool call's own ranges, for when no per-servo limits are given
+    properties = schema["properties"]["tool_calls"]["items"]["properties"]
+    servo, position = properties["servo_id"], properties["position"]
+    return {servo_id: (position["minimum"], position["maximum"])
+            for servo_id in range(servo["minimum"], servo["maximum"] + 1)}
+
+
+class ResponseValidator:
+    def __init__(self, schema: Dict = ollama.FORMAT, limits: Optional[Dict[int, Sequence[int]]] = None):
+        self.schema = schema
+        self.check = compile_schema(schema)
+        limits = limits if limits is not None else schema_limits(schema)
+        self.limits = {servo_id: (low, high) for servo_id, (low, high) in limits.items()}
+
+    def parse(self, content: str) -> Validation:
+        repairs: List[str] = []
+        value = self.decode(content, repairs)
+        if value is None:
+            return Validation(None, ("the reply is not a JSON object",), tuple(repairs))
+        if not isinstance(value, dict):
+            return Validation(None, ("the reply must be a JSON object",), tuple(repairs))
+        self.repair(value, repairs)
+        errors = () if self.check(value) else tuple(schema_errors(value, self.schema))
+        if repairs:
+            log.info("Repaired reply: %s", "; ".join(repairs))
+        return Validation(value, errors, tuple(repairs))
+
+    def decode(self, content: str, repairs: List[str]) -> Any:
+        try:
+            return json.loads(content)
+        except ValueError:
+            pass
+        text = content
+        fenced = FENCE.search(text)
+        if fenced:
+            text = fenced.group(1)
+            repairs.append("removed code fence")
+        start = text.find("{")
+        if start < 0:
+            return None
+        for attempt in (text, TRAILING_COMMA.sub(r"\1", text)):
+            try:
+                value, end = _decoder.raw_decode(attempt, start)
+            except ValueError:
+                continue
+            if attempt is not text:
+                repairs.append("removed trailing commas")
+            if not fenced and (start or attempt[end:].strip()):
+                repairs.append("removed text around the JSON")
+            return value
+        return None
+
+    def repair(self, reply: Dict, repairs: List[str]):
+        tool_calls = reply.get("tool_calls")
+        if isinstance(tool_calls, dict):
+            reply["tool_calls"] = [tool_calls]
+            repairs.append("wrapped tool_calls in a list")
+        for key in ("tool_calls", "waypoints"):
+            if reply.get(key) is None and key in reply:
+                del reply[key]
+                repairs.append(f"dropped null {key}")
+        waypoints = reply.get("waypoints")
+        poses = [reply.get("tool_calls")] + (waypoints if isinstance(waypoints, list) else [])
+        for pose in poses:
+            if not isinstance(pose, list):
+                continue
+            for tool_call in pose:
+                if isinstance(tool_call, dict):
+                    self.repair_tool_call(tool_call, repairs)
+
+    def repair_tool_call(self, tool_call: Dict, repairs: List[str]):
+        for field in ("servo_id", "position"):
+            value = tool_call.get(field)
+            number = as_int(value)
+            if number is not None and number is not value:
+                tool_call[field] = number
+                repairs.append(f"{field} {value!r} read as {number}")
+        servo_id, position = tool_call.get("servo_id"), tool_call.get("position")
+        if type(servo_id) is int and type(position) is int and servo_id in self.limits:
+            low, high = self.limits[servo_id]
+            clamped = min(max(position, low), high)
+            if clamped != position:
+                tool_call["position"] = clamped
+                repairs.append(f"servo {servo_id} position {position} clamped to {clamped}")
+
+    def command(self, tool_call: Dict) -> Optional[Tuple[int, int]]:
+        """servo_id and position of a single tool call, repaired, or None if it cannot be used."""
+        if not isinstance(tool_call, dict):
+            return None
+        tool_call = dict(tool_call)
+        repairs: List[str] = []
+        self.repair_tool_call(tool_call, repairs)
+        servo_id, position = tool_call.get("servo_id"), tool_call.get("position")
+        if type(servo_id) is not int or type(position) is not int or servo_id not in self.limits:
+            return None
+        return servo_id, position
+
+    @staticmethod
+    def retry_prompt(validation: Validation) -> str:
+        return prompts.RETRY.format(errors="\n".join(f"- {error}" for error in validation.errors))
+
+
+def as_int(value: Any) -> Optional[int]:
+    """value as an int if it is a whole number, including as a float or a numeric string."""
+    if type(value) is int:
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            number = float(value.strip())
+        except ValueError:
+            return None
+        return int(number) if number.is_integer() else None
+    return None
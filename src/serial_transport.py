@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, InvalidStateError
+from typing import Deque, Dict, List, Optional
+
+import telemetry
+from lsc_codec import encode_packet
+from lsc_servo_client import FrameParser, LSCServoController
+
+
+log = logging.getLogger("SerialTransport")
+
+
+def _forward_error(written: Future, reply: Future):
+    if written.exception() is not None and not reply.done():
+        reply.set_exception(written.exception())
+
+
+class _Outbound:
+    def __init__(self, command: int, params: List[int]):
+        self.command = command
+        self.params = params
+        self.futures: List[Future] = []
+
+
+def merge_moves(older: List[int], newer: List[int]) -> Optional[List[int]]:
+    """
+    Combines two CMD_SERVO_MOVE parameter lists into one, or None if they should stay separate.
+    They merge when the newer one moves every servo of the older one, or when both use the same time.
+    """
+    def servos(params):
+        return {params[i]: (params[i + 1], params[i + 2]) for i in range(3, 3 + 3 * params[0], 3)}
+
+    old_servos, new_servos = servos(older), servos(newer)
+    if not (old_servos.keys() <= new_servos.keys() or older[1:3] == newer[1:3]):
+        return None
+    merged = dict(old_servos)
+    merged.update(new_servos)
+    params = [len(merged)] + newer[1:3]
+    for servo_id, (low, high) in merged.items():
+        params += [servo_id, low, high]
+    return params
+
+
+class SerialTransport:
+    """
+    Owns a serial port on a single thread. Writes go through an outbound queue where successive
+    servo moves are coalesced, and incoming frames are routed by command byte to waiting futures.
+    A frame arriving within late_window seconds of a request for its command being cancelled is taken
+    to be that request's late reply and dropped, rather than handed to the next request.
+    """
+
+    def __init__(self, ser, poll_interval: float = 0.01, late_window: float = 0.5):
+        self.ser = ser
+        self.poll_interval = poll_interval
+        self.late_window = late_window
+        self.outbound: Deque[_Outbound] = deque()
+        self.waiters: Dict[int, Deque[Future]] = defaultdict(deque)
+        self.late: Dict[int, Deque[float]] = defaultdict(deque)  # until when a cancelled request's reply is expected
+        self.parser = FrameParser()
+        self.coalesced = 0
+        self.written = 0
+        self._writing = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="SerialTransport", daemon=True)
+        self._thread.start()
+
+    def send(self, command: int, params: List[int]) -> Future:
+        """Queues a packet, the future completes once it has been written."""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Serial transport is closed")
+            tail = self.outbound[-1] if self.outbound else None
+            merged = None
+            if tail is not None and command == tail.command == LSCServoController.CMD_SERVO_MOVE:
+                merged = merge_moves(tail.params, params)
+            if merged is not None:
+                tail.params = merged
+                tail.futures.append(future)
+                self.coalesced += 1
+            else:
+                packet = _Outbound(command, list(params))
+                packet.futures.append(future)
+                self.outbound.append(packet)
+            self._cond.notify_all()
+        return future
+
+    def request(self, command: int, params: List[int], response_command: Optional[int] = None) -> Future:
+        """Sends a packet and returns a future for the parameters of the matching reply frame."""
+        reply = Future()
+        key = command if response_command is None else response_command
+        with self._cond:
+            self.waiters[key].append(reply)
+        reply.add_done_callback(lambda f: self._cancelled(key) if f.cancelled() else None)
+        written = self.send(command, params)
+        written.add_done_callback(lambda f: _forward_error(f, reply))
+        return reply
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Waits until everything queued has been written."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self.outbound and not self._writing, timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def restart(self):
+        """Starts a new I/O thread if the last one died; queued packets and waiting replies carry over."""
+        with self._cond:
+            if self._closed or self._thread.is_alive():
+                return
+            self._writing = False
+            self._thread = threading.Thread(target=self._run, name="SerialTransport", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: Optional[float] = 5):
+        self.drain(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _pending_replies(self) -> bool:
+        # callers cancel the futures of requests they gave up on
+        for waiters in self.waiters.values():
+            while waiters and waiters[0].done():
+                waiters.popleft()
+        return any(self.waiters.values())
+
+    def _cancelled(self, command: int):
+        with self._cond:
+            self.late[command].append(time.monotonic() + self.late_window)
+
+    def _late_reply(self, command: int) -> bool:
+        late = self.late.get(command)
+        now = time.monotonic()
+        while late and late[0] < now:
+            late.popleft()
+        if late:
+            late.popleft()
+            return True
+        return False
+
+    def _run(self):
+        self.ser.timeout = self.poll_interval
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self.outbound or self._pending_replies())
+                if self._closed:
+                    break
+                packet = self.outbound.popleft() if self.outbound else None
+                self._writing = packet is not None
+            if packet is not None:
+                self._write(packet)
+            with self._cond:
+                reading = self._pending_replies()
+            if reading:
+                self._read()
+
+        for waiters in self.waiters.values():
+            for future in waiters:
+                future.cancel()
+
+    def _write(self, packet: _Outbound):
+        data = encode_packet(packet.command, packet.params)
+        try:
+            with telemetry.timed("serial.write"):
+                bytes_written = self.ser.write(data)
+                if bytes_written != len(data):
+                    raise IOError(f"{bytes_written} != {len(data)}")
+                self.ser.flush()
+            self.written += 1
+            for future in packet.futures:
+                future.set_result(None)
+        except Exception as e:
+            log.exception("Failed writing command %d", packet.command)
+            for future in packet.futures:
+                future.set_exception(e)
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+    def _read(self):
+        try:
+            data = self.ser.read(max(1, self.ser.in_waiting))
+        except Exception:
+            log.exception("Failed reading from serial port")
+            return
+        for command, params in self.parser.feed(data):
+            with self._cond:
+                self._pending_replies()
+                late = self._late_reply(command)
+                waiters = self.waiters.get(command)
+                future = waiters.popleft() if waiters and not late else None
+            if late:
+                log.debug("Dropping a late reply for cancelled command %d: %s", command, params.hex())
+            elif future is None:
+                log.debug("Unexpected frame for command %d: %s", command, params.hex())
+            else:
+                try:
+                    future.set_result(params)
+                except InvalidStateError:
+                    pass
@@ -1,136 +1,573 @@
 import logging
 import os
 import requests
-import base64
-from time import sleep
+from time import sleep, monotonic
 import json
-from io import BytesIO
-from PIL import Image
-import pyttsx3
-import speech_recognition as sr
+import signal
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 
 # locals
 import ollama
 import prompts
-from logs import setup_logging
+from camera import MJPEGGrabber
+from context import ChatContext
+from frame_store import FrameStore
+from montage import MontageBuilder
+from preprocess import ImageSettings
+from stream_parser import ToolCallStreamParser
+from request_builder import ChatRequest
+from transport import Endpoint, StreamError, warm_up
+from inference import Backend, InferenceRouter
+from pipeline import Pipeline
+from speech import NullEngine, SpeechWorker
+from trajectory import TrajectoryPlanner
+from telemetry import TELEMETRY
+from session_recorder import SessionRecorder
+from change_detector import ChangeDetector, perceptual_hash
+from response_cache import ResponseCache
+from response_validator import ResponseValidator
+from vision import SceneAnalyzer, SceneFacts, answer, simple_query
+from supervisor import Checkpoint, Checkpointer, Supervisor
 from lsc_servo_client import LSCServoController
 
 
-setup_logging()
 log = logging.getLogger("RobotArm")
 log.setLevel(logging.DEBUG)
 
 
-WEBCAM_URL = "http://10.0.0.27"
-OLLAMA_URL = "http://10.0.0.205:11434/api/chat"
+# All can be overridden from the environment, e.g. to point at local stubs
+WEBCAM_URL = os.environ.get("ROBOT_WEBCAM_URL", "http://10.0.0.27")
+OLLAMA_URL = os.environ.get("ROBOT_OLLAMA_URL", "http://10.0.0.205:11434/api/chat")
+# "auto" picks the controller's USB serial adapter
+SERIAL_PORT = os.environ.get("ROBOT_SERIAL_PORT", "auto")
 # OLLAMA_URL = "http://127.0.0.1:11434/api/chat"
 
+# Separate connect and read timeouts in seconds, failed requests are retried with jittered backoff
+CAMERA_TIMEOUTS = (3.05, 5)
+OLLAMA_TIMEOUTS = (5, 300)
+
 # Model must support vision, thus LLAVA
 LLAVA_MODEL = "llama3.2-vision"
 
+# More backends to race against OLLAMA_URL, the first reply matching ollama.FORMAT is used and the rest dropped.
+# Each is Ollama or OpenAI-compatible, e.g. a smaller model or an online chatbot:
+# {"name": "small", "url": "http://10.0.0.205:11434/api/chat", "model": "llava-phi3"}
+# {"name": "online", "url": "https://api.openai.com/v1/chat/completions", "model": "gpt-4o-mini", "api": "openai",
+#  "api_key": os.environ.get("OPENAI_API_KEY")}
+INFERENCE_BACKENDS: List[Dict] = []
+# How many backends each prompt is sent to, the ones that have been answering fastest first.
+# Tool calls are only streamed while a prompt goes to a single backend
+INFERENCE_FANOUT = 2
+
+# Last montage sent to the model is written here for debugging, set to None to disable
+MONTAGE_DEBUG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image.jpg")
+
+# How frames become the image the model sees: layout "grid" (latest 4, 2x2) or "latest", a crop to the arm's
+# workspace, a size cap for the whole montage, grayscale and JPEG quality. Smaller images evaluate faster,
+# compare settings with: python src/preprocess.py --session <recorded session>
+IMAGE_SETTINGS = ImageSettings(layout="grid", roi=None, max_size=(1024, 768), grayscale=False, quality=75)
+
+# Stream replies and move the arm as soon as each tool_call is complete, rather than waiting for the whole reply
+STREAM_RESPONSES = True
+
+# Servo speed limits in position units per second (and per second squared), move times follow from the distance
+SERVO_MAX_VELOCITY = 1000
+SERVO_MAX_ACCELERATION = 2000
+
+# Unusable replies are sent back with what was wrong, this many times in a row before the instruction is given up
+RESPONSE_RETRIES = 2
+
+# Worker stages and their queue sizes, submitting to a full queue blocks until there is room
+PIPELINE_STAGES = {"perception": 1, "actuation": 8}
+
+# Older turns are folded into a digest once the chat history passes this many (approximate) tokens
+CONTEXT_MAX_TOKENS = 4096
+
+# Frames kept in memory, older ones are dropped or spilled to FRAME_SPILL_PATH for replay
+FRAME_HISTORY_CAPACITY = 16
+FRAME_SPILL_PATH = None  # e.g. os.path.join(os.path.dirname(os.path.abspath(__file__)), "frames.seg")
+
+# Frames older than this are treated as stale and re-fetched directly
+CAMERA_MAX_FRAME_AGE = 2.0
+
+# Share of the (downscaled) frame that must differ from the one the model last saw for a turn to count as progress
+SCENE_CHANGE_THRESHOLD = 0.001
+# What to do when the arm was told to move but the scene did not change:
+# "stop" ends the turn sequence without asking the model again, "infer" asks anyway (only logs the decision)
+SCENE_UNCHANGED_ACTION = "stop"
+
+# Replies that moved the arm are cached here and reused for the same prompt, a similar montage and the same pose,
+# set to None to always ask the model
+RESPONSE_CACHE_PATH = None  # e.g. os.path.join(os.path.dirname(os.path.abspath(__file__)), "responses.sqlite")
+# Share of the montage's perceptual hash bits that must match for a cached reply to be reused
+RESPONSE_CACHE_CONFIDENCE = 0.95
+RESPONSE_CACHE_TTL = 7 * 24 * 3600
+RESPONSE_CACHE_MAX_ENTRIES = 10000
+# Servo positions are rounded to this many units before they become part of the key
+RESPONSE_CACHE_POSE_QUANTUM = 50
+
+# Every latency sample is appended here as JSON lines (rotated at 5MB), set to None to disable
+TELEMETRY_PATH = None  # e.g. os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetry.jsonl")
+# p50/p95/p99 per stage are written here on exit and on SIGUSR1, and logged either way
+TELEMETRY_SUMMARY_PATH = None
+
+# Camera frames and Ollama replies are recorded here for offline replay, set to None to disable
+SESSION_RECORD_PATH = None  # e.g. os.path.join(os.path.dirname(os.path.abspath(__file__)), "session.jsonl")
+
+# Crashed sessions are resumed in place with the devices and model kept warm, and dead worker threads restarted.
+# False lets a crash end run() as before
+SUPERVISED = True
+# Resuming is given up after this many crashes within SESSION_RESTART_WINDOW seconds
+SESSION_MAX_RESTARTS = 5
+SESSION_RESTART_WINDOW = 600
+# Seconds a restart, including bringing dead workers back, is expected to take
+RESTART_BUDGET = 5.0
+
+# Chat history, the current instruction, frame position and arm pose are written here (atomically) after each
+# instruction and at most every CHECKPOINT_INTERVAL seconds during one, so a restart, even of the whole process,
+# resumes where it left off. Set to None to keep the checkpoint in memory only
+CHECKPOINT_PATH = None  # e.g. os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoint.json")
+CHECKPOINT_INTERVAL = 30
+
+# Offline speech-to-text: "vosk" (a model directory, see https://alphacephei.com/vosk/models) or any of
+# speech_recognition's recognize_<name> engines, e.g. "sphinx", "whisper" or "faster_whisper"
+SPEECH_RECOGNIZER = "vosk"
+SPEECH_RECOGNIZER_OPTIONS = {"model_path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "model")}
+# The microphone's noise floor is measured once and kept here, then only re-measured when the room gets
+# noticeably louder or quieter. Set to None to measure it on every start
+NOISE_CALIBRATION_PATH = None  # e.g. os.path.join(os.path.dirname(os.path.abspath(__file__)), "noise.json")
+# Seconds to wait for a spoken instruction before asking again
+LISTEN_TIMEOUT = 60
+
+# What local colour segmentation finds in each frame (coloured objects, whether the pincers hold something) is added
+# to the prompt as text, and questions it can answer ("how many red bricks are there?") are answered without the model
+VISION_FACTS = True
+VISION_ANSWERS = True
+# Where the pincers are in the camera's view, as left, top, right, bottom fractions of the frame, e.g. (0.4, 0.6, 0.6, 0.8).
+# None leaves gripper occupancy to the model
+PINCER_REGION = None
+
+# No text-to-speech and no microphone (neither is even imported): replies are only logged and instructions are read
+# from standard input, one per line, until it ends. Set ROBOT_HEADLESS=1
+HEADLESS = os.environ.get("ROBOT_HEADLESS", "") not in ("", "0")
+# Seconds start-up waits for the first frame from the camera stream, the first turn fetches one directly without it
+CAMERA_PROBE_TIMEOUT = 5
+# Seconds to wait for the servo controller to answer after the port is opened before using it anyway
+SERIAL_READY_TIMEOUT = 2
+
+# Ollama's reply timings, in nanoseconds
+OLLAMA_DURATIONS = ["total_duration", "load_duration", "prompt_eval_duration", "eval_duration"]
+
+
+def run(headless: bool = HEADLESS):
+    ollama_chat = ollama.build_prompt(LLAVA_MODEL)
+    if TELEMETRY_PATH:
+        TELEMETRY.open(TELEMETRY_PATH)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: TELEMETRY.dump(TELEMETRY_SUMMARY_PATH))
+    started = monotonic()
+    log.debug("Opening camera stream...")
+    camera = MJPEGGrabber(WEBCAM_URL).start()
+    speech = listener = None
+    supervisor = Supervisor(CHECKPOINTER, SESSION_MAX_RESTARTS, SESSION_RESTART_WINDOW, RESTART_BUDGET)
 
-def run():
-    ollama_chat = {}
+    try:
+        resuming = CHECKPOINTER.latest() is not None
+        backends = ROUTER.backends if ROUTER is not None else [Backend("ollama", OLLAMA_URL, LLAVA_MODEL, endpoint=OLLAMA)]
+        # the devices come up together while the model loads, so start-up takes as long as the slowest of them
+        with ThreadPoolExecutor(max_workers=4 + len(backends), thread_name_prefix="start") as pool:
+            warming = [pool.submit(warm_up_backend, backend, ollama_chat["keep_alive"])
+                       for backend in backends if backend.api == "ollama"]
+            opening = pool.submit(LSCServoController, SERIAL_PORT, background_io=True,
+                                  ready_timeout=SERIAL_READY_TIMEOUT)
+            probing = pool.submit(camera.wait_for_frame, 0, CAMERA_PROBE_TIMEOUT)
+            if not headless:
+                voice = pool.submit(open_speech)
+                # started right away so the noise floor is measured while everything else boots
+                hearing = pool.submit(open_listener, lambda: speech is not None and speech.busy)
+            speech = voice.result() if not headless else SpeechWorker(NullEngine)
+            speech.say_async("Robot Overlord resuming." if resuming else "Robot Overlord beginning boot sequence.")
+            listener = hearing.result() if not headless else None
+            if probing.result() is None:
+                log.warning("No frame from the camera stream yet, the first one is fetched directly")
+            arm = opening.result()
+            for warm in warming:
+                warm.result()
+        TELEMETRY.record("startup", (monotonic() - started) * 1000)
+        log.info("TIMING: Started in %.2fs%s", monotonic() - started, " (headless)" if headless else "")
+
+        supervisor.watch("camera", camera.is_alive, camera.start)
+        supervisor.watch("speech", speech.is_alive, speech.restart)
+        supervisor.watch("serial", arm.transport.is_alive, arm.transport.restart)
+        if listener is not None:
+            supervisor.watch("listener", listener.is_alive, listener.start)
+        supervisor.start()
+
+        # only what is said once the robot has asked, not talk in the room while the arm was working
+        next_instruction = read_instruction if headless else lambda: listener.get(LISTEN_TIMEOUT, since=monotonic())
+
+        def resume(checkpoint: Optional[Checkpoint]):
+            session(arm, speech, camera, ollama_chat, next_instruction, checkpoint)
+
+        if SUPERVISED:
+            supervisor.run(resume)
+        else:
+            resume(CHECKPOINTER.latest())
+
+    finally:
+        supervisor.stop()
+        if listener is not None:
+            listener.stop()
+        ollama_chat["images"] = ["deleted"]
+        log.info("ollama_chat log", extra={"data": ollama_chat})
+        if speech is not None:
+            speech.close()
+        camera.stop()
+        MONTAGE.close()
+        FRAME_HISTORY.close()
+        CAMERA.close()
+        OLLAMA.close()
+        if ROUTER is not None:
+            ROUTER.close()
+        TELEMETRY.dump(TELEMETRY_SUMMARY_PATH)
+        TELEMETRY.close()
+        if RECORDER is not None:
+            RECORDER.close()
+        if RESPONSE_CACHE is not None:
+            RESPONSE_CACHE.close()
+
+def open_speech() -> SpeechWorker:
     log.debug("Initializing Text-to-speech engine...")
-    tts_engine = pyttsx3.init()
+
+    def engine():
+        # imported here so headless runs never load the audio stack
+        import pyttsx3
+
+        return pyttsx3.init()
+
+    return SpeechWorker(engine)
+
+def open_listener(muted: Callable[[], bool]):
     log.debug("Initializing Speech-to-text engine...")
-    recognizer = sr.Recognizer()
-
-    with sr.Microphone() as source:
-        try:
-            tts_engine.say("Robot Overlord beginning boot sequence.")
-            tts_engine.runAndWait()
-
-            log.debug("Initializing arm...")
-            arm = LSCServoController()
-
-            ollama_chat = ollama.build_prompt(LLAVA_MODEL)
-            user_prompt = prompts.START
-
-            # main loop
-            while True:
-                if user_prompt:
-                    loop(arm, tts_engine, ollama_chat, user_prompt)
-                tts_engine.say("What would you like me to do?")
-                tts_engine.runAndWait()
-                user_prompt = listen(source, recognizer)
-
-        finally:
-            ollama_chat["images"] = ["deleted"]
-            log.info("ollama_chat log", extra={"data": ollama_chat})
-            tts_engine.stop()
-    
-def loop(arm, tts_engine, ollama_chat: Dict, user_prompt: str):
+    import speech_recognition as sr
+    from listener import Listener, make_backend
+
+    return Listener(sr.Microphone(), make_backend(SPEECH_RECOGNIZER, **SPEECH_RECOGNIZER_OPTIONS),
+                    NOISE_CALIBRATION_PATH, muted=muted).start()
+
+def warm_up_backend(backend: Backend, keep_alive: int):
+    try:
+        warm_up(backend.endpoint, backend.url, backend.model, keep_alive)
+    except requests.exceptions.RequestException:
+        log.warning("%s is not answering yet, the first prompt will wait for it", backend.name, exc_info=True)
+
+def read_instruction() -> Optional[str]:
+    """The next line of standard input, for headless runs; the run ends with the input."""
+    print("What would you like me to do? ", end="", flush=True)
+    line = sys.stdin.readline()
+    if not line:
+        raise SystemExit(0)
+    return line.strip() or None
+
+def session(arm, speech: SpeechWorker, camera: Optional[MJPEGGrabber], ollama_chat: Dict,
+            next_instruction: Callable[[], Optional[str]], checkpoint: Optional[Checkpoint] = None):
+    """Works through instructions as they come, starting with the introduction or the checkpoint's instruction."""
+    pose = None
+    if checkpoint is None:
+        instruction = user_prompt = prompts.START
+    else:
+        restore_checkpoint(ollama_chat, checkpoint)
+        # the instruction is already in the history, the model is only asked to carry on with it
+        instruction = checkpoint.instruction
+        user_prompt = prompts.CONTINUE if instruction else None
+        # the last commanded pose, so the first move after a restart is planned from where the arm is
+        pose = checkpoint.pose
     while True:
-        # generate image
-        IMAGE_HISTORY.append(fetch_image_from_url(WEBCAM_URL))
-        ollama_chat["images"] = [build_image_montage()]
-
-        # send prompt
-        ollama_chat["messages"].append({"role":"user","content":user_prompt})
-        response = chat(OLLAMA_URL, ollama_chat)
-        log.debug("ollama response", extra={"data": response})
-        log.info("TIMING: Prompt:%sms, Load:%sms, Eval:%sms", response["prompt_eval_duration"]/1000000, response["load_duration"]/1000000, response["eval_duration"]/1000000)
-
-        # parse response
-        message = response["message"]
-        ollama_chat["messages"].append(message)
-        content = json.loads(message["content"])
-
-        # display and speak response
-        log.warning("\tROBOT: %s", content["message"])
-        if content["message"]:
-            tts_engine.say(content["message"])
-            tts_engine.runAndWait()
-
-        # validation
-        if "tool_calls" not in content or len(content["tool_calls"]) == 0:
-            log.info("No more commands. Exiting")
-            return
-
-        # command robot arm
-        tool_calls = content["tool_calls"]
-        log.warning("\tCommands:")
-        for tool_call in tool_calls:
-            log.warning("\t\t%s", tool_call)
-        send_commands_to_arm(arm, tool_calls)
-
-        # since chatbot hasn't stopped sending commands, keep prompting for more
-        user_prompt = prompts.CONTINUE
-
-# base64 encoded
-IMAGE_HISTORY: List[str] = []
-
-def build_image_montage() -> str:
-    images = [Image.open(BytesIO(base64.b64decode(img))) for img in IMAGE_HISTORY[-4:]]
-    images.reverse()
-
-    widths, heights = zip(*(img.size for img in images))
-    new_width, new_height = max(widths) * 2, max(heights) * 2
-
-    image = Image.new("RGB", (new_width, new_height))
-    image.paste(images[0], (0, 0))
-    if len(images) > 1:
-        image.paste(images[1], (max(widths), 0))
-    if len(images) > 2:
-        image.paste(images[2], (0, max(heights)))
-    if len(images) > 3:
-        image.paste(images[3], (max(widths), max(heights)))
-
-    output_buffer = BytesIO()
-    image.save(output_buffer, format="JPEG")
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    image.save(os.path.join(current_dir, "image.jpg"))
-    return base64.b64encode(output_buffer.getvalue()).decode('utf-8')
-
-def fetch_image_from_url(url: str) -> str:
-    with requests.get(url, stream=True, timeout=5) as response:
+        reply = answer_locally(user_prompt, camera) if user_prompt and VISION_ANSWERS else None
+        if reply is not None:
+            # kept in the history so the model knows what was already asked and answered
+            ollama_chat["messages"] += [{"role": "user", "content": user_prompt},
+                                        {"role": "assistant", "content": json.dumps({"message": reply, "tool_calls": []})}]
+            log.warning("\tROBOT (local vision): %s", reply)
+            speech.say_async(reply)
+        elif user_prompt:
+            try:
+                loop(arm, speech, ollama_chat, user_prompt, camera, instruction=instruction, pose=pose)
+            except requests.exceptions.RequestException:
+                # retries are exhausted, the circuit is open or the reply broke off, wait for the next instruction
+                log.exception("Giving up on this instruction")
+                speech.say_async("I lost my connection, please try again.")
+            speech.flush()  # let the final reply finish rather than be superseded
+        save_checkpoint(ollama_chat, None, force=True)
+        speech.say_async("What would you like me to do?")
+        speech.flush()  # don't listen to ourselves
+        instruction = user_prompt = next_instruction()
+        pose = None
+
+def save_checkpoint(ollama_chat: Dict, instruction: Optional[str], pose: Optional[Dict[int, int]] = None,
+                    force: bool = False):
+    CHECKPOINTER.save(Checkpoint(instruction, ollama_chat["messages"], CONTEXT.digest, len(FRAME_HISTORY),
+                                 dict(pose or {})), force)
+
+def restore_checkpoint(ollama_chat: Dict, checkpoint: Checkpoint):
+    messages = list(checkpoint.messages)
+    # a prompt that never got its reply is sent again when the session resumes
+    while messages and messages[-1].get("role") == "user":
+        messages.pop()
+    ollama_chat["messages"] = messages
+    CONTEXT.digest = checkpoint.digest
+    if len(FRAME_HISTORY) < checkpoint.frame_index:
+        log.warning("Frame history restarts at %d, the checkpoint was taken after frame %d",
+                    len(FRAME_HISTORY), checkpoint.frame_index)
+    log.info("Resuming with %d messages, instruction %.60r", len(messages), checkpoint.instruction)
+
+def loop(arm, speech: SpeechWorker, ollama_chat: Dict, user_prompt: str, camera: Optional[MJPEGGrabber] = None,
+         instruction: Optional[str] = None, pose: Optional[Dict[int, int]] = None):
+    """
+    Turns until the model stops sending commands. instruction (default user_prompt) is what gets checkpointed,
+    pose is where the arm is known to be, otherwise it is read back when needed.
+    """
+    instruction = instruction or user_prompt
+    pipeline = Pipeline(PIPELINE_STAGES, on_job=TELEMETRY.on_job)
+    planner = TrajectoryPlanner(arm, SERVO_MAX_VELOCITY, SERVO_MAX_ACCELERATION)
+    planner.pose.update(pose or {})
+    cancel = True
+    try:
+        # the first frame is captured straight away, later ones once the arm has settled
+        images = pipeline.submit("perception", prepare_images, camera)
+        inferred_frame = None
+        retries = 0
+        same_image = False  # a retry without moves is asked about the image the model already has
+        while True:
+            turn_started = monotonic()
+            if not same_image:
+                ollama_chat["images"] = [images.result()]
+                frame = FRAME_HISTORY.last_indices(1)[-1]
+                if inferred_frame is not None and not scene_changed(inferred_frame, frame):
+                    cancel = False
+                    record_turn(turn_started)
+                    return
+                inferred_frame = frame
+
+            # send prompt
+            ollama_chat["messages"].append({"role":"user","content":user_prompt})
+            CONTEXT.compact(ollama_chat["messages"])
+            moves = []
+            started = monotonic()
+
+            def on_tool_call(tool_call: Dict):
+                if VALIDATOR.command(tool_call) is None:
+                    return  # the reply as a whole fails validation and is asked for again
+                if not moves:
+                    TELEMETRY.record("first_move", (monotonic() - started) * 1000)
+                    log.info("TIMING: First servo command:%sms", round((monotonic() - started) * 1000))
+                moves.append(pipeline.submit("actuation", send_commands_to_arm, planner, [tool_call]))
+
+            cache_key = response_cache_key(planner, instruction, user_prompt, ollama_chat["images"][0])
+            cached = RESPONSE_CACHE.get(cache_key) if cache_key else None
+            if cached is not None:
+                log.info("Reusing cached reply, confidence %.3f, saved %.1fs", cached.confidence, cached.latency)
+                TELEMETRY.record("response_cache.saved", cached.latency * 1000)
+                response = cached.reply
+            else:
+                inference_started = monotonic()
+                with pipeline.timed("inference"):
+                    response = infer(with_scene_facts(ollama_chat), on_tool_call if STREAM_RESPONSES else None)
+                log.info("TIMING: Prompt:%sms, Load:%sms, Eval:%sms", response["prompt_eval_duration"]/1000000, response["load_duration"]/1000000, response["eval_duration"]/1000000)
+                record_ollama_timings(response)
+            log.debug("ollama response", extra={"data": response})
+
+            # parse response, repairing what can be repaired
+            message = response["message"]
+            checked = VALIDATOR.parse(message["content"])
+            if not checked.valid:
+                ollama_chat["messages"].append(message)
+                retries += 1
+                if retries > RESPONSE_RETRIES:
+                    log.error("Giving up after %d unusable replies: %s", retries, checked.errors)
+                    speech.say_async("I could not make sense of my own replies, please try again.")
+                    cancel = False
+                    record_turn(turn_started)
+                    return
+                log.warning("Unusable reply, asking again: %s", checked.errors)
+                user_prompt = VALIDATOR.retry_prompt(checked)
+                same_image = not moves
+                if moves:
+                    # streamed moves went out before the reply broke, look again once they are done
+                    images = pipeline.submit("perception", prepare_images, camera, moves)
+                record_turn(turn_started)
+                continue
+            retries = 0
+            same_image = False
+            content = checked.content
+            # the history keeps the repaired reply, so the model sees the format it should use
+            ollama_chat["messages"].append(dict(message, content=json.dumps(content)) if checked.repairs else message)
+
+            # display and speak response, without holding up the arm
+            log.warning("\tROBOT: %s", content.get("message", ""))
+            speech.say_async(content.get("message", ""))
+
+            # validation
+            if not content.get("tool_calls") and not content.get("waypoints"):
+                log.info("No more commands. Exiting")
+                if moves:
+                    log.warning("Streamed commands were not part of the final reply")
+                cancel = False
+                record_turn(turn_started)
+                return
+
+            if cache_key and cached is None:
+                RESPONSE_CACHE.put(cache_key, response, monotonic() - inference_started)
+
+            # command robot arm
+            tool_calls = content.get("tool_calls", [])
+            waypoints = content.get("waypoints", [])
+            log.warning("\tCommands:")
+            for tool_call in tool_calls:
+                log.warning("\t\t%s", tool_call)
+            for waypoint in waypoints:
+                log.warning("\t\tthen %s", waypoint)
+            # anything already sent while streaming is not sent again
+            moves.append(pipeline.submit("actuation", send_commands_to_arm, planner, tool_calls[len(moves):], waypoints))
+
+            # positions are read back while the next frame is captured
+            images = pipeline.submit("perception", prepare_images, camera, moves)
+            pipeline.submit("actuation", log_servo_positions, planner)
+
+            # since chatbot hasn't stopped sending commands, keep prompting for more
+            user_prompt = prompts.CONTINUE
+            save_checkpoint(ollama_chat, instruction, planner.pose)
+            record_turn(turn_started)
+    finally:
+        # on success let queued speech and moves finish, on error drop whatever has not started
+        pipeline.close(cancel=cancel)
+        log.info("TIMING: Stages:%s Overlap:%.2f", pipeline.timings(), pipeline.overlap())
+        if RESPONSE_CACHE is not None:
+            log.info("Response cache: %s", RESPONSE_CACHE.stats())
+        if ROUTER is not None:
+            log.info("Inference backends: %s", ROUTER.stats())
+
+# raw JPEG bytes
+FRAME_HISTORY = FrameStore(capacity=FRAME_HISTORY_CAPACITY, spill_path=FRAME_SPILL_PATH)
+MONTAGE = MontageBuilder(debug_path=MONTAGE_DEBUG_PATH, settings=IMAGE_SETTINGS)
+CONTEXT = ChatContext(max_tokens=CONTEXT_MAX_TOKENS)
+RECORDER = SessionRecorder(SESSION_RECORD_PATH) if SESSION_RECORD_PATH else None
+CHANGE_DETECTOR = ChangeDetector(SCENE_CHANGE_THRESHOLD)
+VISION = SceneAnalyzer(pincer_region=PINCER_REGION)
+VALIDATOR = ResponseValidator(limits=LSCServoController.SERVO_LIMITS)
+# without a path the checkpoint is only kept in memory, which is enough to resume within the process
+CHECKPOINTER = Checkpointer(CHECKPOINT_PATH, CHECKPOINT_INTERVAL)
+CAMERA = Endpoint("camera", *CAMERA_TIMEOUTS)
+OLLAMA = Endpoint("ollama", *OLLAMA_TIMEOUTS)
+RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_PATH, RESPONSE_CACHE_CONFIDENCE, RESPONSE_CACHE_TTL,
+                               RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_POSE_QUANTUM) if RESPONSE_CACHE_PATH else None
+# only set up when there is more than the one Ollama to choose from
+ROUTER = InferenceRouter([Backend("ollama", OLLAMA_URL, LLAVA_MODEL, endpoint=OLLAMA)] +
+                         [Backend(**backend) for backend in INFERENCE_BACKENDS],
+                         INFERENCE_FANOUT) if INFERENCE_BACKENDS else None
+
+def response_cache_key(planner: TrajectoryPlanner, instruction: str, prompt: str, montage: bytes):
+    if RESPONSE_CACHE is None:
+        return None
+    if not planner.pose:
+        planner.refresh_pose()
+    return RESPONSE_CACHE.key(prompt, perceptual_hash(montage), planner.pose, instruction)
+
+def scene_changed(before: int, after: int) -> bool:
+    """Whether the frame the model is about to see differs enough from the one it last saw to be worth a request."""
+    decision = CHANGE_DETECTOR.compare_keys(before, after, FRAME_HISTORY.get)
+    if decision.changed:
+        log.info("Scene changed %.4f (threshold %.4f)", decision.score, CHANGE_DETECTOR.threshold)
+        return True
+    if SCENE_UNCHANGED_ACTION == "infer":
+        log.info("Scene unchanged %.4f (threshold %.4f), asking the model anyway", decision.score, CHANGE_DETECTOR.threshold)
+        return True
+    log.warning("Scene unchanged %.4f (threshold %.4f), the last commands had no effect. Stopping", decision.score, CHANGE_DETECTOR.threshold)
+    return False
+
+def record_turn(started: float):
+    # a turn runs from waiting for its images to handing the moves to the actuation stage
+    seconds = monotonic() - started
+    TELEMETRY.record("turn", seconds * 1000)
+    if RECORDER is not None:
+        RECORDER.turn(seconds)
+
+def build_image_montage() -> bytes:
+    with TELEMETRY.timed("montage"):
+        montage = MONTAGE.build(FRAME_HISTORY.last_indices(MONTAGE.slots), FRAME_HISTORY.get)
+    # kept as JPEG bytes, ChatRequest base64-encodes it while the request is sent
+    return montage
+
+def prepare_images(camera: Optional[MJPEGGrabber], moves: List[Future] = ()) -> bytes:
+    # wait for the arm to stop moving so the frame shows where it ended up
+    arrival = max([move.result() or 0 for move in moves], default=0)
+    if arrival > monotonic():
+        sleep(arrival - monotonic())
+    with TELEMETRY.timed("camera.fetch"):
+        jpeg = capture_image(camera)
+    FRAME_HISTORY.append(jpeg)
+    if RECORDER is not None:
+        RECORDER.frame(jpeg)
+    if VISION_FACTS:
+        analyse_frame(jpeg)
+    return build_image_montage()
+
+def analyse_frame(jpeg: bytes) -> Optional[SceneFacts]:
+    try:
+        with TELEMETRY.timed("vision"):
+            return VISION.analyse(jpeg)
+    except (OSError, ValueError):
+        # the model still gets the image, only without the facts
+        log.warning("Local vision could not read the frame", exc_info=True)
+        VISION.last = None
+        return None
+
+def with_scene_facts(ollama_chat: Dict) -> Dict:
+    """The prompt with the latest frame's scene facts added to the last message, leaving the history as it was."""
+    if not VISION_FACTS or VISION.last is None or not ollama_chat["messages"]:
+        return ollama_chat
+    messages = list(ollama_chat["messages"])
+    messages[-1] = dict(messages[-1], content=f"{messages[-1]['content']}\n{VISION.last.describe()}")
+    return dict(ollama_chat, messages=messages)
+
+def answer_locally(question: str, camera: Optional[MJPEGGrabber]) -> Optional[str]:
+    """The answer to a question local vision can settle from a fresh frame, None to ask the model."""
+    query = simple_query(question, VISION.colors)
+    if query is None:
+        return None
+    try:
+        with TELEMETRY.timed("camera.fetch"):
+            jpeg = capture_image(camera)
+    except requests.exceptions.RequestException:
+        log.warning("No frame for local vision, asking the model", exc_info=True)
+        return None
+    FRAME_HISTORY.append(jpeg)
+    if RECORDER is not None:
+        RECORDER.frame(jpeg)
+    facts = analyse_frame(jpeg)
+    reply = answer(query, facts) if facts is not None else None
+    if reply is None:
+        log.info("Local vision cannot answer %.60r, asking the model", question)
+    return reply
+
+def capture_image(camera: Optional[MJPEGGrabber]) -> bytes:
+    frame = camera.latest(max_age=CAMERA_MAX_FRAME_AGE) if camera else None
+    if frame is None:
+        log.debug("No live camera frame, fetching directly")
+        return fetch_image_from_url(WEBCAM_URL)
+    return frame.jpeg
+
+def fetch_image_from_url(url: str) -> bytes:
+    # fallback for when the persistent MJPEG stream is unavailable
+    with CAMERA.get(url, stream=True) as response:
         response.raise_for_status()
 
-        buffer = b""
+        buffer = bytearray()
         content_started = False
+        end = -1
 
         for chunk in response.iter_content(chunk_size=1024):
             if not content_started:
@@ -140,62 +577,116 @@ def fetch_image_from_url(url: str) -> str:
                 else:
                     continue  # Skip until headers are gone
 
+            scan_from = max(0, len(buffer) - 1)  # marker may straddle two chunks
             buffer += chunk
-            if b"\xff\xd9" in buffer:  # JPEG end marker
+            end = buffer.find(b"\xff\xd9", scan_from)  # JPEG end marker
+            if end >= 0:
                 break
 
-    image_data = buffer[:buffer.index(b"\xff\xd9") + 2]
-    return base64.b64encode(image_data).decode('utf-8')
+    if end < 0:
+        raise ValueError("No complete JPEG frame received from %s" % url)
+    return bytes(buffer[:end + 2])
 
 
-def chat(url: str, prompt: Dict) -> Dict:
+def infer(prompt: Dict, on_tool_call: Optional[Callable[[Dict], None]] = None) -> Dict:
+    if ROUTER is None:
+        return chat(OLLAMA_URL, prompt, on_tool_call)
+    sent = monotonic()
+    reply = ROUTER.chat(prompt, on_tool_call)
+    if RECORDER is not None:
+        RECORDER.reply([(monotonic() - sent, reply)])
+    return reply
+
+def chat(url: str, prompt: Dict, on_tool_call: Optional[Callable[[Dict], None]] = None) -> Dict:
     try:
-        response = requests.post(url, json=prompt, timeout=300)
+        if on_tool_call is not None:
+            return chat_stream(url, prompt, on_tool_call)
+        sent = monotonic()
+        body = ChatRequest(prompt)
+        response = OLLAMA.post(url, data=body, headers=body.headers())
         response.raise_for_status()
-        return response.json()
+        reply = response.json()
+        if RECORDER is not None:
+            RECORDER.reply([(monotonic() - sent, reply)])
+        return reply
     except requests.exceptions.RequestException as e:
         log.exception("Exception getting camera image")
         if isinstance(e, requests.exceptions.HTTPError):
             log.debug("Request Headers:", e.response.request.headers)
-            log.debug("Request Body:", e.response.request.body[0:100])
+            log.debug("Request Body:", e.response.request.body.head[0:100])  # a ChatRequest
             log.debug("Response Headers:", e.response.headers)
             log.debug("Response Body:", e.response.text[0:100])
         raise 
 
-def send_commands_to_arm(arm: LSCServoController, commands: List[Dict]):
-    servo_ids = []
-    positions = []
-
-    for cmd in commands:
-        assert 1 <= cmd["servo_id"] <= 6, cmd["servo_id"]
-        assert 500 <= cmd["position"] <= 2500, cmd["position"]
-        assert cmd["servo_id"] != 1 or 1200 <= cmd["position"] <= 1800, cmd["position"]
-        servo_ids.append(cmd["servo_id"])
-        positions.append(cmd["position"])
-    arm.move_servos(servo_ids, positions, 2000)
+def chat_stream(url: str, prompt: Dict, on_tool_call: Callable[[Dict], None]) -> Dict:
+    # Ollama streams NDJSON chunks, each carrying a slice of message.content; the last one has done=true and the timings
+    parser = ToolCallStreamParser()
+    content = []
+    final = {}
+    recorded = []
+    sent = monotonic()
+    body = ChatRequest(dict(prompt, stream=True))
+    with OLLAMA.post(url, data=body, headers=body.headers(), stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if RECORDER is not None:
+                recorded.append((monotonic() - sent, chunk))
+            if "error" in chunk:
+                raise StreamError("Ollama error: %s" % chunk["error"])
+            delta = chunk.get("message", {}).get("content", "")
+            content.append(delta)
+            for tool_call in parser.feed(delta):
+                on_tool_call(tool_call)
+            if chunk.get("done"):
+                final = chunk
+                break
+    if recorded:
+        RECORDER.reply(recorded)
+    if not final:
+        raise StreamError("Ollama stream ended before completion")
+    final["message"] = {"role": "assistant", "content": "".join(content)}
+    return final
+
+def record_ollama_timings(response: Dict):
+    for field in OLLAMA_DURATIONS:
+        if field in response:
+            TELEMETRY.record(f"ollama.{field}", response[field] / 1000000,
+                             prompt_tokens=response.get("prompt_eval_count", 0), eval_tokens=response.get("eval_count", 0))
+
+def send_commands_to_arm(planner: TrajectoryPlanner, commands: List[Dict], waypoints: List[List[Dict]] = ()) -> Optional[float]:
+    """Moves through commands then each waypoint, returns the monotonic time the arm is expected to arrive, or None if nothing moved."""
+    path = []
+    for pose in [commands] + list(waypoints):
+        positions = {}
+        for cmd in pose:
+            # streamed tool calls arrive before the reply as a whole is checked
+            command = VALIDATOR.command(cmd)
+            if command is None:
+                log.warning("Skipping unusable command %s", cmd)
+                continue
+            servo_id, position = command
+            positions[servo_id] = position
+        if positions:
+            path.append(positions)
+    if not path:
+        return None
+    return planner.follow(path)
+
+def log_servo_positions(planner: TrajectoryPlanner):
     try:
-        log.info("servo positions:", arm.read_servo_positions())
+        positions = planner.arm.read_servo_positions()
+        planner.observe(positions)
+        log.info("servo positions: %s", positions)
     except Exception as e:
         log.debug("Error getting servo positions")
 
-def listen(source, recognizer) -> str:
-    # return "Pick up the die"
-    """Capture speech and convert it to text."""
-    recognizer.adjust_for_ambient_noise(source)  # Adjust to background noise
-    try:
-        log.debug("Listening...")
-        audio = recognizer.listen(source, timeout=10)  # Listen for 5 seconds
-        text = recognizer.recognize_google(audio)  # Convert speech to text
-        log.warning("Heard: %s", text)
-        return text
-    except sr.UnknownValueError:
-        log.warning("I didn't understand.", exc_info=True)
-        return None
-    except sr.RequestError:
-        log.exception("Speech recognition service unavailable.")
-        raise
-
 if __name__ == "__main__":
+    from logs import setup_logging
+
+    setup_logging()
     run()
 
 
@@ -0,0 +1,72 @@
+"""
+Records what a live session saw from the outside world, so it can be replayed offline.
+
+A session file is JSON lines, one event per line:
+    {"type": "frame", "at": ..., "jpeg": <base64>}                 a camera frame the loop used
+    {"type": "reply", "at": ..., "chunks": [[after, chunk], ...]}   an Ollama reply, each chunk with the
+                                                                    seconds after the request it arrived
+    {"type": "turn", "at": ..., "seconds": ...}                     wall time of one loop turn
+"""
+import base64
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+
+log = logging.getLogger("SessionRecorder")
+
+
+class Session(NamedTuple):
+    frames: List[bytes]
+    replies: List[List[Tuple[float, Dict]]]
+    turns: List[float]
+
+
+class SessionRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "a")
+        self.lock = threading.Lock()
+
+    def frame(self, jpeg: bytes):
+        self._write({"type": "frame", "jpeg": base64.b64encode(jpeg).decode("ascii")})
+
+    def reply(self, chunks: List[Tuple[float, Dict]]):
+        self._write({"type": "reply", "chunks": [[round(after, 4), chunk] for after, chunk in chunks]})
+
+    def turn(self, seconds: float):
+        self._write({"type": "turn", "seconds": round(seconds, 4)})
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+    def _write(self, event: Dict):
+        event["at"] = round(time.time(), 3)
+        line = json.dumps(event) + "\n"
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line)
+            self.file.flush()
+
+
+def load_session(path: str) -> Session:
+    session = Session([], [], [])
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if event["type"] == "frame":
+                session.frames.append(base64.b64decode(event["jpeg"]))
+            elif event["type"] == "reply":
+                session.replies.append([(after, chunk) for after, chunk in event["chunks"]])
+            elif event["type"] == "turn":
+                session.turns.append(event["seconds"])
+            else:
+                log.debug("Skipping unknown event %s", event["type"])
+    return session
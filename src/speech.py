@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional
+
+import telemetry
+
+
+log = logging.getLogger("Speech")
+
+
+class NullEngine:
+    """Stand-in for a pyttsx3 engine that speaks silently, for headless runs and tests."""
+
+    def __init__(self, seconds_per_word: float = 0):
+        self.seconds_per_word = seconds_per_word
+        self.spoken: List[str] = []
+        self.interrupted: List[str] = []
+        self._queue: List[str] = []
+        self._callbacks = {}
+        self._stop = False
+
+    def connect(self, topic: str, callback: Callable):
+        self._callbacks.setdefault(topic, []).append(callback)
+
+    def say(self, text: str, name: Optional[str] = None):
+        self._queue.append(text)
+
+    def runAndWait(self):
+        self._stop = False
+        queue, self._queue = self._queue, []
+        for text in queue:
+            location = 0
+            for word in text.split():
+                for callback in self._callbacks.get("started-word", []):
+                    callback(None, location, len(word))
+                if self._stop:
+                    self.interrupted.append(text)
+                    return
+                time.sleep(self.seconds_per_word)
+                location += len(word) + 1
+            self.spoken.append(text)
+
+    def stop(self):
+        self._stop = True
+
+
+class SpeechWorker:
+    """
+    Owns the text-to-speech engine on its own thread so callers never block on audio.
+    Only the newest max_pending utterances wait to be spoken, older ones are stale and dropped;
+    say_async(..., interrupt=True) also cuts off whatever is being said.
+    """
+
+    def __init__(self, engine_factory: Callable[[], Any] = NullEngine, max_pending: int = 1):
+        self.max_pending = max_pending
+        self.pending: Deque[str] = deque()
+        self.speaking: Optional[str] = None
+        self.dropped = 0
+        self.engine = None
+        self._interrupt = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._ready = threading.Event()
+        self._engine_factory = engine_factory
+        self._thread = threading.Thread(target=self._run, args=(engine_factory,), name="SpeechWorker", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    @property
+    def busy(self) -> bool:
+        """Whether anything is being said or waiting to be, e.g. so a microphone does not pick it up."""
+        with self._cond:
+            return self.speaking is not None or bool(self.pending)
+
+    def restart(self):
+        """Starts a new speech thread, with a new engine, if the last one died; pending speech is kept."""
+        with self._cond:
+            if self._closed or self._thread.is_alive():
+                return
+            self.speaking = None
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, args=(self._engine_factory,), name="SpeechWorker",
+                                            daemon=True)
+            self._thread.start()
+        self._ready.wait()
+
+    def say_async(self, text: str, interrupt: bool = False):
+        if not text:
+            return
+        with self._cond:
+            if interrupt:
+                self.dropped += len(self.pending)
+                self.pending.clear()
+                self._interrupt = self.speaking is not None
+            self.pending.append(text)
+            while len(self.pending) > self.max_pending:
+                log.debug("Dropping stale speech: %s", self.pending.popleft())
+                self.dropped += 1
+            self._cond.notify_all()
+
+    def interrupt(self):
+        with self._cond:
+            self.dropped += len(self.pending)
+            self.pending.clear()
+            self._interrupt = self.speaking is not None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until everything queued has been spoken, returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._closed or (not self.pending and self.speaking is None), timeout)
+
+    def close(self, timeout: Optional[float] = 5):
+        with self._cond:
+            self._closed = True
+            self.pending.clear()
+            self._interrupt = self.speaking is not None
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _on_word(self, name, location, length):
+        if self._interrupt:
+            self.engine.stop()
+
+    def _run(self, engine_factory):
+        try:
+            self.engine = engine_factory()
+            self.engine.connect("started-word", self._on_word)
+        except Exception:
+            log.exception("Text-to-speech unavailable, continuing silently")
+            self.engine = NullEngine()
+            self.engine.connect("started-word", self._on_word)
+        finally:
+            self._ready.set()
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or self.pending)
+                if self._closed:
+                    break
+                self.speaking = self.pending.popleft()
+                self._interrupt = False
+            try:
+                with telemetry.timed("tts", words=len(self.speaking.split())):
+                    self.engine.say(self.speaking)
+                    self.engine.runAndWait()
+            except Exception:
+                log.exception("Failed to speak: %s", self.speaking)
+            with self._cond:
+                self.speaking = None
+                self._cond.notify_all()
+
+        try:
+            self.engine.stop()
+        except Exception:
+            pass
+        with self._cond:
+            self._cond.notify_all()
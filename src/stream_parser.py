@@ -0,0 +1,83 @@
+import json
+import logging
+from typing import Dict, List, Optional
+
+
+log = logging.getLogger("StreamParser")
+
+
+class ToolCallStreamParser:
+    """
+    Incremental scanner for content shaped like ollama.FORMAT.
+    Fed the content deltas of a streamed chat reply, it returns each item of the top level
+    "tool_calls" array as soon as that item's closing brace arrives.
+    """
+
+    ARRAY_KEY = "tool_calls"
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.stack: List[str] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.last_string: Optional[str] = None
+        self.key: Optional[str] = None
+        self.in_tool_calls = False
+        self.item_start: Optional[int] = None
+        self.emitted = 0
+
+    def feed(self, delta: str) -> List[Dict]:
+        self.text += delta
+        items = []
+        text = self.text
+        for i in range(self.pos, len(text)):
+            char = text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1:
+                        self.last_string = text[self.string_start:i]
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = i + 1
+            elif char == ":" and len(self.stack) == 1:
+                self.key = self.last_string
+            elif char == "," and len(self.stack) == 1:
+                self.key = None
+            elif char in "{[":
+                self.stack.append(char)
+                if char == "[" and len(self.stack) == 2 and self.key == self.ARRAY_KEY:
+                    self.in_tool_calls = True
+                elif char == "{" and self.in_tool_calls and len(self.stack) == 3:
+                    self.item_start = i
+            elif char in "}]":
+                if not self.stack:
+                    continue
+                self.stack.pop()
+                if char == "}" and self.in_tool_calls and len(self.stack) == 2 and self.item_start is not None:
+                    item = self._decode(text[self.item_start:i + 1])
+                    self.item_start = None
+                    if item is not None:
+                        self.emitted += 1
+                        items.append(item)
+                elif char == "]" and self.in_tool_calls and len(self.stack) == 1:
+                    self.in_tool_calls = False
+        self.pos = len(text)
+        return items
+
+    @staticmethod
+    def _decode(fragment: str) -> Optional[Dict]:
+        try:
+            item = json.loads(fragment)
+        except ValueError:
+            log.warning("Could not decode streamed tool call: %s", fragment)
+            return None
+        return item if isinstance(item, dict) else None
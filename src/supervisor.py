@@ -0,0 +1,214 @@
+"""
+Keeps a session running unattended: worker threads that die are restarted in place, and a session that
+crashes is resumed from its last checkpoint while the camera, serial port, speech engine and loaded
+model stay as they are, so a restart costs milliseconds rather than a reboot.
+
+Checkpoints hold the chat history, the instruction being worked on, the frame history position and the
+arm's last commanded pose. They are written atomically (temporary file, fsync, rename) so a crash or
+power cut mid-write leaves the previous checkpoint intact.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+
+from telemetry import TELEMETRY
+
+
+log = logging.getLogger("Supervisor")
+
+VERSION = 1
+
+
+def atomic_write_json(path: str, data: Any):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class Checkpoint(NamedTuple):
+    instruction: Optional[str]  # what the arm was asked to do, None between instructions
+    messages: List[Dict]
+    digest: str  # ChatContext's summary of compacted turns
+    frame_index: int  # frames recorded so far
+    pose: Dict[int, int]
+    saved: float = 0.0  # wall clock
+
+    def to_json(self) -> Dict:
+        return dict(self._asdict(), version=VERSION, pose={str(servo_id): position for servo_id, position in self.pose.items()})
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "Checkpoint":
+        if data.get("version") != VERSION:
+            raise ValueError(f"Unsupported checkpoint version {data.get('version')}")
+        return cls(data["instruction"], data["messages"], data["digest"], data["frame_index"],
+                   {int(servo_id): position for servo_id, position in data["pose"].items()}, data["saved"])
+
+
+class Checkpointer:
+    """
+    Writes checkpoints at most every interval seconds (unless forced) and keeps the latest in memory.
+    Without a path nothing is written, which still lets a session resume within the process.
+    """
+
+    def __init__(self, path: Optional[str] = None, interval: float = 30.0):
+        self.path = path
+        self.interval = interval
+        self.state: Optional[Checkpoint] = None
+        self.written = 0
+        self._last_write = float("-inf")
+        self._lock = threading.Lock()
+
+    def save(self, checkpoint: Checkpoint, force: bool = False) -> bool:
+        """Returns whether the checkpoint was written to disk; it is kept in memory either way."""
+        with self._lock:
+            if not checkpoint.pose and self.state is not None:
+                checkpoint = checkpoint._replace(pose=self.state.pose)
+            checkpoint = checkpoint._replace(messages=list(checkpoint.messages), saved=time.time())
+            self.state = checkpoint
+            now = time.monotonic()
+            if self.path is None or (not force and now - self._last_write < self.interval):
+                return False
+            with TELEMETRY.timed("checkpoint.write"):
+                atomic_write_json(self.path, checkpoint.to_json())
+            self._last_write = now
+            self.written += 1
+            return True
+
+    def load(self) -> Optional[Checkpoint]:
+        if self.path is None:
+            return None
+        try:
+            with open(self.path) as f:
+                checkpoint = Checkpoint.from_json(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            log.exception("Ignoring unreadable checkpoint %s", self.path)
+            return None
+        with self._lock:
+            self.state = checkpoint
+        log.info("Loaded checkpoint from %s: %d messages, frame %d, instruction %.60r", self.path,
+                 len(checkpoint.messages), checkpoint.frame_index, checkpoint.instruction)
+        return checkpoint
+
+    def latest(self) -> Optional[Checkpoint]:
+        """The last checkpoint saved or loaded, read from disk only if there is none in memory."""
+        return self.state if self.state is not None else self.load()
+
+
+class Worker(NamedTuple):
+    is_alive: Callable[[], bool]
+    restart: Callable[[], Any]
+
+
+class Supervisor:
+    """
+    Restarts dead workers every poll_interval seconds, and with run() resumes a crashed session from the
+    latest checkpoint, up to max_restarts times within window seconds. A restart is expected to take no
+    longer than restart_budget seconds; workers not back within it are left to the next poll.
+    """
+
+    def __init__(self, checkpointer: Optional[Checkpointer] = None, max_restarts: int = 5, window: float = 600,
+                 restart_budget: float = 5.0, poll_interval: float = 1.0):
+        self.checkpointer = checkpointer
+        self.max_restarts = max_restarts
+        self.window = window
+        self.restart_budget = restart_budget
+        self.poll_interval = poll_interval
+        self.workers: Dict[str, Worker] = {}
+        self.worker_restarts: Dict[str, int] = {}
+        self.crashes: Deque[float] = deque()
+        self.restarts = 0
+        self.last_restart: Optional[float] = None  # seconds from the crash to the session resuming
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, name: str, is_alive: Callable[[], bool], restart: Callable[[], Any]):
+        with self._lock:
+            self.workers[name] = Worker(is_alive, restart)
+            self.worker_restarts.setdefault(name, 0)
+
+    def check_workers(self, budget: Optional[float] = None) -> List[str]:
+        """Restarts every dead worker it can within budget seconds, returns the names restarted."""
+        deadline = time.monotonic() + (self.restart_budget if budget is None else budget)
+        restarted = []
+        with self._lock:
+            workers = list(self.workers.items())
+        for name, worker in workers:
+            if worker.is_alive():
+                continue
+            if time.monotonic() > deadline:
+                log.warning("Restart budget used up, %s is left for the next check", name)
+                break
+            started = time.monotonic()
+            try:
+                worker.restart()
+            except Exception:
+                log.exception("Could not restart %s", name)
+                continue
+            TELEMETRY.record("supervisor.worker_restart", (time.monotonic() - started) * 1000, worker=name)
+            log.warning("Restarted %s", name)
+            with self._lock:
+                self.worker_restarts[name] += 1
+            restarted.append(name)
+        return restarted
+
+    def start(self) -> "Supervisor":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._monitor, name="Supervisor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self, session: Callable[[Optional[Checkpoint]], Any]) -> Any:
+        """Calls session with the latest checkpoint until it returns, resuming it after each crash."""
+        checkpoint = self.checkpointer.latest() if self.checkpointer is not None else None
+        while True:
+            try:
+                return session(checkpoint)
+            except Exception:
+                crashed = time.monotonic()
+                log.exception("Session crashed")
+                self.crashes.append(crashed)
+                while self.crashes and crashed - self.crashes[0] > self.window:
+                    self.crashes.popleft()
+                if len(self.crashes) > self.max_restarts:
+                    log.error("%d crashes within %ds, giving up", len(self.crashes), self.window)
+                    raise
+            self.check_workers()
+            checkpoint = self.checkpointer.latest() if self.checkpointer is not None else None
+            self.restarts += 1
+            self.last_restart = time.monotonic() - crashed
+            TELEMETRY.record("supervisor.restart", self.last_restart * 1000)
+            if self.last_restart > self.restart_budget:
+                log.warning("Restart took %.2fs, over the %.2fs budget", self.last_restart, self.restart_budget)
+            log.warning("Resuming session from %s", "checkpoint" if checkpoint is not None else "scratch")
+
+    def _monitor(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_workers()
+            except Exception:
+                log.exception("Worker check failed")
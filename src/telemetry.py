@@ -0,0 +1,190 @@
+"""
+Latency histograms for the control loop, plus an optional JSON-lines event log.
+
+Recording a sample only takes a lock and bumps a bucket counter on the caller's thread; writing
+events to disk happens on a background thread, which rotates the file once it passes max_bytes.
+Components record through the module level TELEMETRY instance (or the record/timed shortcuts),
+the server decides whether and where the events are written.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+log = logging.getLogger("Telemetry")
+
+
+class Histogram:
+    """
+    Log-bucketed histogram of millisecond values, each bucket is `growth` times wider than the last,
+    so percentiles are accurate to within that ratio whatever the scale.
+    """
+
+    def __init__(self, lowest: float = 0.01, growth: float = 1.05, buckets: int = 400):
+        self.lowest = lowest
+        self.log_growth = math.log(growth)
+        self.counts = [0] * buckets
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, value: float):
+        index = 0 if value <= self.lowest else min(int(math.log(value / self.lowest) / self.log_growth) + 1,
+                                                    len(self.counts) - 1)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, p: float) -> float:
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = p / 100 * self.count
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    # upper edge of the bucket, never past what was actually recorded
+                    return min(self.lowest * math.exp(self.log_growth * index), self.max)
+            return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 2),
+            "min_ms": round(self.min, 2),
+            "p50_ms": round(self.percentile(50), 2),
+            "p95_ms": round(self.percentile(95), 2),
+            "p99_ms": round(self.percentile(99), 2),
+            "max_ms": round(self.max, 2),
+        }
+
+
+class Telemetry:
+    def __init__(self, path: Optional[str] = None, max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3,
+                 flush_interval: float = 1.0, max_pending: int = 10000):
+        self.histograms: Dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+        self.path = None
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        # the oldest events are dropped rather than let a stalled disk grow memory
+        self.events: Deque[Tuple[float, str, float, Dict]] = deque(maxlen=max_pending)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if path:
+            self.open(path)
+
+    def record(self, name: str, ms: float, **fields):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        histogram.record(ms)
+        if self.path is not None:
+            self.events.append((time.time(), name, ms, fields))
+
+    @contextmanager
+    def timed(self, name: str, **fields):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000, **fields)
+
+    def on_job(self, stage: str, seconds: float):
+        """Pipeline hook, records each job's busy time."""
+        self.record(f"stage.{stage}", seconds * 1000)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            histograms = dict(self.histograms)
+        return {name: histograms[name].snapshot() for name in sorted(histograms)}
+
+    def dump(self, path: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """Logs the current summary, and writes it as JSON to path if given."""
+        summary = self.summary()
+        for name, stats in summary.items():
+            log.info("%s: %s", name, " ".join(f"{key}={value}" for key, value in stats.items()))
+        if path:
+            with open(path, "w") as f:
+                json.dump(summary, f, indent=2)
+        return summary
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def open(self, path: str):
+        """Starts writing every recorded sample to path as JSON lines."""
+        self.close()
+        self.path = path
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="Telemetry", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: Optional[float] = 5):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self.path = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        lines: List[str] = []
+        while self.events:
+            at, name, ms, fields = self.events.popleft()
+            lines.append(json.dumps(dict(fields, at=round(at, 3), name=name, ms=round(ms, 3))))
+        if not lines:
+            return
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self._rotate()
+            with open(self.path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError:
+            log.exception("Failed writing telemetry to %s", self.path)
+
+    def _rotate(self):
+        # same naming as logging.handlers.RotatingFileHandler: path.1 is the newest backup
+        for index in range(self.backup_count - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+TELEMETRY = Telemetry()
+
+
+def record(name: str, ms: float, **fields):
+    TELEMETRY.record(name, ms, **fields)
+
+
+def timed(name: str, **fields):
+    return TELEMETRY.timed(name, **fields)
@@ -0,0 +1,131 @@
+import logging
+import math
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from lsc_codec import packet_size
+from lsc_servo_client import LSCServoController
+
+
+log = logging.getLogger("Trajectory")
+
+BITS_PER_BYTE = 10  # 8N1 framing
+MIN_STEP_MS = 20
+
+
+class TrajectoryPoint(NamedTuple):
+    at: float  # seconds after the start of the trajectory the packet is sent
+    positions: Dict[int, int]
+    time_ms: int  # the controller interpolates to positions over this long
+
+
+def profile_duration(distance: float, max_velocity: float, max_acceleration: float) -> float:
+    """Shortest time to cover distance from rest to rest with a trapezoidal velocity profile."""
+    if distance <= 0:
+        return 0.0
+    if distance < max_velocity ** 2 / max_acceleration:
+        return 2 * math.sqrt(distance / max_acceleration)
+    return distance / max_velocity + max_velocity / max_acceleration
+
+
+def profile_fraction(t: float, distance: float, max_velocity: float, max_acceleration: float) -> float:
+    """Fraction of distance covered after t seconds along the same profile."""
+    duration = profile_duration(distance, max_velocity, max_acceleration)
+    if distance <= 0 or t >= duration:
+        return 1.0
+    ramp = min(max_velocity / max_acceleration, duration / 2)
+    peak = max_acceleration * ramp
+    if t < ramp:
+        covered = 0.5 * max_acceleration * t ** 2
+    elif t < duration - ramp:
+        covered = 0.5 * max_acceleration * ramp ** 2 + peak * (t - ramp)
+    else:
+        covered = distance - 0.5 * max_acceleration * (duration - t) ** 2
+    return covered / distance
+
+
+class TrajectoryPlanner:
+    """
+    Turns waypoint sequences into time-stamped CMD_SERVO_MOVE packets for LSCServoController.move_servos.
+    All servos in a segment share one trapezoidal profile sized for the longest move, and packets are
+    spaced no closer than the serial link budget allows.
+    """
+
+    def __init__(self, arm: LSCServoController, max_velocity: float = 1000, max_acceleration: float = 2000,
+                 max_rate_hz: float = 10, link_budget: float = 0.5, limits: Optional[Dict[int, List[int]]] = None):
+        self.arm = arm
+        self.max_velocity = max_velocity  # position units per second
+        self.max_acceleration = max_acceleration  # position units per second squared
+        self.max_rate_hz = max_rate_hz
+        self.link_budget = link_budget  # share of the link's bytes/s trajectory packets may use
+        self.limits = limits or LSCServoController.SERVO_LIMITS
+        self.pose: Dict[int, int] = {}
+
+    def packet_rate(self, servo_count: int) -> float:
+        packet_bytes = packet_size(3 + 3 * servo_count)
+        link_rate = self.link_budget * LSCServoController.BAUD_RATE / BITS_PER_BYTE / packet_bytes
+        return min(self.max_rate_hz, link_rate)
+
+    def clamp(self, servo_id: int, position: int) -> int:
+        low, high = self.limits[servo_id]
+        if not low <= position <= high:
+            log.warning("Servo %s position %s clamped to %s", servo_id, position, self.limits[servo_id])
+        return min(max(position, low), high)
+
+    def plan(self, waypoints: List[Dict[int, int]], start: Optional[Dict[int, int]] = None) -> List[TrajectoryPoint]:
+        pose = dict(self.pose if start is None else start)
+        points = []
+        elapsed = 0.0
+        for waypoint in waypoints:
+            target = {servo_id: self.clamp(servo_id, position) for servo_id, position in waypoint.items()}
+            begin = {servo_id: pose.get(servo_id, self._rest(servo_id)) for servo_id in target}
+            distance = max(abs(target[s] - begin[s]) for s in target) if target else 0
+            duration = profile_duration(distance, self.max_velocity, self.max_acceleration)
+            pose.update(target)
+            if distance == 0:
+                continue
+            steps = max(1, min(math.ceil(duration * self.packet_rate(len(target))),
+                               int(duration * 1000 // MIN_STEP_MS)))
+            previous = 0.0
+            for step in range(1, steps + 1):
+                t = duration * step / steps
+                fraction = profile_fraction(t, distance, self.max_velocity, self.max_acceleration)
+                positions = {s: round(begin[s] + fraction * (target[s] - begin[s])) for s in target}
+                points.append(TrajectoryPoint(elapsed + previous, positions, round((t - previous) * 1000)))
+                previous = t
+            elapsed += duration
+        return points
+
+    def execute(self, points: List[TrajectoryPoint]) -> float:
+        """Streams the packets on schedule, returns the monotonic time the arm arrives."""
+        start = time.monotonic()
+        for point in points:
+            delay = start + point.at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.arm.move_servos(list(point.positions), list(point.positions.values()), point.time_ms)
+            self.pose.update(point.positions)
+        if not points:
+            return start
+        return start + points[-1].at + points[-1].time_ms / 1000
+
+    def follow(self, waypoints: List[Dict[int, int]]) -> float:
+        if any(servo_id not in self.pose for waypoint in waypoints for servo_id in waypoint):
+            self.refresh_pose()
+        points = self.plan(waypoints)
+        log.debug("Trajectory of %d packets over %.2fs", len(points),
+                  points[-1].at + points[-1].time_ms / 1000 if points else 0)
+        return self.execute(points)
+
+    def refresh_pose(self):
+        try:
+            self.pose.update(self.arm.read_servo_positions())
+        except Exception:
+            log.debug("Could not read servo positions, assuming the arm is centred")
+
+    def observe(self, positions: Dict[int, int]):
+        self.pose.update(positions)
+
+    def _rest(self, servo_id: int) -> int:
+        low, high = self.limits[servo_id]
+        return (low + high) // 2
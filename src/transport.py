@@ -0,0 +1,160 @@
+"""
+HTTP endpoints that survive a week of running: one pooled keep-alive session per host, separate connect
+and read timeouts, jittered exponential retries and a circuit breaker.
+
+Retries only cover getting a response (status and headers). Once a streamed body is being read, a failure
+is the caller's to handle, since part of it may already have been acted on.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+log = logging.getLogger("Transport")
+
+# worth asking again, the server or something in front of it is temporarily unable to answer
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without trying while an endpoint's circuit is open."""
+
+
+class StreamError(requests.exceptions.RequestException):
+    """A streamed reply that reported an error or ended before it was done."""
+
+
+class RetryPolicy(NamedTuple):
+    attempts: int = 4
+    backoff: float = 0.5  # seconds before the first retry, doubling after that
+    max_backoff: float = 15.0
+    jitter: float = 0.5  # each delay is scaled by a random factor within 1 +/- jitter
+
+    def delay(self, attempt: int) -> float:
+        base = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails fast until reset_timeout has passed,
+    then lets one trial request through (half-open): success closes it again, failure reopens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial = True
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                log.warning("Circuit opened after %d consecutive failures", self.failures)
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+
+class Endpoint:
+    def __init__(self, name: str, connect_timeout: float = 3.05, read_timeout: float = 300,
+                 retry: RetryPolicy = RetryPolicy(), breaker: Optional[CircuitBreaker] = None, pool_size: int = 4,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry = retry
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.sleep = sleep
+        self.session = requests.Session()
+        # retries are done here, with backoff and the breaker, not by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.retries = 0
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Like session.request, retrying connection errors, connect timeouts and RETRY_STATUSES. A read timeout
+        is not retried: the server got the request and may still be working on it, and asking again would
+        wait out the read timeout once per attempt. Bodies must be re-iterable (bytes, dicts or a ChatRequest)
+        so a retry can send them again.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.retry.attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} circuit is open, not calling {url}")
+            last = attempt == self.retry.attempts - 1
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError as e:  # ConnectTimeout included
+                self.breaker.failure()
+                if last:
+                    raise
+                log.warning("%s %s failed (%s), retry %d of %d", self.name, url, e, attempt + 1, self.retry.attempts - 1)
+            except BaseException:
+                # a read timeout or anything else, which must still settle a half-open trial
+                self.breaker.failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.success()
+                    return response
+                self.breaker.failure()
+                if last:
+                    return response
+                log.warning("%s %s returned %d, retry %d of %d", self.name, url, response.status_code,
+                            attempt + 1, self.retry.attempts - 1)
+                response.close()
+            self.retries += 1
+            self.sleep(self.retry.delay(attempt))
+
+    def close(self):
+        self.session.close()
+
+
+def warm_up(endpoint: Endpoint, url: str, model: str, keep_alive: int) -> float:
+    """
+    Health probe for Ollama: a chat request without messages loads the model and keeps it loaded for
+    keep_alive seconds, so the first real prompt does not pay the load time. Returns the seconds it took.
+    """
+    started = time.monotonic()
+    response = endpoint.post(url, json={"model": model, "messages": [], "keep_alive": keep_alive, "stream": False})
+    response.raise_for_status()
+    seconds = time.monotonic() - started
+    log.info("%s model %s ready in %.1fs", endpoint.name, model, seconds)
+    return seconds
@@ -0,0 +1,266 @@
+"""
+Classical vision on camera frames, fast enough to run on every frame before the model is asked anything.
+
+Pixels are segmented by colour in HSV, saturated colours being the bricks and everything grey or dark
+being the arm, the table and the background. Each colour's mask is reduced to a coarse grid of blocks and
+connected blocks are grouped into blobs, all as NumPy array operations. A fixed pincer region, e.g. where
+the jaws are in a wrist camera's view or at an inspection pose, counts as occupied when enough of it is
+brick coloured.
+
+The resulting SceneFacts go into the prompt as text, and simple questions ("is there anything between the
+pincers?", "how many red bricks are there?") are answered from them without asking the model at all.
+"""
+import logging
+import re
+from io import BytesIO
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+log = logging.getLogger("Vision")
+
+
+class ColorRange(NamedTuple):
+    name: str
+    hue_low: int  # PIL's hue scale, 0-255; a range with hue_low > hue_high wraps around through 0
+    hue_high: int
+    min_saturation: int = 100
+    min_value: int = 60
+
+
+DEFAULT_COLORS = (
+    ColorRange("red", 240, 10),
+    ColorRange("orange", 10, 22),
+    ColorRange("yellow", 22, 45),
+    ColorRange("green", 45, 120),
+    ColorRange("blue", 120, 185),
+    ColorRange("purple", 185, 240),
+)
+
+
+class Blob(NamedTuple):
+    color: str
+    area: float  # fraction of the frame
+    centroid: Tuple[float, float]  # x, y as fractions of the frame, from the top-left
+    bbox: Tuple[float, float, float, float]  # left, top, right, bottom as fractions of the frame
+
+
+class SceneFacts(NamedTuple):
+    blobs: Tuple[Blob, ...]  # largest first
+    pincer_fill: Optional[float]  # fraction of the pincer region that is brick coloured, None without a region
+    pincer_color: Optional[str]
+    occupied: Optional[bool]
+
+    def colors(self) -> List[str]:
+        return sorted({blob.color for blob in self.blobs}, key=[blob.color for blob in self.blobs].index)
+
+    def describe(self) -> str:
+        """The facts as a sentence or two for the prompt."""
+        if self.blobs:
+            objects = "; ".join(f"{blob.color} at x={blob.centroid[0]:.2f} y={blob.centroid[1]:.2f} "
+                                f"covering {blob.area:.1%}" for blob in self.blobs)
+            text = f"Local vision found {len(self.blobs)} coloured objects in the latest image (x and y from " \
+                   f"the top-left, 0 to 1): {objects}."
+        else:
+            text = "Local vision found no coloured objects in the latest image."
+        if self.occupied is not None:
+            text += f" There is something {self.pincer_color} between the pincers." if self.occupied else \
+                " There is nothing between the pincers."
+        return text
+
+
+class Query(NamedTuple):
+    kind: str  # "pincer", "count", "where" or "colors"
+    color: Optional[str] = None
+
+
+QUESTION = re.compile(r"^\s*(is|are|do|does|what|where|which|how many|can you see|have you)\b", re.IGNORECASE)
+PINCER = re.compile(r"\b(pincers?|gripper|grip|claw|holding|hold)\b", re.IGNORECASE)
+COUNT = re.compile(r"\bhow many\b", re.IGNORECASE)
+WHERE = re.compile(r"\bwhere\b", re.IGNORECASE)
+COLORS = re.compile(r"\b(what|which) colou?rs?\b", re.IGNORECASE)
+# anything that asks for more than a look: a second sentence or clause, or something to do (transcribed
+# speech has no punctuation, so the verbs are what give "where is the red brick put it in the bowl" away)
+MORE = re.compile(r"[,;:]|[.?!]\s*\S|\b(and|then|also|after|before|but|so|please)\b|"
+                  r"\b(pick|put|place|move|moving|grab|stack|drop|lift|take|turn|rotate|open|close|release|sort|"
+                  r"push|pull|bring|give|wave|lower|raise|set|go|show|point|let)\b", re.IGNORECASE)
+
+
+def simple_query(question: str, colors: Sequence[ColorRange] = DEFAULT_COLORS) -> Optional[Query]:
+    """
+    What the question asks if it is one local vision can answer, None for anything else, including a question
+    that comes with an instruction, which has to go to the model.
+    """
+    if not question or not QUESTION.search(question) or MORE.search(question):
+        return None
+    named = [color.name for color in colors if re.search(rf"\b{color.name}\b", question, re.IGNORECASE)]
+    color = named[0] if named else None
+    if PINCER.search(question):
+        return Query("pincer")
+    if COUNT.search(question):
+        return Query("count", color)
+    if WHERE.search(question) and color:
+        return Query("where", color)
+    if COLORS.search(question):
+        return Query("colors")
+    return None
+
+
+def answer(query: Query, facts: SceneFacts) -> Optional[str]:
+    """A spoken answer to query, None if the facts cannot answer it."""
+    if query.kind == "pincer":
+        if facts.occupied is None:
+            return None
+        # no yes or no, the question may as well have been whether the pincers are empty
+        return f"I am holding something {facts.pincer_color}." if facts.occupied else \
+            "There is nothing between my pincers."
+    blobs = [blob for blob in facts.blobs if query.color is None or blob.color == query.color]
+    if query.kind == "count":
+        if query.color is not None:
+            return f"I can see {len(blobs)} {query.color} object{'s' if len(blobs) != 1 else ''}."
+        if not blobs:
+            return "I can't see any coloured objects."
+        counts = ", ".join(f"{sum(blob.color == color for blob in blobs)} {color}" for color in facts.colors())
+        return f"I can see {len(blobs)} object{'s' if len(blobs) != 1 else ''}: {counts}."
+    if query.kind == "where":
+        if not blobs:
+            return f"I can't see anything {query.color}."
+        x, y = blobs[0].centroid
+        across = "left" if x < 1 / 3 else "right" if x > 2 / 3 else "centre"
+        down = "top" if y < 1 / 3 else "bottom" if y > 2 / 3 else "middle"
+        return f"The {query.color} object is at the {down} {across} of the picture."
+    if query.kind == "colors":
+        colors = facts.colors()
+        return f"I can see {', '.join(colors)}." if colors else "I can't see any coloured objects."
+    return None
+
+
+class SceneAnalyzer:
+    """
+    Turns a JPEG into SceneFacts. Frames are decoded straight to about size (the JPEG decoder skips the
+    detail), blobs are grouped from block x block pixel tiles at least min_fill brick coloured, and blobs
+    smaller than min_area of the frame are ignored. pincer_region is left, top, right, bottom as fractions
+    of the frame, occupied once pincer_threshold of it is brick coloured.
+    """
+
+    def __init__(self, colors: Sequence[ColorRange] = DEFAULT_COLORS, size: Tuple[int, int] = (160, 120),
+                 block: int = 4, min_fill: float = 0.5, min_area: float = 0.002,
+                 pincer_region: Optional[Tuple[float, float, float, float]] = None, pincer_threshold: float = 0.15,
+                 max_blobs: int = 10):
+        if size[0] % block or size[1] % block:
+            raise ValueError(f"size {size} must be a multiple of block {block}")
+        self.colors = tuple(colors)
+        self.size = size
+        self.block = block
+        self.min_fill = min_fill
+        self.min_area = min_area
+        self.pincer_region = pincer_region
+        self.pincer_threshold = pincer_threshold
+        self.max_blobs = max_blobs
+        self.last: Optional[SceneFacts] = None
+        width, height = size
+        self._ys, self._xs = np.mgrid[0:height, 0:width].astype(np.float32)
+        # first bincount slot of each pixel's block, one slot per colour and one for none
+        blocks = (self._ys // block) * (width // block) + self._xs // block
+        self._block_of = blocks.astype(np.intp) * (len(self.colors) + 1)
+        # colour by hue, looked up rather than compared range by range; index 0 is no colour
+        self._hue_classes = np.zeros(256, dtype=np.uint8)
+        hues = np.arange(256)
+        for i, color in enumerate(self.colors):
+            if color.hue_low <= color.hue_high:
+                in_range = (hues >= color.hue_low) & (hues < color.hue_high)
+            else:
+                in_range = (hues >= color.hue_low) | (hues < color.hue_high)
+            self._hue_classes[in_range] = i + 1
+        self._min_saturation = np.array([256] + [color.min_saturation for color in self.colors], dtype=np.int16)
+        self._min_value = np.array([256] + [color.min_value for color in self.colors], dtype=np.int16)
+
+    def decode(self, jpeg: bytes) -> np.ndarray:
+        image = Image.open(BytesIO(jpeg))
+        image.draft("RGB", self.size)
+        if image.size != self.size:
+            image = image.convert("RGB").resize(self.size, Image.BILINEAR)
+        return np.asarray(image.convert("HSV"))
+
+    def segment(self, hsv: np.ndarray) -> np.ndarray:
+        """Per pixel, 0 for no brick colour or the index in colors plus one."""
+        classes = self._hue_classes[hsv[..., 0]]
+        saturated = (hsv[..., 1] >= self._min_saturation[classes]) & (hsv[..., 2] >= self._min_value[classes])
+        return classes * saturated
+
+    def analyse(self, jpeg: bytes) -> SceneFacts:
+        classes = self.segment(self.decode(jpeg))
+        blobs = sorted(self.find_blobs(classes), key=lambda blob: blob.area, reverse=True)
+        fill, color = self.pincer(classes)
+        facts = SceneFacts(tuple(blobs[:self.max_blobs]), fill, color,
+                           None if fill is None else fill >= self.pincer_threshold)
+        self.last = facts
+        return facts
+
+    def find_blobs(self, classes: np.ndarray) -> List[Blob]:
+        width, height = self.size
+        b = self.block
+        rows, columns = height // b, width // b
+        bins = len(self.colors) + 1
+        # pixel count and coordinate sums per block and colour, in one pass each
+        keys = (self._block_of + classes).ravel()
+        counts = np.bincount(keys, minlength=rows * columns * bins).reshape(rows, columns, bins)
+        # each block takes the colour most of its pixels have, if enough do
+        best = counts[..., 1:].argmax(axis=2) + 1
+        block_counts = np.take_along_axis(counts, best[..., None], axis=2)[..., 0]
+        occupied = block_counts >= self.min_fill * b * b
+        if not occupied.any():
+            return []
+        block_classes = np.where(occupied, best, 0)
+
+        labels = np.where(occupied, np.arange(1, rows * columns + 1).reshape(rows, columns), 0)
+        # every block takes the largest label among itself and its neighbours of the same colour until
+        # nothing changes, which leaves each connected group of blocks with one label
+        same_below = block_classes[1:] == block_classes[:-1]
+        same_right = block_classes[:, 1:] == block_classes[:, :-1]
+        while True:
+            spread = labels.copy()
+            np.maximum(spread[1:], labels[:-1] * same_below, out=spread[1:])
+            np.maximum(spread[:-1], labels[1:] * same_below, out=spread[:-1])
+            np.maximum(spread[:, 1:], labels[:, :-1] * same_right, out=spread[:, 1:])
+            np.maximum(spread[:, :-1], labels[:, 1:] * same_right, out=spread[:, :-1])
+            if np.array_equal(spread, labels):
+                break
+            labels = spread
+
+        # coordinate sums of each block's own colour, for the centroids
+        own = (self._block_of[::b, ::b] + block_classes)[occupied]
+        block_x = np.bincount(keys, weights=self._xs.ravel(), minlength=rows * columns * bins)[own]
+        block_y = np.bincount(keys, weights=self._ys.ravel(), minlength=rows * columns * bins)[own]
+        ids, blob_of = np.unique(labels[occupied], return_inverse=True)
+        area = np.bincount(blob_of, weights=block_counts[occupied])
+        sum_x = np.bincount(blob_of, weights=block_x)
+        sum_y = np.bincount(blob_of, weights=block_y)
+        block_rows, block_columns = np.nonzero(occupied)
+        colors = block_classes[occupied]
+        blobs = []
+        total = width * height
+        for n in range(len(ids)):
+            if area[n] < self.min_area * total:
+                continue
+            in_blob = blob_of == n
+            rows_in, columns_in = block_rows[in_blob], block_columns[in_blob]
+            blobs.append(Blob(self.colors[colors[in_blob][0] - 1].name, float(area[n]) / total,
+                              (float(sum_x[n] / area[n] + 0.5) / width, float(sum_y[n] / area[n] + 0.5) / height),
+                              (float(columns_in.min() * b) / width, float(rows_in.min() * b) / height,
+                               float((columns_in.max() + 1) * b) / width, float((rows_in.max() + 1) * b) / height)))
+        return blobs
+
+    def pincer(self, classes: np.ndarray) -> Tuple[Optional[float], Optional[str]]:
+        if self.pincer_region is None:
+            return None, None
+        width, height = self.size
+        left, top, right, bottom = self.pincer_region
+        region = classes[int(top * height):max(int(bottom * height), int(top * height) + 1),
+                         int(left * width):max(int(right * width), int(left * width) + 1)]
+        counts = np.bincount(region.ravel(), minlength=len(self.colors) + 1)
+        fill = 1 - counts[0] / region.size
+        color = self.colors[int(counts[1:].argmax())].name if fill else None
+        return float(fill), color
@@ -0,0 +1,60 @@
+import time
+import unittest
+
+import numpy as np
+
+from lsc_codec import LimitTable, encode_servo_move, encode_servo_moves
+from lsc_servo_client import LSCServoController
+
+
+PACKETS = 20000
+SERVOS = [2, 3, 4, 5, 6]
+
+
+def legacy_move_packet(servo_ids, positions, time_ms) -> bytearray:
+    # LSCServoController.move_servos and send_command before the codec, minus the serial write
+    all_params = [len(servo_ids), time_ms & 0xFF, (time_ms >> 8) & 0xFF]
+    assert len(servo_ids) == len(positions)
+    for idx in range(0, len(servo_ids)):
+        servo_id = servo_ids[idx]
+        position = positions[idx]
+        limits = LSCServoController.SERVO_LIMITS
+        assert servo_id in limits, f"{servo_id} not in {limits}"
+        assert limits[servo_id][0] <= position >= limits[servo_id][0], f"For servo {servo_id}, {position} is outside of {limits[servo_id]}"
+        all_params.append(servo_id)
+        all_params.append(position & 0xFF)
+        all_params.append((position >> 8) & 0xFF)
+    length = len(all_params) + 2
+    return bytearray([0x55, 0x55] + [length, LSCServoController.CMD_SERVO_MOVE] + all_params)
+
+
+class CodecBenchmark(unittest.TestCase):
+    """Move packet encode throughput, run with: pytest -s tests/benchmarks/codec_benchmark.py"""
+
+    def test_encode_throughput(self):
+        positions = np.random.default_rng(0).integers(500, 2500, size=(PACKETS, len(SERVOS)))
+        times = np.full(PACKETS, 20)
+        rows = positions.tolist()
+        limits = LimitTable(LSCServoController.SERVO_LIMITS)
+
+        start = time.perf_counter()
+        legacy = [legacy_move_packet(SERVOS, row, 20) for row in rows]
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        buffer = None
+        for row in rows:
+            limits.validate(SERVOS, row)
+            buffer = encode_servo_move(SERVOS, row, 20, out=buffer)
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        limits.validate(SERVOS, positions)
+        batch = encode_servo_moves(SERVOS, positions, times)
+        batch_time = time.perf_counter() - start
+
+        print(f"\n{PACKETS} move packets: legacy {PACKETS / legacy_time:,.0f}/s, "
+              f"struct {PACKETS / single_time:,.0f}/s, numpy batch {PACKETS / batch_time:,.0f}/s "
+              f"({legacy_time / batch_time:.0f}x)")
+        self.assertEqual(batch.tobytes(), b"".join(legacy))
+        self.assertEqual(buffer, legacy[-1])
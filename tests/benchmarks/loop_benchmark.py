@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from statistics import mean
+from unittest.mock import patch
+
+import server
+from camera import MJPEGGrabber
+from context import ChatContext
+from frame_store import FrameStore
+from lsc_servo_client import LSCServoController
+from montage import MontageBuilder
+from session_recorder import SessionRecorder, load_session
+from speech import NullEngine, SpeechWorker
+from telemetry import TELEMETRY
+from tests.fakes import FakeMJPEGServer, FakeOllamaServer, VirtualLSCSerial, make_jpeg
+
+
+TURNS = int(os.environ.get("LOOP_BENCHMARK_TURNS", 10))
+LATENCY = float(os.environ.get("LOOP_BENCHMARK_LATENCY", 0.2))  # seconds before Ollama's first chunk
+# a session recorded with server.SESSION_RECORD_PATH, replayed instead of the canned one
+SESSION = os.environ.get("LOOP_BENCHMARK_SESSION")
+
+
+def canned_replies(turns: int):
+    replies = []
+    for turn in range(turns - 1):
+        position = 1000 + 400 * (turn % 2)
+        replies.append(json.dumps({"message": f"Moving to {position}",
+                                   "tool_calls": [{"servo_id": 2 + turn % 5, "position": position}]}))
+    replies.append(json.dumps({"message": "Done", "tool_calls": []}))
+    return replies
+
+
+class VirtualRig:
+    """
+    The real loop, controller, transport, camera grabber and speech worker wired to local stubs:
+    an MJPEG server, an /api/chat server and a virtual LSC serial device.
+    """
+
+    def __init__(self, frames, replies, latency: float = 0, chunk_delay: float = 0):
+        self.camera_server = FakeMJPEGServer(frames, fps=20)
+        self.ollama = FakeOllamaServer(replies, latency=latency, chunk_delay=chunk_delay)
+        self.device = VirtualLSCSerial()
+
+    def __enter__(self):
+        self.camera_server.start()
+        self.ollama.start()
+        self.saved = {name: getattr(server, name) for name in
+                      ("WEBCAM_URL", "OLLAMA_URL", "FRAME_HISTORY", "MONTAGE", "CONTEXT", "RECORDER", "SCENE_UNCHANGED_ACTION")}
+        server.WEBCAM_URL = self.camera_server.url
+        server.OLLAMA_URL = self.ollama.chat_url
+        server.FRAME_HISTORY = FrameStore(capacity=server.FRAME_HISTORY_CAPACITY)
+        server.MONTAGE = MontageBuilder()
+        server.CONTEXT = ChatContext(max_tokens=server.CONTEXT_MAX_TOKENS)
+        # the stub camera does not show the virtual arm, every turn must reach the model
+        server.SCENE_UNCHANGED_ACTION = "infer"
+        self.camera = MJPEGGrabber(self.camera_server.url).start()
+        self.speech = SpeechWorker(lambda: NullEngine(seconds_per_word=0.05))
+        with patch("serial.Serial", return_value=self.device), patch("time.sleep"):
+            self.arm = LSCServoController("/dev/virtual", background_io=True)
+        TELEMETRY.reset()
+        return self
+
+    def __exit__(self, *exc):
+        self.arm.transport.close()
+        self.speech.close()
+        self.camera.stop()
+        for name, value in self.saved.items():
+            setattr(server, name, value)
+        self.ollama.stop()
+        self.camera_server.stop()
+
+    def run(self) -> float:
+        """Runs loop() until every reply has been used up, returns the wall time."""
+        start = time.monotonic()
+        while self.ollama.requests < len(self.ollama.replies):
+            chat = {"messages": [], "stream": False}
+            server.loop(self.arm, self.speech, chat, server.prompts.START, self.camera)
+        return time.monotonic() - start
+
+
+def report(title: str, seconds: float, turns: int):
+    print(f"\n{title}: {turns} turns in {seconds:.2f}s, {turns * 3600 / seconds:,.0f} turns/hour")
+    for name, stats in TELEMETRY.summary().items():
+        print(f"  {name:32} " + " ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+class LoopBenchmark(unittest.TestCase):
+    """End-to-end turn time without hardware, run with: pytest -s tests/benchmarks/loop_benchmark.py"""
+
+    def test_canned_session(self):
+        frames = [make_jpeg((40 * i, 80, 160)) for i in range(6)]
+        with VirtualRig(frames, canned_replies(TURNS), latency=LATENCY, chunk_delay=0.005) as rig:
+            seconds = rig.run()
+        report("canned", seconds, TURNS)
+        self.assertEqual(rig.ollama.requests, TURNS)
+        self.assertTrue(rig.device.moves)
+        self.assertEqual(TELEMETRY.summary()["turn"]["count"], TURNS)
+
+    def test_record_and_replay(self):
+        """Replaying a recorded session takes no longer than the original did."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = SESSION
+            if path is None:
+                path = os.path.join(directory, "session.jsonl")
+                frames = [make_jpeg((10, 40 * i, 200)) for i in range(4)]
+                with VirtualRig(frames, canned_replies(TURNS), latency=LATENCY, chunk_delay=0.005) as rig:
+                    recorder = SessionRecorder(path)
+                    server.RECORDER = recorder
+                    rig.run()
+                    recorder.close()
+            session = load_session(path)
+
+        with VirtualRig(session.frames, session.replies) as rig:
+            seconds = rig.run()
+        report("replay", seconds, len(session.replies))
+        replayed = TELEMETRY.summary()["turn"]
+        recorded = mean(session.turns)
+        print(f"  mean turn: recorded {recorded * 1000:.0f}ms, replayed {replayed['mean_ms']:.0f}ms")
+        self.assertEqual(replayed["count"], len(session.replies))
+        self.assertLessEqual(replayed["mean_ms"], recorded * 1000 * 1.25 + 100)
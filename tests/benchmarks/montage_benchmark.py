@@ -0,0 +1,63 @@
+import base64
+import time
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from montage import MontageBuilder
+from tests.fakes import make_jpeg
+
+
+TURNS = 50
+
+
+def legacy_build_image_montage(image_history) -> str:
+    # server.build_image_montage before the incremental builder, minus the debug file write
+    images = [Image.open(BytesIO(base64.b64decode(img))) for img in image_history[-4:]]
+    images.reverse()
+
+    widths, heights = zip(*(img.size for img in images))
+    new_width, new_height = max(widths) * 2, max(heights) * 2
+
+    image = Image.new("RGB", (new_width, new_height))
+    image.paste(images[0], (0, 0))
+    if len(images) > 1:
+        image.paste(images[1], (max(widths), 0))
+    if len(images) > 2:
+        image.paste(images[2], (0, max(heights)))
+    if len(images) > 3:
+        image.paste(images[3], (max(widths), max(heights)))
+
+    output_buffer = BytesIO()
+    image.save(output_buffer, format="JPEG")
+    return base64.b64encode(output_buffer.getvalue()).decode('utf-8')
+
+
+class MontageBenchmark(unittest.TestCase):
+    """Per-turn montage cost, run with: pytest -s tests/benchmarks/montage_benchmark.py"""
+
+    def test_per_turn_cost(self):
+        frames = [make_jpeg(((i * 37) % 256, (i * 91) % 256, (i * 13) % 256)) for i in range(TURNS)]
+        history = [base64.b64encode(frame).decode('utf-8') for frame in frames]
+
+        start = time.perf_counter()
+        for turn in range(1, TURNS + 1):
+            legacy_build_image_montage(history[:turn])
+        legacy = (time.perf_counter() - start) / TURNS
+
+        builder = MontageBuilder()
+        start = time.perf_counter()
+        for turn in range(1, TURNS + 1):
+            first = max(0, turn - MontageBuilder.SLOTS)
+            montage = builder.build(range(first, turn), lambda i: base64.b64decode(history[i]))
+            base64.b64encode(montage).decode('utf-8')
+        incremental = (time.perf_counter() - start) / TURNS
+
+        print(f"\nmontage per turn: legacy {legacy * 1000:.2f}ms, incremental {incremental * 1000:.2f}ms "
+              f"({legacy / incremental:.1f}x)")
+        self.assertEqual(builder.decoded, TURNS)
+
+
+if __name__ == "__main__":
+    unittest.main()
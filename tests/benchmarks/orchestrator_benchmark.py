@@ -0,0 +1,59 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from orchestrator import Orchestrator
+from telemetry import TELEMETRY
+from tests.fakes import FakeMJPEGServer, FakeOllamaServer, VirtualLSCSerial, make_jpeg
+
+
+CELLS = int(os.environ.get("ORCHESTRATOR_BENCHMARK_CELLS", 3))
+TURNS = int(os.environ.get("ORCHESTRATOR_BENCHMARK_TURNS", 30))  # across all cells
+LATENCY = float(os.environ.get("ORCHESTRATOR_BENCHMARK_LATENCY", 0.2))  # seconds before Ollama's first chunk
+
+
+def replies(turns: int):
+    moves = [json.dumps({"message": f"Moving {turn}", "tool_calls": [{"servo_id": 2 + turn % 5,
+                                                                       "position": 1000 + 400 * (turn % 2)}]})
+             for turn in range(turns)]
+    return ["{}"] + moves + [json.dumps({"message": "Done", "tool_calls": []})]
+
+
+def run(slots: int):
+    devices = {f"/dev/cell{i}": VirtualLSCSerial() for i in range(CELLS)}
+    cameras = [FakeMJPEGServer([make_jpeg((60 * i, 80, 160))], fps=20) for i in range(CELLS)]
+    with FakeOllamaServer(replies(TURNS), latency=LATENCY, chunk_delay=0.002) as stub:
+        for camera in cameras:
+            camera.start()
+        config = {"url": stub.chat_url, "model": "llava", "slots": slots,
+                  "cells": [{"name": f"cell{i}", "camera_url": camera.url, "serial_port": f"/dev/cell{i}",
+                             "scene_unchanged": "infer"} for i, camera in enumerate(cameras)]}
+        orchestrator = Orchestrator.from_config(config)
+        with patch("serial.Serial", side_effect=lambda port, *args, **kwargs: devices[port]):
+            orchestrator.start()
+        try:
+            orchestrator.join(300)
+            throughput = orchestrator.throughput()
+        finally:
+            orchestrator.stop()
+            for camera in cameras:
+                camera.stop()
+    return throughput, orchestrator.scheduler.stats()
+
+
+class OrchestratorBenchmark(unittest.TestCase):
+    """Turns per hour across cells sharing one stub model, run with: pytest -s tests/benchmarks/orchestrator_benchmark.py"""
+
+    def test_slots(self):
+        for slots in sorted({1, CELLS}):
+            TELEMETRY.reset()
+            throughput, stats = run(slots)
+            print(f"\n{CELLS} cells, {slots} slot(s): {throughput['turns']} turns, "
+                  f"{throughput['total']:,.0f} turns/hour {throughput['cells']}")
+            for cell, share in stats.items():
+                print(f"  {cell:8} " + " ".join(f"{key}={value}" for key, value in share.items()))
+            for name, summary in TELEMETRY.summary().items():
+                if name.startswith(("scheduler.", "cell.")):
+                    print(f"  {name:24} " + " ".join(f"{key}={value}" for key, value in summary.items()))
+            self.assertEqual(throughput["turns"], TURNS)
@@ -0,0 +1,65 @@
+import base64
+import json
+import os
+import time
+import tracemalloc
+import unittest
+
+import ollama
+import prompts
+from request_builder import ChatRequest
+
+
+TURNS = 20
+MONTAGE_BYTES = 400 * 1024
+
+
+def chat_history(turns: int):
+    prompt = ollama.build_prompt("llama3.2-vision")
+    prompt["messages"].append({"role": "user", "content": prompts.START})
+    for i in range(turns):
+        prompt["messages"].append({"role": "assistant", "content": json.dumps(
+            {"message": f"Moving servo {i % 6 + 1}", "tool_calls": [{"servo_id": i % 6 + 1, "position": 1500}]})})
+        prompt["messages"].append({"role": "user", "content": prompts.CONTINUE})
+    return prompt
+
+
+def legacy_body(prompt, montage: bytes) -> bytes:
+    # server.build_image_montage's base64 string, then requests.post(json=prompt)
+    body = dict(prompt, images=[base64.b64encode(montage).decode('utf-8')])
+    return json.dumps(body).encode("utf-8")
+
+
+def streamed_body(prompt, montage: bytes) -> int:
+    # what requests does with a ChatRequest: send each piece as it is produced
+    sent = 0
+    for piece in ChatRequest(dict(prompt, images=[montage])):
+        sent += len(piece)
+    return sent
+
+
+def measure(build, prompt, montage):
+    tracemalloc.start()
+    started = time.process_time()
+    for _ in range(TURNS):
+        build(prompt, montage)
+    cpu = (time.process_time() - started) / TURNS
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, peak
+
+
+class RequestBenchmark(unittest.TestCase):
+    """Per-turn CPU time and peak allocation of the chat body, run with: pytest -s tests/benchmarks/request_benchmark.py"""
+
+    def test_per_turn_cost(self):
+        prompt = chat_history(40)
+        montage = os.urandom(MONTAGE_BYTES)
+        self.assertEqual(len(legacy_body(prompt, montage)), streamed_body(prompt, montage))
+
+        legacy_cpu, legacy_peak = measure(legacy_body, prompt, montage)
+        streamed_cpu, streamed_peak = measure(streamed_body, prompt, montage)
+        print(f"\nchat body with a {MONTAGE_BYTES // 1024}KB montage: "
+              f"legacy {legacy_cpu * 1000:.2f}ms cpu, {legacy_peak / 1024:.0f}KB peak; "
+              f"streamed {streamed_cpu * 1000:.2f}ms cpu, {streamed_peak / 1024:.0f}KB peak")
+        self.assertLess(streamed_peak, legacy_peak / 4)
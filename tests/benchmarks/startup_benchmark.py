@@ -0,0 +1,85 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+import server
+from frame_store import FrameStore
+from montage import MontageBuilder
+from supervisor import Checkpointer
+from telemetry import TELEMETRY
+from tests.fakes import FakeMJPEGServer, FakeOllamaServer, VirtualLSCSerial, make_jpeg
+
+
+LATENCY = float(os.environ.get("STARTUP_BENCHMARK_LATENCY", 0.5))  # seconds before each Ollama reply, warm-up included
+BOOT = float(os.environ.get("STARTUP_BENCHMARK_BOOT", 0.3))  # seconds the servo controller ignores the port
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "src")
+
+
+def import_seconds(modules: str) -> float:
+    script = f"import time; started = time.perf_counter(); import {modules}; print(time.perf_counter() - started)"
+    output = subprocess.run([sys.executable, "-c", script], cwd=SRC, capture_output=True, text=True, check=True)
+    return float(output.stdout)
+
+
+def first_command() -> float:
+    """Seconds from calling run() to the first servo move reaching a controller that takes BOOT to come up."""
+    device = VirtualLSCSerial()
+    booted = time.monotonic() + BOOT
+    respond = device.responder
+    device.responder = lambda data: respond(data) if time.monotonic() > booted else b""
+    replies = ["{}", json.dumps({"message": "", "tool_calls": [{"servo_id": 2, "position": 900}]}),
+               json.dumps({"message": "", "tool_calls": []})]
+    with FakeOllamaServer(replies, latency=LATENCY) as ollama, \
+            FakeMJPEGServer([make_jpeg((200, 10, 10))], fps=30) as camera:
+        server.WEBCAM_URL = camera.url
+        server.OLLAMA_URL = ollama.chat_url
+        server.SERIAL_PORT = "/dev/ttyUSB0"
+        server.FRAME_HISTORY = FrameStore(capacity=4)
+        server.MONTAGE = MontageBuilder()
+        server.CHECKPOINTER = Checkpointer()
+        write = device.write
+        started = time.monotonic()
+        times = []
+
+        def timed_write(data):
+            written = write(data)
+            if device.moves and not times:
+                times.append(time.monotonic() - started)
+            return written
+
+        device.write = timed_write
+        with patch("serial.Serial", return_value=device), patch("sys.stdin", io.StringIO("")), \
+                patch("sys.stdout", io.StringIO()):
+            try:
+                server.run(headless=True)
+            except SystemExit:
+                pass
+    return times[0]
+
+
+class StartupBenchmark(unittest.TestCase):
+    """Import time and time to the first servo command, run with: pytest -s tests/benchmarks/startup_benchmark.py"""
+
+    def test_import(self):
+        lean = import_seconds("server")
+        audio = import_seconds("server, pyttsx3, speech_recognition, listener")
+        print(f"\nimport server: {lean * 1000:.0f}ms, with the audio stack {audio * 1000:.0f}ms")
+
+    def test_time_to_first_command(self):
+        TELEMETRY.reset()
+        seconds = first_command()
+        startup = TELEMETRY.summary()["startup"]["p50_ms"]
+        ready = TELEMETRY.summary()["serial.ready"]["p50_ms"]
+        print(f"\nheadless, model load {LATENCY}s, controller boot {BOOT}s: started in {startup:.0f}ms "
+              f"(serial ready {ready:.0f}ms), first command after {seconds:.2f}s")
+        # devices come up while the model loads, and nothing waits out a fixed 2s serial settle time
+        self.assertLess(seconds, 2 * LATENCY + BOOT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import time
+import unittest
+
+import ollama
+from lsc_servo_client import LSCServoController
+from response_validator import ResponseValidator, compile_schema, schema_errors
+from tests.test_response_validator import load_corpus
+
+
+ROUNDS = 2000
+
+class ValidatorBenchmark(unittest.TestCase):
+    """Reply validation throughput over tests/data/replies.jsonl, run with: pytest -s tests/benchmarks/validator_benchmark.py"""
+
+    def test_throughput(self):
+        corpus = [entry["content"] for entry in load_corpus()]
+        parsed = [entry["expected"] for entry in load_corpus() if "expected" in entry]
+        validator = ResponseValidator(limits=LSCServoController.SERVO_LIMITS)
+        check = compile_schema(ollama.FORMAT)
+
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            for value in parsed:
+                schema_errors(value, ollama.FORMAT)
+        interpreted_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            for value in parsed:
+                check(value)
+        compiled_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            for content in corpus:
+                try:
+                    json.loads(content)
+                except ValueError:
+                    pass
+        loads_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            for content in corpus:
+                validator.parse(content)
+        parse_time = time.perf_counter() - start
+
+        checks = ROUNDS * len(parsed)
+        replies = ROUNDS * len(corpus)
+        print(f"\nschema checks: walking the schema {checks / interpreted_time:,.0f}/s, compiled {checks / compiled_time:,.0f}/s; "
+              f"{len(corpus)} corpus replies: json.loads {replies / loads_time:,.0f}/s, "
+              f"parse and repair {replies / parse_time:,.0f}/s ({parse_time / replies * 1e6:.1f}us each)")
+        self.assertLess(compiled_time, interpreted_time)
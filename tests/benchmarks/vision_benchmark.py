@@ -0,0 +1,71 @@
+import os
+import random
+import time
+import unittest
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from session_recorder import load_session
+from vision import SceneAnalyzer
+
+
+# a session recorded with SESSION_RECORD_PATH, otherwise synthetic frames of bricks on a noisy table
+SESSION = os.environ.get("VISION_BENCHMARK_SESSION")
+FRAMES = 100
+# per frame on one CPU core, decoding included
+BUDGET_MS = 10
+
+
+def synthetic_frames(count: int, size=(640, 480)):
+    rng = random.Random(0)
+    noise = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        table = np.clip(noise.normal(115, 12, (size[1], size[0], 3)), 0, 255).astype(np.uint8)
+        image = Image.fromarray(table)
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.randint(1, 6)):
+            left, top = rng.randrange(size[0] - 80), rng.randrange(size[1] - 80)
+            color = rng.choice([(210, 40, 30), (40, 170, 60), (30, 70, 210), (230, 200, 30)])
+            draw.rectangle((left, top, left + rng.randint(20, 80), top + rng.randint(20, 80)), fill=color)
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=75)
+        frames.append(buffer.getvalue())
+    return frames
+
+
+class VisionBenchmark(unittest.TestCase):
+    """Scene analysis per frame, run with: pytest -s tests/benchmarks/vision_benchmark.py"""
+
+    def test_per_frame_cost(self):
+        frames = load_session(SESSION).frames if SESSION else synthetic_frames(FRAMES)
+        analyzer = SceneAnalyzer(pincer_region=(0.4, 0.6, 0.6, 0.8))
+        analyzer.analyse(frames[0])  # warm-up
+
+        timings = {"decode": [], "segment": [], "blobs": [], "total": []}
+        blobs = 0
+        for jpeg in frames:
+            start = time.perf_counter()
+            hsv = analyzer.decode(jpeg)
+            decoded = time.perf_counter()
+            classes = analyzer.segment(hsv)
+            segmented = time.perf_counter()
+            blobs += len(analyzer.find_blobs(classes))
+            analyzer.pincer(classes)
+            done = time.perf_counter()
+            for name, seconds in (("decode", decoded - start), ("segment", segmented - decoded),
+                                  ("blobs", done - segmented), ("total", done - start)):
+                timings[name].append(seconds * 1000)
+
+        source = SESSION or "synthetic 640x480"
+        print(f"\nvision on {len(frames)} frames ({source}), {blobs / len(frames):.1f} blobs per frame:")
+        for name, samples in timings.items():
+            print(f"  {name:8} mean {np.mean(samples):.2f}ms p50 {np.percentile(samples, 50):.2f}ms "
+                  f"p95 {np.percentile(samples, 95):.2f}ms")
+        self.assertLess(np.percentile(timings["total"], 50), BUDGET_MS)
+
+
+if __name__ == "__main__":
+    unittest.main()
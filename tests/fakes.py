@@ -0,0 +1,440 @@
+import json
+import socket
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import speech_recognition as sr
+from PIL import Image
+
+import lsc_codec
+from lsc_servo_client import FrameParser, LSCServoController
+
+
+def make_fake_jpeg(payload: bytes) -> bytes:
+    """Bytes framed like a JPEG (SOI ... EOI), enough for stream parsing tests."""
+    return b"\xff\xd8" + payload + b"\xff\xd9"
+
+
+def make_jpeg(color: Tuple[int, int, int], size: Tuple[int, int] = (640, 480)) -> bytes:
+    """A real, decodable JPEG of a single colour."""
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class StubHTTPServer:
+    """Runs a BaseHTTPRequestHandler subclass on a random local port in a background thread."""
+
+    def __init__(self, handler_class):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.stopping = threading.Event()
+        self.requests = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:%d" % self.httpd.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _MJPEGHandler(_QuietHandler):
+    def do_GET(self):
+        stub = self.server.stub
+        stub.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace;boundary=" + stub.BOUNDARY)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        index = 0
+        try:
+            while not stub.stopping.is_set():
+                frame = stub.frames[index % len(stub.frames)]
+                part = b"\r\n--" + stub.BOUNDARY.encode() + b"\r\nContent-Type: image/jpeg\r\n"
+                if stub.content_length:
+                    part += b"Content-Length: %d\r\n" % len(frame)
+                self.wfile.write(part + b"\r\n" + frame)
+                self.wfile.flush()
+                index += 1
+                if stub.max_frames and index >= stub.max_frames:
+                    break
+                time.sleep(1.0 / stub.fps)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+
+class FakeMJPEGServer(StubHTTPServer):
+    """Mimics the ESP32-CAM web server: an endless multipart/x-mixed-replace JPEG stream."""
+
+    BOUNDARY = "123456789000000000000987654321"
+
+    def __init__(self, frames: List[bytes], fps: float = 50, content_length: bool = True, max_frames: int = 0):
+        super().__init__(_MJPEGHandler)
+        self.frames = frames
+        self.fps = fps
+        self.content_length = content_length
+        self.max_frames = max_frames
+
+
+def ollama_reply(content: str, **timings) -> Dict:
+    """A non-streamed /api/chat response body."""
+    reply = {
+        "model": "llama3.2-vision",
+        "message": {"role": "assistant", "content": content},
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": 0,
+        "load_duration": 0,
+        "prompt_eval_count": 0,
+        "prompt_eval_duration": 0,
+        "eval_count": 0,
+        "eval_duration": 0,
+    }
+    reply.update(timings)
+    return reply
+
+
+def ollama_stream_chunks(content: str, piece_size: int = 4, **timings) -> List[Dict]:
+    """The NDJSON chunks Ollama streams for content, split into token-sized pieces."""
+    chunks = [{"model": "llama3.2-vision", "message": {"role": "assistant", "content": content[i:i + piece_size]},
+               "done": False} for i in range(0, len(content), piece_size)]
+    final = ollama_reply("", **timings)
+    chunks.append(final)
+    return chunks
+
+
+def load_recorded_stream(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class _OllamaHandler(_QuietHandler):
+    def setup(self):
+        super().setup()
+        with self.server.stub.lock:
+            self.server.stub.connections += 1
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with stub.lock:
+            fault = stub.faults.pop(0) if stub.faults else None
+        if fault is not None and self._inject(fault):
+            return
+        with stub.lock:
+            stub.received.append(body)
+            reply = stub.replies[min(stub.requests, len(stub.replies) - 1)]
+            stub.requests += 1
+        if isinstance(reply, list):
+            # recorded replies carry the seconds after the request each chunk arrived
+            timed = [item if isinstance(item, (tuple, list)) else (0, item) for item in reply]
+            chunks = [chunk for after, chunk in timed]
+            content = "".join(chunk["message"]["content"] for chunk in chunks)
+        else:
+            timed = [(0, chunk) for chunk in ollama_stream_chunks(reply, stub.piece_size)]
+            content = reply
+        start = time.monotonic()
+        time.sleep(stub.latency)
+        try:
+            if body.get("stream"):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for after, chunk in timed:
+                    time.sleep(max(0, start + after - time.monotonic()))
+                    self.wfile.write(json.dumps(chunk).encode() + b"\n")
+                    self.wfile.flush()
+                    time.sleep(stub.chunk_delay)
+                self.close_connection = True
+            else:
+                time.sleep(max(0, start + timed[-1][0] - time.monotonic()))
+                data = json.dumps(ollama_reply(content)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+    def _inject(self, fault) -> bool:
+        """Misbehaves as fault says, True if the request gets no normal reply."""
+        if fault == "reset":
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return True
+        if isinstance(fault, int):  # HTTP status
+            data = b'{"error": "injected"}'
+            self.send_response(fault)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return True
+        if isinstance(fault, float):  # stall for this many seconds, then answer normally
+            time.sleep(fault)
+        return False
+
+
+class FakeOllamaServer(StubHTTPServer):
+    """
+    Stub /api/chat endpoint answering with canned replies in order (the last one repeats).
+    A reply is either the content string or a recorded list of stream chunks, optionally as
+    (seconds after the request, chunk) pairs to replay the original timing.
+    faults are used up one per request before any reply: "reset" drops the connection, an int answers
+    with that HTTP status, a float stalls that many seconds first, None behaves.
+    """
+
+    def __init__(self, replies: List, latency: float = 0, chunk_delay: float = 0, piece_size: int = 4,
+                 faults: Sequence = ()):
+        super().__init__(_OllamaHandler)
+        self.faults = list(faults)
+        self.connections = 0
+        self.replies = replies
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.piece_size = piece_size
+        self.received: List[Dict] = []
+        self.lock = threading.Lock()
+
+    @property
+    def chat_url(self) -> str:
+        return self.url + "/api/chat"
+
+
+class _OpenAIHandler(_OllamaHandler):
+    def do_POST(self):
+        stub = self.server.stub
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with stub.lock:
+            fault = stub.faults.pop(0) if stub.faults else None
+        if fault is not None and self._inject(fault):
+            return
+        with stub.lock:
+            stub.received.append(body)
+            content = stub.replies[min(stub.requests, len(stub.replies) - 1)]
+            stub.requests += 1
+        time.sleep(stub.latency)
+        data = json.dumps({"model": body.get("model"), "object": "chat.completion",
+                           "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                        "finish_reason": "stop"}],
+                           "usage": {"prompt_tokens": 0, "completion_tokens": 0}}).encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class FakeOpenAIServer(FakeOllamaServer):
+    """Stub OpenAI-compatible /v1/chat/completions endpoint, answering with the content strings in replies."""
+
+    def __init__(self, replies: List[str], latency: float = 0, faults: Sequence = ()):
+        super().__init__(replies, latency=latency, faults=faults)
+        self.httpd.RequestHandlerClass = _OpenAIHandler
+
+    @property
+    def chat_url(self) -> str:
+        return self.url + "/v1/chat/completions"
+
+
+class FakeSerial:
+    """
+    pyserial stand-in that delivers incoming bytes in arbitrary fragments, the way a real port may.
+    responder(written_bytes) returns bytes the device would send back; without one it acts as a loopback.
+    """
+
+    def __init__(self, incoming: bytes = b"", fragments: Sequence[int] = (64,), responder=None, timeout: float = 3):
+        self.incoming = bytearray(incoming)
+        self.fragments = list(fragments)
+        self.responder = responder if responder is not None else (lambda data: data)
+        self.timeout = timeout
+        self.write_timeout = timeout
+        self.written = bytearray()
+        self.writes: List[bytes] = []
+        self.is_open = True
+        self._reads = 0
+        self._lock = threading.Condition()
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.incoming)
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.written += data
+        self.writes.append(data)
+        self.feed(self.responder(data) or b"")
+        return len(data)
+
+    def feed(self, data: bytes):
+        with self._lock:
+            self.incoming += data
+            self._lock.notify_all()
+
+    def read(self, size: int = 1) -> bytes:
+        with self._lock:
+            self._lock.wait_for(lambda: self.incoming, self.timeout)
+            fragment = self.fragments[self._reads % len(self.fragments)]
+            self._reads += 1
+            data = bytes(self.incoming[:min(size, fragment)])
+            del self.incoming[:len(data)]
+            return data
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self.incoming.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+class VirtualLSCSerial(FakeSerial):
+    """
+    A FakeSerial wired to a simulated LSC controller: moves update the servo positions, battery and
+    position reads are answered, and writes take as long as they would at the controller's baud rate.
+    """
+
+    def __init__(self, positions: Optional[Dict[int, int]] = None, battery_mv: int = 7400,
+                 baud_rate: int = LSCServoController.BAUD_RATE, **kwargs):
+        super().__init__(responder=self.respond, **kwargs)
+        self.positions = dict(positions or {servo_id: (low + high) // 2
+                                            for servo_id, (low, high) in LSCServoController.SERVO_LIMITS.items()})
+        self.battery_mv = battery_mv
+        self.baud_rate = baud_rate
+        self.moves: List[Tuple[int, Dict[int, int]]] = []
+        self.parser = FrameParser()
+
+    def write(self, data) -> int:
+        if self.baud_rate:
+            time.sleep(len(data) * 10 / self.baud_rate)  # 8N1
+        return super().write(data)
+
+    def respond(self, data: bytes) -> bytes:
+        replies = b""
+        for command, params in self.parser.feed(data):
+            if command == lsc_codec.CMD_SERVO_MOVE:
+                time_ms, positions = lsc_codec.decode_servo_move(params)
+                self.moves.append((time_ms, positions))
+                self.positions.update(positions)
+            elif command == lsc_codec.CMD_GET_BATTERY_VOLTAGE:
+                replies += lsc_codec.encode_packet(command, list(lsc_codec.U16.pack(self.battery_mv)))
+            elif command == lsc_codec.CMD_MULT_SERVO_POS_READ:
+                reply = [params[0]]
+                for servo_id in lsc_codec.decode_servo_ids(params):
+                    position = self.positions.get(servo_id, 0)
+                    reply += [servo_id, position >> 8, position & 0xFF]
+                replies += lsc_codec.encode_packet(command, reply)
+        return replies
+
+
+def make_wav(path: str, parts: Sequence[Tuple[float, Optional[float]]], sample_rate: int = 16000,
+             noise: float = 100, tone: float = 3000, seed: int = 0):
+    """
+    A mono 16 bit WAV of (seconds, frequency) parts over background noise of the given RMS; a frequency of
+    None is noise only, a number adds a sine of that frequency standing in for speech.
+    """
+    rng = np.random.default_rng(seed)
+    pieces = []
+    for seconds, frequency in parts:
+        t = np.arange(round(seconds * sample_rate)) / sample_rate
+        piece = rng.normal(0, noise, len(t))
+        if frequency is not None:
+            piece += tone * np.sin(2 * np.pi * frequency * t)
+        pieces.append(piece)
+    samples = np.clip(np.concatenate(pieces), -32768, 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+
+
+class _WavStream:
+    def __init__(self, data: bytes, sample_width: int, realtime: bool, sample_rate: int):
+        self.data = data
+        self.sample_width = sample_width
+        self.realtime = realtime
+        self.sample_rate = sample_rate
+        self.position = 0
+
+    def read(self, size: int) -> bytes:
+        chunk = self.data[self.position:self.position + size * self.sample_width]
+        self.position += len(chunk)
+        if self.realtime and chunk:
+            time.sleep(size / self.sample_rate)
+        return chunk
+
+    def close(self):
+        pass
+
+
+class FakeMicrophone(sr.AudioSource):
+    """
+    Plays mono 16 bit WAV files, one after the other, as a speech_recognition microphone would deliver them;
+    reads return b"" once they have all been played. Played as fast as they are read unless realtime.
+    """
+
+    def __init__(self, *paths: str, chunk_size: int = 512, realtime: bool = False):
+        self.paths = paths
+        self.CHUNK = chunk_size
+        self.realtime = realtime
+        self.SAMPLE_RATE = None
+        self.SAMPLE_WIDTH = None
+        self.stream = None
+        self.opened = 0
+
+    def __enter__(self):
+        data = []
+        for path in self.paths:
+            with wave.open(path, "rb") as f:
+                if f.getnchannels() != 1:
+                    raise ValueError(f"{path} is not mono")
+                self.SAMPLE_RATE, self.SAMPLE_WIDTH = f.getframerate(), f.getsampwidth()
+                data.append(f.readframes(f.getnframes()))
+        self.stream = _WavStream(b"".join(data), self.SAMPLE_WIDTH, self.realtime, self.SAMPLE_RATE)
+        self.opened += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.stream = None
@@ -15,19 +15,19 @@ class TestLSCServoControllerSystem(unittest.TestCase):
         cls.controller = LSCServoController(SERIAL_PORT)
         time.sleep(2)  # Allow time for initialization
 
-    # def test_get_battery_voltage(self):
-    #     """Test retrieving battery voltage."""
-    #     # Arrange
-    #     expected_min_voltage = 1000  # Assuming minimum operational voltage is 6V
-    #     expected_max_voltage = 9000  # Assuming max is 9V
-
-    #     # Act
-    #     voltage = self.controller.get_battery_voltage()
-
-    #     # Assert
-    #     self.assertGreaterEqual(voltage, expected_min_voltage, "Voltage too low!")
-    #     self.assertLessEqual(voltage, expected_max_voltage, "Voltage too high!")
-    #     print(f"Battery Voltage: {voltage} mV")
+    def test_get_battery_voltage(self):
+        """Test retrieving battery voltage."""
+        # Arrange
+        expected_min_voltage = 1000  # Assuming minimum operational voltage is 6V
+        expected_max_voltage = 9000  # Assuming max is 9V
+
+        # Act
+        voltage = self.controller.get_battery_voltage()
+
+        # Assert
+        self.assertGreaterEqual(voltage, expected_min_voltage, "Voltage too low!")
+        self.assertLessEqual(voltage, expected_max_voltage, "Voltage too high!")
+        print(f"Battery Voltage: {voltage} mV")
 
     def test_move_servos(self):
         for servo_id in range(1, 6):
@@ -0,0 +1,91 @@
+import unittest
+
+from camera import MJPEGGrabber, MJPEGParser
+from tests.fakes import FakeMJPEGServer, make_fake_jpeg
+
+
+def build_stream(frames, content_length=True):
+    stream = b""
+    for frame in frames:
+        stream += b"\r\n--boundary\r\nContent-Type: image/jpeg\r\n"
+        if content_length:
+            stream += b"Content-Length: %d\r\n" % len(frame)
+        stream += b"\r\n" + frame
+    return stream
+
+
+class TestMJPEGParser(unittest.TestCase):
+    def setUp(self):
+        # the second frame deliberately contains an EOI marker inside its payload
+        self.frames = [make_fake_jpeg(b"first"), make_fake_jpeg(b"sec\xff\xd9ond"), make_fake_jpeg(b"third")]
+
+    def feed_in_pieces(self, stream, size):
+        parser = MJPEGParser()
+        frames = []
+        for i in range(0, len(stream), size):
+            frames.extend(parser.feed(stream[i:i + size]))
+        return frames
+
+    def test_content_length_frames(self):
+        """Frames delimited by Content-Length survive any fragmentation."""
+        stream = build_stream(self.frames)
+        for size in (1, 3, 7, 1024):
+            with self.subTest(size=size):
+                self.assertEqual(self.feed_in_pieces(stream, size), self.frames)
+
+    def test_end_marker_frames(self):
+        """Without Content-Length the JPEG end marker delimits the frame."""
+        frames = [make_fake_jpeg(b"a" * 50), make_fake_jpeg(b"b" * 3)]
+        stream = build_stream(frames, content_length=False)
+        for size in (1, 2, 5, 1024):
+            with self.subTest(size=size):
+                self.assertEqual(self.feed_in_pieces(stream, size), frames)
+
+    def test_non_jpeg_part_dropped(self):
+        """Parts that do not start with a JPEG SOI marker are skipped."""
+        stream = build_stream([b"garbage", self.frames[0]])
+        self.assertEqual(MJPEGParser().feed(stream), [self.frames[0]])
+
+
+class TestMJPEGGrabber(unittest.TestCase):
+    def setUp(self):
+        self.frames = [make_fake_jpeg(bytes([i]) * 100) for i in range(10)]
+        self.server = FakeMJPEGServer(self.frames).start()
+        self.grabber = MJPEGGrabber(self.server.url, ring_size=3, reconnect_delay=0.05)
+
+    def tearDown(self):
+        self.grabber.stop()
+        self.server.stop()
+
+    def test_latest_without_stream(self):
+        """latest() never blocks and returns None until a frame arrives."""
+        self.assertIsNone(self.grabber.latest())
+
+    def test_streams_frames_over_one_connection(self):
+        """Frames are published from a single persistent connection into a bounded ring."""
+        self.grabber.start()
+        frame = self.grabber.wait_for_frame(after_seq=5, timeout=5)
+        self.assertIsNotNone(frame)
+        self.assertIn(frame.jpeg, self.frames)
+        self.assertEqual(len(self.grabber.ring), 3)
+        self.assertEqual(self.grabber.latest().seq, self.grabber.seq)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_reconnects_after_stream_ends(self):
+        """A stream that ends is reopened."""
+        self.server.max_frames = 2
+        self.grabber.start()
+        self.assertIsNotNone(self.grabber.wait_for_frame(after_seq=4, timeout=5))
+        self.assertGreaterEqual(self.grabber.connections, 2)
+
+    def test_stale_frame(self):
+        """A max_age filter hides frames that are too old."""
+        self.grabber.start()
+        self.grabber.wait_for_frame(timeout=5)
+        self.grabber.stop()
+        self.assertIsNotNone(self.grabber.latest())
+        self.assertIsNone(self.grabber.latest(max_age=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
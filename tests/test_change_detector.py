@@ -0,0 +1,56 @@
+import json
+import os
+import unittest
+
+from change_detector import ChangeDetector
+from tests.fakes import make_jpeg
+
+
+PAIRS = os.path.join(os.path.dirname(__file__), "data", "frame_pairs")
+
+
+def load_pair(name):
+    frames = []
+    for side in ("before", "after"):
+        with open(os.path.join(PAIRS, f"{name}_{side}.jpg"), "rb") as f:
+            frames.append(f.read())
+    return frames
+
+
+class TestChangeDetector(unittest.TestCase):
+    def setUp(self):
+        self.detector = ChangeDetector()
+
+    def test_recorded_pairs(self):
+        """Sensor noise, exposure drift and re-encoding are ignored, arm and object movement are not."""
+        with open(os.path.join(PAIRS, "manifest.json")) as f:
+            manifest = json.load(f)
+        for name, changed in manifest.items():
+            with self.subTest(name):
+                decision = self.detector.compare(*load_pair(name))
+                self.assertEqual(decision.changed, changed, decision)
+
+    def test_threshold_configurable(self):
+        """A coarser threshold lets small changes through as unchanged."""
+        before, after = load_pair("gripper_closed")
+        self.assertTrue(self.detector.compare(before, after).changed)
+        self.assertFalse(ChangeDetector(threshold=0.01).compare(before, after).changed)
+
+    def test_keyed_frames_decoded_once(self):
+        """Frames compared by key are only loaded the first time."""
+        before, after = load_pair("arm_rotated")
+        frames = {0: make_jpeg((10, 10, 10)), 1: before, 2: after}
+        loads = []
+
+        def load(key):
+            loads.append(key)
+            return frames[key]
+
+        self.assertFalse(self.detector.compare_keys(0, 0, load).changed)
+        self.assertTrue(self.detector.compare_keys(1, 2, load).changed)
+        self.assertFalse(self.detector.compare_keys(2, 2, load).changed)
+        self.assertEqual(loads, [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import unittest
+
+import prompts
+from context import ChatContext, DropOldestPolicy, SummarizePolicy, estimate_tokens
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(summary):
+    return {"role": "assistant", "content": json.dumps({"message": summary, "tool_calls": []})}
+
+
+class FakeChatBackend:
+    """Stands in for an Ollama summarisation call."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, messages, digest):
+        self.calls.append((list(messages), digest))
+        if self.fail:
+            raise ConnectionError("backend down")
+        return f"summary {len(self.calls)}"
+
+
+# room for roughly ten turns on top of the pinned preamble
+BUDGET = estimate_tokens(user(prompts.START)) + 400
+
+
+def session(turns):
+    messages = [user(prompts.START)]
+    for i in range(turns):
+        messages.append(user(prompts.CONTINUE))
+        messages.append(assistant(f"moved servo {i}"))
+    return messages
+
+
+class TestChatContext(unittest.TestCase):
+    def test_under_budget_untouched(self):
+        """Nothing happens while the history fits."""
+        messages = session(2)
+        before = list(messages)
+        self.assertFalse(ChatContext(max_tokens=10000).compact(messages))
+        self.assertEqual(messages, before)
+
+    def test_compaction_keeps_preamble_and_recent(self):
+        """Old turns are dropped, the START preamble and the most recent turns stay."""
+        messages = session(50)
+        context = ChatContext(max_tokens=BUDGET, keep_recent=4)
+        self.assertTrue(context.compact(messages))
+        self.assertEqual(messages[0]["content"], prompts.START)
+        self.assertEqual(messages[1]["role"], "system")
+        self.assertTrue(messages[1]["content"].startswith(prompts.DIGEST))
+        self.assertEqual(messages[2]["role"], "user")
+        self.assertEqual(messages[-1], assistant("moved servo 49"))
+        self.assertLessEqual(context.tokens(messages), context.max_tokens)
+
+    def test_budget_stays_flat_over_long_run(self):
+        """Repeated turns never grow the history past the budget."""
+        context = ChatContext(max_tokens=BUDGET)
+        messages = [user(prompts.START)]
+        for i in range(500):
+            messages.append(user(prompts.CONTINUE))
+            context.compact(messages)
+            messages.append(assistant(f"turn {i}"))
+        self.assertLessEqual(context.tokens(messages), context.max_tokens + estimate_tokens(messages[-1]))
+        self.assertEqual(messages[0]["content"], prompts.START)
+        self.assertEqual(sum(1 for m in messages if m["role"] == "system"), 1)
+
+    def test_drop_oldest_digest_is_bounded(self):
+        """The rolling digest keeps the newest summaries within its token limit."""
+        policy = DropOldestPolicy(max_digest_tokens=10)
+        digest = policy.fold([assistant("first action"), user("x"), assistant("second action")], "")
+        self.assertEqual(digest, "- first action\n- second action")
+        digest = policy.fold([assistant("a much longer third action description")], digest)
+        self.assertNotIn("first action", digest)
+        self.assertTrue(digest.endswith("third action description"))
+
+    def test_summarize_policy_uses_backend(self):
+        """A pluggable policy can summarise dropped turns with a chat backend."""
+        backend = FakeChatBackend()
+        context = ChatContext(max_tokens=BUDGET, policy=SummarizePolicy(backend))
+        messages = session(50)
+        context.compact(messages)
+        messages.extend(session(50)[1:])
+        context.compact(messages)
+        self.assertEqual(len(backend.calls), 2)
+        self.assertEqual(backend.calls[1][1], "summary 1")
+        self.assertEqual(messages[1]["content"], prompts.DIGEST + "summary 2")
+
+    def test_summarize_policy_falls_back(self):
+        """A failing backend does not lose the dropped turns' summaries."""
+        context = ChatContext(max_tokens=BUDGET, policy=SummarizePolicy(FakeChatBackend(fail=True)))
+        messages = session(50)
+        context.compact(messages)
+        self.assertIn("- moved servo 0", messages[1]["content"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+from frame_store import FrameStore
+from tests.fakes import make_fake_jpeg
+
+
+def frame(i):
+    return make_fake_jpeg(b"frame-%d" % i)
+
+
+class TestFrameStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "frames.seg")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_memory_tier_is_bounded(self):
+        """Only the last capacity frames stay in memory."""
+        store = FrameStore(capacity=3)
+        for i in range(10):
+            self.assertEqual(store.append(frame(i)), i)
+        self.assertEqual(len(store), 10)
+        self.assertEqual(len(store.frames), 3)
+        self.assertEqual(store.latest(4), [frame(7), frame(8), frame(9)])
+        self.assertEqual(list(store.last_indices(4)), [7, 8, 9])
+        self.assertEqual(store.get(-1), frame(9))
+        with self.assertRaises(IndexError):
+            store.get(2)
+
+    def test_spilled_frames_readable(self):
+        """Evicted frames are appended to the segment file and read back."""
+        store = FrameStore(capacity=2, spill_path=self.path)
+        for i in range(6):
+            store.append(frame(i))
+        self.assertEqual(len(store.frames), 2)
+        self.assertEqual([store.get(i) for i in range(6)], [frame(i) for i in range(6)])
+        store.append(frame(6))
+        self.assertEqual(store.get(4), frame(4))
+        self.assertEqual(list(store.replay(3)), [(i, frame(i)) for i in range(3, 7)])
+        store.close()
+        self.assertEqual(os.path.getsize(self.path), sum(len(frame(i)) for i in range(5)))
+
+    def test_reopen_segment(self):
+        """A reopened segment replays earlier frames and numbers new ones after them."""
+        store = FrameStore(capacity=1, spill_path=self.path)
+        for i in range(4):
+            store.append(frame(i))
+        store.close()
+
+        reopened = FrameStore(capacity=1, spill_path=self.path)
+        self.assertEqual(len(reopened), 3)
+        self.assertEqual(reopened.append(frame(10)), 3)
+        self.assertEqual([data for _, data in reopened.replay()], [frame(0), frame(1), frame(2), frame(10)])
+        reopened.close()
+
+    def test_reopen_after_torn_index(self):
+        """A partly written index entry is dropped, so frames spilled after it still read back."""
+        store = FrameStore(capacity=1, spill_path=self.path)
+        for i in range(3):
+            store.append(frame(i))
+        store.close()
+        with open(store.index_path, "ab") as f:
+            f.write(b"\x01\x02\x03")  # a crash mid-entry
+
+        reopened = FrameStore(capacity=1, spill_path=self.path)
+        self.assertEqual(len(reopened), 2)
+        for i in range(10, 13):
+            reopened.append(frame(i))
+        reopened.close()
+
+        again = FrameStore(capacity=1, spill_path=self.path)
+        self.assertEqual(len(again), 4)
+        self.assertEqual([data for _, data in again.replay()], [frame(0), frame(1), frame(10), frame(11)])
+        again.close()
+
+    def test_without_spill_replay_skips_dropped(self):
+        """Without a segment file evicted frames are gone."""
+        store = FrameStore(capacity=2)
+        for i in range(5):
+            store.append(frame(i))
+        self.assertEqual([i for i, _ in store.replay()], [3, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
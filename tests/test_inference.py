@@ -0,0 +1,161 @@
+import base64
+import json
+import time
+import unittest
+
+import requests
+
+import ollama
+from inference import Backend, InferenceRouter, openai_body
+from transport import Endpoint, RetryPolicy
+from tests.fakes import FakeOllamaServer, FakeOpenAIServer
+
+
+MOVE = json.dumps({"message": "moving", "tool_calls": [{"servo_id": 2, "position": 900}]})
+OTHER = json.dumps({"message": "other", "tool_calls": [{"servo_id": 3, "position": 1100}]})
+OUT_OF_RANGE = json.dumps({"message": "too far", "tool_calls": [{"servo_id": 7, "position": 900}]})
+
+
+def backend(name, stub, **kwargs):
+    endpoint = Endpoint(name, retry=RetryPolicy(attempts=1), sleep=lambda seconds: None)
+    return Backend(name, stub.chat_url, endpoint=endpoint, **kwargs)
+
+
+def prompt():
+    body = ollama.build_prompt("llama3.2-vision")
+    body["messages"].append({"role": "user", "content": "Pick up the die"})
+    body["images"] = [b"\xff\xd8jpeg\xff\xd9"]
+    return body
+
+
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.routers = []
+
+    def tearDown(self):
+        for router in self.routers:
+            router.close()
+
+    def router(self, backends, fanout=2):
+        router = InferenceRouter(backends, fanout)
+        self.routers.append(router)
+        return router
+
+    def test_first_answer_wins(self):
+        """The faster backend's reply is used and the slow one is cancelled."""
+        with FakeOllamaServer([OTHER], latency=0.05, chunk_delay=0.05) as slow, FakeOllamaServer([MOVE]) as fast:
+            router = self.router([backend("slow", slow), backend("fast", fast)])
+            started = time.monotonic()
+            reply = router.chat(prompt())
+            elapsed = time.monotonic() - started
+            time.sleep(0.3)
+        self.assertEqual(reply["message"]["content"], MOVE)
+        self.assertEqual(reply["backend"], "fast")
+        self.assertLess(elapsed, 0.5)
+        stats = router.stats()
+        self.assertEqual(stats["fast"]["wins"], 1)
+        self.assertEqual(stats["slow"]["cancelled"], 1)
+        self.assertTrue(slow.received[0]["stream"])
+
+    def test_invalid_reply_loses(self):
+        """A quicker reply that does not match the format is passed over for a valid one."""
+        with FakeOllamaServer([OUT_OF_RANGE]) as fast, FakeOllamaServer(["not json"]) as garbled, \
+                FakeOllamaServer([MOVE], latency=0.1) as slow:
+            router = self.router([backend("fast", fast), backend("garbled", garbled), backend("slow", slow)], fanout=3)
+            reply = router.chat(prompt())
+        self.assertEqual(reply["backend"], "slow")
+        self.assertEqual(router.stats()["fast"]["failures"], 1)
+        self.assertEqual(router.stats()["garbled"]["failures"], 1)
+
+    def test_failed_backend_loses(self):
+        with FakeOllamaServer([MOVE], faults=[500]) as broken, FakeOllamaServer([OTHER], latency=0.1) as working:
+            reply = self.router([backend("broken", broken), backend("working", working)]).chat(prompt())
+        self.assertEqual(reply["message"]["content"], OTHER)
+
+    def test_no_usable_reply(self):
+        """Without a usable reply the unusable one is returned, for the validator to ask again about."""
+        with FakeOllamaServer([OUT_OF_RANGE]) as first, FakeOllamaServer([MOVE], faults=[500]) as second:
+            router = self.router([backend("first", first), backend("second", second)])
+            reply = router.chat(prompt())
+        self.assertEqual(reply["message"]["content"], OUT_OF_RANGE)
+        self.assertEqual(reply["backend"], "first")
+        self.assertEqual(router.stats()["first"]["wins"], 0)
+
+    def test_no_reply(self):
+        with FakeOllamaServer([MOVE], faults=[500]) as first, FakeOllamaServer([MOVE], faults=["reset"] * 2) as second:
+            router = self.router([backend("first", first), backend("second", second)])
+            with self.assertRaises(requests.exceptions.RequestException):
+                router.chat(prompt())
+
+    def test_stream_errors(self):
+        """An error chunk or a stream that stops short fails as a request, like a dropped connection."""
+        started = {"message": {"role": "assistant", "content": "{"}, "done": False}
+        with FakeOllamaServer([[{"error": "model not found"}]]) as first, FakeOllamaServer([[started]]) as second:
+            router = self.router([backend("first", first), backend("second", second)])
+            with self.assertRaises(requests.exceptions.RequestException):
+                router.chat(prompt())
+
+    def test_routing_adapts_to_latency(self):
+        """With a fanout of one each backend is measured once, then the faster one gets the prompts."""
+        with FakeOllamaServer([MOVE], latency=0.2) as slow, FakeOllamaServer([OTHER]) as fast:
+            router = self.router([backend("slow", slow), backend("fast", fast)], fanout=1)
+            winners = [router.chat(prompt())["backend"] for _ in range(5)]
+        self.assertEqual(winners, ["slow", "fast", "fast", "fast", "fast"])
+        self.assertGreater(router.stats()["slow"]["latency_s"], router.stats()["fast"]["latency_s"])
+
+    def test_failing_backend_drops_out(self):
+        """A backend that only ever fails, without a reply to measure, stops being asked first."""
+        with FakeOllamaServer([MOVE], faults=[404] * 5) as broken, FakeOllamaServer([OTHER]) as working:
+            router = self.router([backend("broken", broken), backend("working", working)], fanout=1)
+            with self.assertRaises(Exception):
+                router.chat(prompt())
+            winners = [router.chat(prompt())["backend"] for _ in range(4)]
+        self.assertEqual(winners, ["working"] * 4)
+        self.assertEqual(len(broken.faults), 4)  # asked once
+
+    def test_single_backend_streams_tool_calls(self):
+        calls = []
+        with FakeOllamaServer([MOVE]) as stub:
+            reply = self.router([backend("only", stub)]).chat(prompt(), calls.append)
+        self.assertEqual(calls, json.loads(reply["message"]["content"])["tool_calls"])
+
+    def test_racing_backends_do_not_stream(self):
+        """Tool calls from a reply that may lose the race must not reach the arm."""
+        calls = []
+        with FakeOllamaServer([MOVE]) as first, FakeOllamaServer([OTHER]) as second:
+            self.router([backend("first", first), backend("second", second)]).chat(prompt(), calls.append)
+        self.assertEqual(calls, [])
+
+    def test_open_circuit_skipped(self):
+        with FakeOllamaServer([MOVE]) as down, FakeOllamaServer([OTHER], latency=0.1) as up:
+            tripped = backend("down", down)
+            for _ in range(tripped.endpoint.breaker.failure_threshold):
+                tripped.endpoint.breaker.failure()
+            router = self.router([tripped, backend("up", up)], fanout=1)
+            self.assertEqual(router.chat(prompt())["backend"], "up")
+        self.assertEqual(down.requests, 0)
+
+    def test_openai_backend(self):
+        """OpenAI-compatible endpoints get the images as message parts and answer in Ollama's shape."""
+        with FakeOpenAIServer([MOVE]) as stub:
+            reply = self.router([backend("online", stub, api="openai", model="gpt-4o-mini", api_key="secret")]).chat(prompt())
+        self.assertEqual(reply["message"]["content"], MOVE)
+        self.assertEqual(reply["prompt_eval_duration"], 0)
+        sent = stub.received[0]
+        self.assertEqual(sent["model"], "gpt-4o-mini")
+        self.assertEqual(sent["response_format"]["json_schema"]["schema"], ollama.FORMAT)
+
+
+class TestOpenAIBody(unittest.TestCase):
+    def test_images_become_parts(self):
+        body = openai_body(prompt(), None)
+        parts = body["messages"][-1]["content"]
+        self.assertEqual(parts[0], {"type": "text", "text": "Pick up the die"})
+        encoded = base64.b64encode(b"\xff\xd8jpeg\xff\xd9").decode()
+        self.assertEqual(parts[1]["image_url"]["url"], "data:image/jpeg;base64," + encoded)
+        self.assertEqual(body["model"], "llama3.2-vision")
+        self.assertEqual(body["temperature"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
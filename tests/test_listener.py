@@ -0,0 +1,153 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from typing import List, Optional
+
+import numpy as np
+import speech_recognition as sr
+
+from tests.fakes import FakeMicrophone, make_wav
+from listener import Listener, RecognizerBackend, SpeechRecognitionBackend, frame_energy
+
+WORDS = {440: "pick up the die", 880: "put it down"}
+
+
+class ToneBackend(RecognizerBackend):
+    """Understands a phrase by its loudest frequency."""
+
+    def __init__(self):
+        self.heard: List[float] = []
+
+    def transcribe(self, audio: sr.AudioData) -> Optional[str]:
+        samples = np.frombuffer(audio.get_raw_data(), dtype=np.int16)
+        spectrum = np.abs(np.fft.rfft(samples))
+        frequency = float(np.fft.rfftfreq(len(samples), 1 / audio.sample_rate)[spectrum.argmax()])
+        self.heard.append(len(samples) / audio.sample_rate)
+        return next((text for tone, text in WORDS.items() if abs(frequency - tone) < 10), None)
+
+
+class TestListener(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.calibration_path = os.path.join(self.dir.name, "noise.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def wav(self, name: str, *parts, **kwargs) -> str:
+        path = os.path.join(self.dir.name, name)
+        make_wav(path, parts, **kwargs)
+        return path
+
+    def hear(self, *paths: str, **kwargs) -> Listener:
+        listener = Listener(FakeMicrophone(*paths), kwargs.pop("backend", ToneBackend()), **kwargs).start()
+        listener.join(10)
+        return listener
+
+    @staticmethod
+    def commands(listener: Listener) -> List[str]:
+        commands = []
+        while True:
+            command = listener.get(0)
+            if command is None:
+                return commands
+            commands.append(command)
+
+    def test_phrases_transcribed_in_order(self):
+        """Speech between pauses is cut into phrases and each is transcribed once."""
+        path = self.wav("two.wav", (1.0, None), (0.6, 440), (1.0, None), (0.8, 880), (1.0, None))
+        listener = self.hear(path)
+        self.assertEqual(self.commands(listener), ["pick up the die", "put it down"])
+        self.assertEqual(listener.calibrations, 1)
+        self.assertAlmostEqual(listener.floor, 100, delta=10)
+
+    def test_phrase_keeps_its_start(self):
+        """The pre-roll and the pause are part of the phrase, so the first syllable is not clipped."""
+        backend = ToneBackend()
+        self.hear(self.wav("one.wav", (1.5, None), (0.6, 440), (1.0, None)), backend=backend)
+        self.assertEqual(len(backend.heard), 1)
+        self.assertGreater(backend.heard[0], 0.2 + 0.6 + 0.8)
+
+    def test_calibration_persisted(self):
+        """The noise floor is saved and reused, so speech right at the start is heard on the next run."""
+        self.hear(self.wav("quiet.wav", (1.5, None)), calibration_path=self.calibration_path)
+        with open(self.calibration_path) as f:
+            self.assertAlmostEqual(json.load(f)["floor"], 100, delta=10)
+
+        immediate = self.wav("immediate.wav", (0.6, 440), (1.0, None))
+        listener = self.hear(immediate, calibration_path=self.calibration_path)
+        self.assertEqual(listener.calibrations, 0)
+        self.assertEqual(self.commands(listener), ["pick up the die"])
+
+        # without it the speech is taken for background noise
+        self.assertEqual(self.commands(self.hear(immediate)), [])
+
+    def test_recalibrates_on_drift(self):
+        """A lasting change of background noise moves the floor, without being heard as speech."""
+        louder = self.wav("noise.wav", (6.0, None), noise=220, seed=2)
+        quiet = self.wav("quiet.wav", (1.0, None))
+        listener = self.hear(quiet, louder, self.wav("after.wav", (0.6, 880), (1.0, None), noise=220, seed=3),
+                             calibration_path=self.calibration_path)
+        self.assertEqual(listener.calibrations, 2)
+        self.assertGreater(listener.floor, 150)
+        with open(self.calibration_path) as f:
+            self.assertEqual(json.load(f)["floor"], listener.floor)
+        self.assertEqual(self.commands(listener), ["put it down"])
+
+    def test_muted_audio_dropped(self):
+        """Nothing heard while muted is transcribed, e.g. the robot's own voice."""
+        path = self.wav("two.wav", (1.0, None), (0.6, 440), (1.0, None), (0.6, 880), (1.0, None))
+        listener = Listener(FakeMicrophone(path), ToneBackend(), muted=lambda: 40 <= listener.frames <= 60)
+        listener.start().join(10)
+        self.assertEqual(self.commands(listener), ["put it down"])
+
+    def test_unrecognized_and_long_phrases(self):
+        """Phrases nothing is understood in give no command, and long ones are cut at max_phrase_seconds."""
+        path = self.wav("long.wav", (1.0, None), (0.6, 1000), (1.0, None), (2.5, 440), (1.0, None))
+        listener = self.hear(path, max_phrase_seconds=1.0)
+        self.assertEqual(listener.phrases, 4)
+        self.assertEqual(self.commands(listener), ["pick up the die"] * 3)
+
+    def test_stale_commands_dropped(self):
+        """Commands heard before they were asked for are skipped, later ones are still returned."""
+        first = self.hear(self.wav("one.wav", (1.0, None), (0.6, 440), (1.0, None)))
+        asked = time.monotonic()
+        self.assertIsNone(first.get(0, since=asked))
+        self.assertEqual(first.stale, 1)
+
+        path = self.wav("two.wav", (1.0, None), (0.6, 440), (1.0, None), (0.6, 880), (1.0, None))
+        listener = Listener(FakeMicrophone(path, realtime=True), ToneBackend()).start()
+        try:
+            self.assertEqual(listener.get(5), "pick up the die")
+            self.assertEqual(listener.get(5, since=time.monotonic()), "put it down")
+        finally:
+            listener.stop()
+
+    def test_get_times_out(self):
+        listener = self.hear(self.wav("quiet.wav", (1.5, None)))
+        self.assertIsNone(listener.get(0.01))
+        self.assertFalse(listener.is_alive())
+
+    def test_speech_recognition_backend(self):
+        """speech_recognition engines are looked up by name and not understanding anything is None."""
+        class Recognizer(sr.Recognizer):
+            def recognize_stub(self, audio, language="en"):
+                if language != "de":
+                    raise sr.UnknownValueError()
+                return " hallo "
+
+        audio = sr.AudioData(b"\0\0" * 160, 16000, 2)
+        backend = SpeechRecognitionBackend("stub", Recognizer(), language="de")
+        self.assertEqual(backend.transcribe(audio), "hallo")
+        backend.options = {}
+        self.assertIsNone(backend.transcribe(audio))
+
+    def test_frame_energy(self):
+        self.assertEqual(frame_energy(np.full(64, -300, dtype=np.int16).tobytes()), 300)
+        self.assertEqual(frame_energy(b""), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+import logging
+import unittest
+
+from logs import ColorFormatter
+
+
+class TestColorFormatter(unittest.TestCase):
+    def test_record_left_untouched(self):
+        """Colouring one handler's output does not leak into the record other handlers see."""
+        formatter = ColorFormatter("%(levelname)s %(message)s%(data)s")
+        record = logging.LogRecord("test", logging.WARNING, __file__, 1, "moved", None, None)
+        self.assertEqual(formatter.format(record), "\033[93mWARNING\033[0m moved")
+        self.assertEqual(formatter.format(record), "\033[93mWARNING\033[0m moved")
+        self.assertEqual(record.levelname, "WARNING")
+        self.assertEqual(logging.Formatter("%(levelname)s").format(record), "WARNING")
+
+
+if __name__ == "__main__":
+    unittest.main()
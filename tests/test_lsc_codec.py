@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+
+import lsc_codec
+from lsc_codec import LimitTable, decode, encode_packet, encode_servo_move, encode_servo_moves
+from lsc_servo_client import LSCServoController
+
+
+class TestEncode(unittest.TestCase):
+    def test_servo_move_matches_protocol(self):
+        """A single move encodes exactly like the protocol document's example."""
+        packet = encode_servo_move([2], [2000], 1000)
+        self.assertEqual(packet, bytearray([0x55, 0x55, 8, 3, 1, 0xE8, 0x03, 2, 0xD0, 0x07]))
+        self.assertEqual(packet, encode_packet(3, [1, 0xE8, 0x03, 2, 0xD0, 0x07]))
+
+    def test_buffer_reused(self):
+        """A buffer of the right size is filled in place, a wrong one is replaced."""
+        buffer = encode_servo_move([2, 3], [1500, 1500], 500)
+        self.assertIs(encode_servo_move([4, 5], [900, 2100], 800, out=buffer), buffer)
+        self.assertIsNot(encode_servo_move([4], [900], 800, out=buffer), buffer)
+
+    def test_batch_matches_single(self):
+        """Each row of a batch is the packet encode_servo_move would produce."""
+        ids = [2, 3, 4]
+        positions = np.array([[500 + i, 1500, 2500 - i] for i in range(0, 200, 7)])
+        times = np.arange(len(positions)) * 20 + 20
+        batch = encode_servo_moves(ids, positions, times)
+        for row, position, time_ms in zip(batch, positions.tolist(), times.tolist()):
+            self.assertEqual(row.tobytes(), bytes(encode_servo_move(ids, position, time_ms)))
+
+    def test_round_trip(self):
+        """Every request the controller accepts decodes back to what was encoded."""
+        packets = {
+            lsc_codec.CMD_SERVO_MOVE: ([2, 0xF4, 0x01, 2, 0xDC, 0x05, 6, 0x20, 0x03], (500, {2: 1500, 6: 800})),
+            lsc_codec.CMD_ACTION_GROUP_RUN: ([4, 0x02, 0x01], (4, 258)),
+            lsc_codec.CMD_ACTION_STOP: ([], None),
+            lsc_codec.CMD_ACTION_SPEED: ([4, 50, 0], (4, 50)),
+            lsc_codec.CMD_GET_BATTERY_VOLTAGE: ([], None),
+            lsc_codec.CMD_MULT_SERVO_UNLOAD: ([3, 1, 2, 3], [1, 2, 3]),
+            lsc_codec.CMD_MULT_SERVO_POS_READ: ([2, 1, 6], [1, 6]),
+        }
+        self.assertEqual(set(packets), set(lsc_codec.REQUEST_DECODERS))
+        for command, (params, expected) in packets.items():
+            self.assertEqual(decode(encode_packet(command, params)), (command, expected))
+
+    def test_decode_replies(self):
+        """Battery and position replies decode with the controller's byte order."""
+        self.assertEqual(decode(bytes([0x55, 0x55, 0x04, 0x0F, 0x34, 0x12]), reply=True), (15, 0x1234))
+        self.assertEqual(decode(bytes([0x55, 0x55, 0x06, 0x15, 0x01, 0x02, 0x05, 0xDC]), reply=True), (21, {2: 1500}))
+        with self.assertRaises(ValueError):
+            decode(bytes([0x55, 0x55, 0x05, 0x15, 0x01, 0x02, 0x05]), reply=True)
+
+
+class TestLimitTable(unittest.TestCase):
+    def setUp(self):
+        self.limits = LimitTable(LSCServoController.SERVO_LIMITS)
+
+    def test_both_bounds_enforced(self):
+        """Positions below or above the range and unknown servos are flagged."""
+        mask = self.limits.invalid([1, 1, 1, 2, 7, -1], [1199, 1500, 1801, 2500, 1500, 1500])
+        self.assertEqual(mask.tolist(), [True, False, True, False, True, True])
+
+    def test_validate_batch(self):
+        """A whole trajectory is checked at once and the error names the offenders."""
+        positions = np.full((50, 2), 1500)
+        self.limits.validate([1, 2], positions)
+        positions[30, 0] = 2000
+        with self.assertRaisesRegex(ValueError, "servo 1=2000"):
+            self.limits.validate([1, 2], positions)
+
+    def test_clamp(self):
+        self.assertEqual(self.limits.clamp([1, 2], [2000, 100]).tolist(), [1800, 500])
+
+
+if __name__ == "__main__":
+    unittest.main()
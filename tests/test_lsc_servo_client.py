@@ -1,7 +1,9 @@
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 import serial
-from lsc_servo_client import LSCServoController  # Adjust import as needed
+from lsc_servo_client import FrameParser, LSCServoController  # Adjust import as needed
+from tests.fakes import FakeSerial, VirtualLSCSerial
 
 
 class TestLSCServoController(unittest.TestCase):
@@ -9,7 +11,7 @@ class TestLSCServoController(unittest.TestCase):
     def setUp(self, mock_serial):
         """Setup the mocked serial connection for each test."""
         self.mock_serial_instance = mock_serial.return_value
-        self.controller = LSCServoController("/dev/ttyUSB0")
+        self.controller = LSCServoController("/dev/ttyUSB0", ready_timeout=0)
 
     def test_send_command_success(self):
         """Test if send_command sends the correct data and reads a valid response."""
@@ -28,41 +30,86 @@ class TestLSCServoController(unittest.TestCase):
         """Test move_servo function with a valid response."""
         # Arrange
         self.mock_serial_instance.read.return_value = bytearray([0x55, 0x55])
-        expected_packet = bytearray([0x55, 0x55, 8, 3, 1, 0xE8, 0x03, 1, 0xD0, 0x07])
+        expected_packet = bytearray([0x55, 0x55, 8, 3, 1, 0xE8, 0x03, 2, 0xD0, 0x07])
         self.mock_serial_instance.write.return_value = len(expected_packet)
 
         # Act
-        self.controller.move_servo(1, 2000, 1000)
+        self.controller.move_servo(2, 2000, 1000)
 
         # Assert
         self.mock_serial_instance.write.assert_called_with(expected_packet)
 
-    # def test_get_battery_voltage(self):
-    #     """Test getting battery voltage with a valid response."""
-    #     # Arrange
-    #     self.mock_serial_instance.read.return_value = bytearray([0x55, 0x55, 0x34, 0x12])  # 0x1234 = 4660mV
-    #     self.mock_serial_instance.write.return_value = 4
+    def test_move_servos_outside_limits(self):
+        """Positions past either end of a servo's limits are rejected before anything is sent."""
+        with self.assertRaises(ValueError):
+            self.controller.move_servos([2, 1], [1500, 2000], 1000)
+        with self.assertRaises(ValueError):
+            self.controller.move_servo(1, 1000, 1000)
+        with self.assertRaises(ValueError):
+            self.controller.move_servo(9, 1500, 1000)
+        self.mock_serial_instance.write.assert_not_called()
+
+    def test_get_battery_voltage(self):
+        """Test getting battery voltage with a valid response."""
+        # send: [0x55, 0x55, 0x02, 0x0F]
+        # recv: [0x55, 0x55, 0x04, 0x0F, 0x34, 0x12]
+        # Arrange
+        fake = FakeSerial(responder=lambda data: bytes([0x55, 0x55, 0x04, 0x0F, 0x34, 0x12]), fragments=[1])
+        self.controller.ser = fake
+
+        # Act
+        voltage = self.controller.get_battery_voltage()
+
+        # Assert
+        self.assertEqual(voltage, 4660)  # 0x1234 mV
+        self.assertEqual(fake.writes, [bytes([0x55, 0x55, 0x02, 0x0F])])
 
-    #     # Act
-    #     voltage = self.controller.get_battery_voltage()
+    def test_read_servo_positions(self):
+        """Test reading servo positions for all servos."""
+        # send: [0x55, 0x55, 0x09, 0x15, 0x06, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06]
+        # recv: [0x55, 0x55, 0x15, 0x15, 0x06, 0x01, 0x01, 0xF4, 0x02, 0x01, 0xF4, 0x03, 0x01, 0xF4, 0x04, 0x01, 0xF4, 0x05, 0x01, 0xF4, 0x06, 0x01, 0xF4]
+        # Arrange
+        reply = bytes([0x55, 0x55, 0x15, 0x15, 0x06, 0x01, 0x01, 0xF4, 0x02, 0x01, 0xF4, 0x03, 0x01, 0xF4, 0x04, 0x01, 0xF4, 0x05, 0x01, 0xF4, 0x06, 0x01, 0xF4])
+        expected_positions = {1: 500, 2: 500, 3: 500, 4: 500, 5: 500, 6: 500}
 
-    #     # Assert
-    #     self.assertEqual(voltage, 4660)
+        for fragments in ([1], [2, 5, 3], [64]):
+            with self.subTest(fragments=fragments):
+                fake = FakeSerial(responder=lambda data: reply, fragments=fragments)
+                self.controller.ser = fake
 
-    # def test_read_servo_positions(self):
-    #     """Test reading servo positions for a single servo."""
-    #     # send: [0x55, 0x55, 0x09, 0x15, 0x06, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06]
-    #     # recv: [0x55, 0x55, 0x15, 0x15, 0x06, 0x01, 0x01, 0xF4, 0x02, 0x01, 0xF4, 0x03, 0x01, 0xF4, 0x04, 0x01, 0xF4, 0x05, 0x01, 0xF4, 0x06, 0x01, 0xF4]
-    #     # Arrange
-    #     self.mock_serial_instance.read.return_value = bytearray([0x55, 0x55, 0x15, 0x15, 0x06, 0x01, 0x01, 0xF4, 0x02, 0x01, 0xF4, 0x03, 0x01, 0xF4, 0x04, 0x01, 0xF4, 0x05, 0x01, 0xF4, 0x06, 0x01, 0xF4])
-    #     expected_positions = {1: 500, 2: 500, 3: 500, 4: 500, 5: 500, 6: 500}
-    #     self.mock_serial_instance.write.return_value = 11
+                # Act
+                start = time.monotonic()
+                positions = self.controller.read_servo_positions([1, 2, 3, 4, 5, 6])
 
-    #     # Act
-    #     positions = self.controller.read_servo_positions([1, 2, 3, 4, 5, 6])
+                # Assert
+                self.assertEqual(positions, expected_positions)
+                self.assertLess(time.monotonic() - start, 0.5)
+                self.assertEqual(fake.writes, [bytes([0x55, 0x55, 0x09, 0x15, 0x06, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06])])
 
-    #     # Assert
-    #     self.assertEqual(positions, expected_positions)
+    def test_read_servo_positions_resyncs(self):
+        """Noise and unrelated frames before the reply are skipped."""
+        # Arrange
+        reply = bytes([0x00, 0x55, 0x13, 0x55, 0x55, 0x04, 0x0F, 0x34, 0x12, 0x55, 0x55, 0x06, 0x15, 0x01, 0x02, 0x05, 0xDC])
+        self.controller.ser = FakeSerial(responder=lambda data: reply, fragments=[3])
+
+        # Act
+        positions = self.controller.read_servo_positions([2])
+
+        # Assert
+        self.assertEqual(positions, {2: 1500})
+
+    def test_read_servo_positions_deadline(self):
+        """A partial reply raises once the deadline passes instead of being misparsed."""
+        # Arrange
+        self.controller.ser = FakeSerial(responder=lambda data: bytes([0x55, 0x55, 0x06, 0x15, 0x01]))
+
+        # Act
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            self.controller.read_servo_positions([2], timeout=0.2)
+
+        # Assert
+        self.assertLess(time.monotonic() - start, 1)
 
     def test_unload_servos(self):
         """Test unloading multiple servos with a valid response."""
@@ -84,16 +131,66 @@ class TestLSCServoController(unittest.TestCase):
         # out: 0x55 0x55 0x0B 0x03 0x02 0x20 0x03 0x02 0xB0 0x04 0x090xFC0x08
         # Arrange
         self.mock_serial_instance.read.return_value = bytearray([0x55, 0x55, 0x0B, 0x03, 0x02, 0x20, 0x03, 0x02, 0xB0, 0x04, 0x09, 0xFC, 0x08])
-        expected_packet = bytearray([0x55, 0x55, 0x08, 0x03, 0x01, 0xE8, 0x03, 0x01, 0xD0, 0x07])
+        expected_packet = bytearray([0x55, 0x55, 0x08, 0x03, 0x01, 0xE8, 0x03, 0x02, 0xD0, 0x07])
         self.mock_serial_instance.write.return_value = len(expected_packet)
 
         # Act
-        self.controller.move_servo(1, 2000, 1000)
+        self.controller.move_servo(2, 2000, 1000)
 
         # Assert
         self.mock_serial_instance.write.assert_called_with(expected_packet)
 
 
+class TestReadiness(unittest.TestCase):
+    def open(self, device, **kwargs):
+        with patch("serial.Serial", return_value=device):
+            start = time.monotonic()
+            controller = LSCServoController("/dev/ttyUSB0", **kwargs)
+        return controller, time.monotonic() - start
+
+    def test_ready_when_answering(self):
+        """A controller that answers is used straight away, not after a fixed settle time."""
+        device = VirtualLSCSerial()
+        controller, seconds = self.open(device)
+        self.assertTrue(controller.ready)
+        self.assertLess(seconds, 0.5)
+        self.assertEqual(device.timeout, 3)
+        self.assertEqual(device.writes[0][3], LSCServoController.CMD_MULT_SERVO_POS_READ)
+
+    def test_waits_for_controller(self):
+        """Probes sent while the controller boots go unanswered, the first answer ends the wait."""
+        device = VirtualLSCSerial()
+        booted = time.monotonic() + 0.4
+        respond = device.responder
+        device.responder = lambda data: respond(data) if time.monotonic() > booted else b""
+        controller, seconds = self.open(device)
+        self.assertTrue(controller.ready)
+        self.assertGreater(seconds, 0.4)
+        self.assertLess(seconds, 1)
+
+    def test_silent_controller_used_anyway(self):
+        controller, seconds = self.open(FakeSerial(responder=lambda data: b""), ready_timeout=0.3)
+        self.assertFalse(controller.ready)
+        self.assertAlmostEqual(seconds, 0.3, delta=0.15)
+
+
+class TestFrameParser(unittest.TestCase):
+    def test_fragmented_frames(self):
+        """Frames split at every byte boundary are reassembled."""
+        stream = bytes([0x55, 0x55, 0x04, 0x0F, 0x34, 0x12, 0x55, 0x55, 0x02, 0x07])
+        parser = FrameParser()
+        frames = []
+        for byte in stream:
+            frames.extend(parser.feed(bytes([byte])))
+        self.assertEqual(frames, [(0x0F, bytes([0x34, 0x12])), (0x07, b"")])
+
+    def test_needed(self):
+        """needed() reports how many bytes complete the current frame."""
+        parser = FrameParser()
+        self.assertEqual(parser.needed(), 3)
+        parser.feed(bytes([0x55, 0x55, 0x06, 0x15]))
+        self.assertEqual(parser.needed(), 4)
+
 
 if __name__ == "__main__":
     unittest.main()
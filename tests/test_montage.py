@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from montage import MontageBuilder
+from tests.fakes import make_jpeg
+
+
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
+
+
+def pixel(jpeg, xy):
+    return Image.open(BytesIO(jpeg)).convert("RGB").getpixel(xy)
+
+
+def assert_close(test, actual, expected, tolerance=40):
+    test.assertTrue(all(abs(a - e) <= tolerance for a, e in zip(actual, expected)), f"{actual} != {expected}")
+
+
+class TestMontageBuilder(unittest.TestCase):
+    def setUp(self):
+        self.history = [make_jpeg(color, (64, 48)) for color in COLORS]
+        self.loads = []
+        self.builder = MontageBuilder()
+
+    def load(self, index):
+        self.loads.append(index)
+        return self.history[index]
+
+    def build(self, count):
+        return self.builder.build(range(max(0, count - 4), count), self.load)
+
+    def test_layout_latest_top_left(self):
+        """Latest frame is top-left, then top-right, bottom-left, bottom-right."""
+        montage = self.build(4)
+        self.assertEqual(Image.open(BytesIO(montage)).size, (128, 96))
+        assert_close(self, pixel(montage, (10, 10)), COLORS[3])
+        assert_close(self, pixel(montage, (74, 10)), COLORS[2])
+        assert_close(self, pixel(montage, (10, 58)), COLORS[1])
+        assert_close(self, pixel(montage, (74, 58)), COLORS[0])
+
+    def test_missing_slots_are_black(self):
+        """With fewer than four frames the empty slots stay black."""
+        montage = self.build(1)
+        assert_close(self, pixel(montage, (10, 10)), COLORS[0])
+        assert_close(self, pixel(montage, (74, 58)), (0, 0, 0))
+
+    def test_only_new_frames_decoded(self):
+        """Each turn decodes only the frame that was added."""
+        for count in range(1, 6):
+            self.build(count)
+        self.assertEqual(self.loads, [0, 1, 2, 3, 4])
+        self.assertEqual(self.builder.decoded, 5)
+        self.assertEqual(len(self.builder.frames), 4)
+
+    def test_canvas_reused(self):
+        """The canvas is allocated once while the frame size is unchanged."""
+        self.build(3)
+        canvas = self.builder.canvas
+        self.build(4)
+        self.assertIs(self.builder.canvas, canvas)
+
+    def test_debug_write(self):
+        """The encoded montage is written to the debug path off the calling thread."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "image.jpg")
+            builder = MontageBuilder(debug_path=path)
+            montage = builder.build([0], self.load)
+            builder.flush(timeout=5)
+            builder.close()
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), montage)
+
+    def test_no_frames(self):
+        """Building without any frames is an error."""
+        with self.assertRaises(ValueError):
+            self.builder.build([], self.load)
+
+
+if __name__ == "__main__":
+    unittest.main()
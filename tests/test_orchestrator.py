@@ -0,0 +1,227 @@
+import json
+import time
+import unittest
+from unittest.mock import patch
+
+import ollama
+from inference import Backend
+from camera import MJPEGGrabber
+from orchestrator import CellConfig, DeadlineExceeded, InferenceScheduler, Orchestrator, Workcell
+from transport import Endpoint, RetryPolicy
+from tests.fakes import FakeMJPEGServer, FakeOllamaServer, VirtualLSCSerial, make_jpeg, ollama_reply
+
+
+DONE = json.dumps({"message": "done", "tool_calls": []})
+
+
+def move(servo_id: int, position: int) -> str:
+    return json.dumps({"message": "moving", "tool_calls": [{"servo_id": servo_id, "position": position}]})
+
+
+class TimedBackend(Backend):
+    """Answers every prompt after `service` seconds, noting the order prompts were answered in."""
+
+    def __init__(self, service: float, latency=None):
+        super().__init__("timed", "http://127.0.0.1:9/api/chat", "model")
+        self.service = service
+        self.latency = latency
+        self.answered = []
+        self.prompts = []
+
+    def complete(self, prompt, cancel, on_delta=None):
+        self.prompts.append(prompt)
+        if cancel.wait(self.service):
+            return None
+        self.answered.append(prompt["messages"][-1]["content"])
+        return ollama_reply(DONE)
+
+
+def prompt(content: str):
+    return dict(ollama.build_prompt("llama3.2-vision"), messages=[{"role": "user", "content": content}])
+
+
+class TestInferenceScheduler(unittest.TestCase):
+    def setUp(self):
+        self.schedulers = []
+
+    def tearDown(self):
+        for scheduler in self.schedulers:
+            scheduler.close()
+
+    def scheduler(self, backend, **kwargs) -> InferenceScheduler:
+        scheduler = InferenceScheduler(backend, **kwargs)
+        self.schedulers.append(scheduler)
+        return scheduler
+
+    def test_cells_take_turns(self):
+        """A cell with a backlog does not hold up another cell's prompts."""
+        backend = TimedBackend(0.05)
+        scheduler = self.scheduler(backend)
+        futures = [scheduler.submit("a", prompt(f"a{i}")) for i in range(1, 5)]
+        futures += [scheduler.submit("b", prompt(f"b{i}")) for i in range(1, 3)]
+        scheduler.start()
+        for future in futures:
+            future.result(5)
+        self.assertEqual(backend.answered[:2], ["a1", "b1"])
+        self.assertEqual(set(backend.answered[2:4]), {"a2", "b2"})
+        self.assertEqual(backend.answered[4:], ["a3", "a4"])
+
+    def test_weights(self):
+        """A cell weighted 3 gets about three times the inference of a cell weighted 1."""
+        backend = TimedBackend(0.02)
+        scheduler = self.scheduler(backend)
+        scheduler.register("heavy", 3)
+        scheduler.register("light", 1)
+        futures = [scheduler.submit(cell, prompt(cell)) for _ in range(8) for cell in ("heavy", "light")]
+        scheduler.start()
+        for future in futures:
+            future.result(5)
+        self.assertGreaterEqual(backend.answered[:8].count("heavy"), 5)
+
+    def test_deadline_goes_first(self):
+        """A prompt that would miss its deadline waiting for its fair turn is sent ahead of it."""
+        backend = TimedBackend(0.2, latency=0.2)
+        scheduler = self.scheduler(backend)
+        scheduler.register("a")
+        scheduler.register("b", weight=0.01)
+        backlog = [scheduler.submit("a", prompt(f"a{i}")) for i in range(1, 5)]
+        backlog.append(scheduler.submit("b", prompt("b0")))
+        urgent = scheduler.submit("b", prompt("b1"), deadline=0.9)
+        scheduler.start()
+        urgent.result(5)
+        for future in backlog:
+            future.result(5)
+        self.assertEqual(backend.answered, ["a1", "b0", "a2", "b1", "a3", "a4"])
+
+    def test_deadline_missed(self):
+        """Prompts not answered in time fail, whether still queued or already sent."""
+        backend = TimedBackend(0.3, latency=0.3)
+        scheduler = self.scheduler(backend).start()
+        slow = scheduler.submit("a", prompt("slow"))
+        time.sleep(0.02)  # sent before the urgent one arrives
+        queued = scheduler.submit("b", prompt("queued"), deadline=0.1)
+        with self.assertRaises(DeadlineExceeded):
+            queued.result(2)
+        slow.result(2)
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.chat("a", prompt("sent"), deadline=0.1)
+        self.assertLess(time.monotonic() - started, 0.25)
+        self.assertEqual(backend.cancelled, 1)
+        self.assertEqual(scheduler.stats()["b"]["missed"], 1)
+        self.assertEqual(scheduler.stats()["a"]["missed"], 1)
+
+    def test_slots_run_together(self):
+        """Up to slots prompts are sent at once, for the backend to batch."""
+        backend = TimedBackend(0.2)
+        scheduler = self.scheduler(backend, slots=3).start()
+        started = time.monotonic()
+        futures = [scheduler.submit(cell, prompt(cell)) for cell in ("a", "b", "c")]
+        for future in futures:
+            future.result(2)
+        self.assertLess(time.monotonic() - started, 0.35)
+
+    def test_model_kept_loaded(self):
+        """Every prompt carries the scheduler's keep_alive, and an idle scheduler refreshes it."""
+        with FakeOllamaServer([DONE]) as stub:
+            endpoint = Endpoint("ollama", retry=RetryPolicy(attempts=1))
+            scheduler = self.scheduler(Backend("ollama", stub.chat_url, "llava", endpoint=endpoint), keep_alive=0.4)
+            scheduler.start()
+            scheduler.chat("a", prompt("go"))
+            time.sleep(0.5)
+        self.assertEqual(stub.received[0]["keep_alive"], 0.4)
+        self.assertEqual(stub.received[0]["model"], "llava")
+        self.assertGreaterEqual(scheduler.refreshes, 1)
+        self.assertEqual(stub.received[1]["messages"], [])
+        self.assertEqual(stub.received[1]["keep_alive"], 0.4)
+
+
+class MissingScheduler:
+    """Misses the deadline of the first `misses` prompts, then answers with replies in turn."""
+
+    def __init__(self, misses: int, replies=()):
+        self.misses = misses
+        self.replies = list(replies)
+        self.calls = 0
+
+    def chat(self, cell, prompt, deadline=None, on_delta=None):
+        self.calls += 1
+        if self.calls <= self.misses:
+            raise DeadlineExceeded(f"{cell} missed its deadline")
+        return ollama_reply(self.replies.pop(0))
+
+
+class StillArm:
+    def move_servos(self, servo_ids, positions, time_ms):
+        pass
+
+    def read_servo_positions(self):
+        return {}
+
+
+class TestWorkcell(unittest.TestCase):
+    def work(self, scheduler, **config) -> Workcell:
+        with FakeMJPEGServer([make_jpeg((200, 0, 0))], fps=30) as stub:
+            camera = MJPEGGrabber(stub.url).start()
+            cell = Workcell(CellConfig("cell", stub.url, **config), scheduler, StillArm(), camera, "llava")
+            try:
+                cell.work("sort")
+            finally:
+                cell.close()
+        return cell
+
+    def test_missed_deadline_asked_again(self):
+        """A prompt that missed its deadline is asked again about a new frame, even of an unchanged scene."""
+        scheduler = MissingScheduler(1, [DONE])
+        cell = self.work(scheduler)
+        self.assertEqual(scheduler.calls, 2)
+        self.assertEqual(cell.missed, 1)
+        self.assertEqual([message["role"] for message in cell.chat["messages"]], ["user", "assistant"])
+
+    def test_missed_deadlines_give_up(self):
+        scheduler = MissingScheduler(10)
+        cell = self.work(scheduler, max_missed=3)
+        self.assertEqual(scheduler.calls, 3)
+        self.assertEqual(cell.missed, 3)
+
+
+class TestOrchestrator(unittest.TestCase):
+    def test_cells_share_one_model(self):
+        """Two cells, each with its own stub camera and virtual arm, work through one Ollama stub."""
+        replies = ["{}"] + [move(2 + turn % 3, 1000 + 100 * turn) for turn in range(6)] + [DONE]
+        devices = {"/dev/left": VirtualLSCSerial(), "/dev/right": VirtualLSCSerial()}
+        with FakeOllamaServer(replies, latency=0.02) as stub, \
+                FakeMJPEGServer([make_jpeg((200, 0, 0))], fps=30) as left, \
+                FakeMJPEGServer([make_jpeg((0, 0, 200))], fps=30) as right:
+            config = {"url": stub.chat_url, "model": "llava", "slots": 2, "keep_alive": 600,
+                      "cells": [{"name": "left", "camera_url": left.url, "serial_port": "/dev/left",
+                                 "instructions": ["sort"], "scene_unchanged": "infer"},
+                                {"name": "right", "camera_url": right.url, "serial_port": "/dev/right",
+                                 "instructions": ["sort"], "scene_unchanged": "infer", "weight": 2}]}
+            orchestrator = Orchestrator.from_config(config)
+            with patch("serial.Serial", side_effect=lambda port, *args, **kwargs: devices[port]):
+                orchestrator.start()
+            try:
+                self.assertTrue(orchestrator.join(20))
+                throughput = orchestrator.throughput()
+            finally:
+                orchestrator.stop()
+        self.assertEqual(throughput["turns"], 6)
+        self.assertGreater(throughput["total"], 0)
+        self.assertEqual(set(throughput["cells"]), {"left", "right"})
+        self.assertTrue(all(cell.error is None for cell in orchestrator.cells))
+        self.assertEqual(sum(cell.instructions for cell in orchestrator.cells), 2)
+        self.assertEqual(sum(len(device.moves) > 0 for device in devices.values()), 2)
+        # the warm-up, then every cell's prompts with the same keep_alive
+        self.assertEqual(stub.received[0]["messages"], [])
+        self.assertEqual({body["keep_alive"] for body in stub.received}, {600})
+        self.assertEqual({body["model"] for body in stub.received}, {"llava"})
+
+    def test_duplicate_names(self):
+        with self.assertRaises(ValueError):
+            Orchestrator([CellConfig("a", "http://cam"), CellConfig("a", "http://cam2")],
+                         InferenceScheduler(TimedBackend(0)), "llava")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import queue
+import threading
+import time
+import unittest
+from concurrent.futures import CancelledError
+
+from pipeline import Pipeline, Stage
+
+
+class TestStage(unittest.TestCase):
+    def setUp(self):
+        self.stage = Stage("test", maxsize=1)
+
+    def tearDown(self):
+        self.stage.close(cancel=True, timeout=5)
+
+    def test_results_and_errors(self):
+        """Jobs run in order and hand back results or exceptions."""
+        first = self.stage.submit(lambda: 1)
+        second = self.stage.submit(lambda: 1 / 0)
+        self.assertEqual(first.result(5), 1)
+        with self.assertRaises(ZeroDivisionError):
+            second.result(5)
+        self.assertEqual(self.stage.stats.as_dict()["count"], 2)
+
+    def test_backpressure(self):
+        """A full stage blocks the submitter until the timeout."""
+        release = threading.Event()
+        self.stage.submit(release.wait)  # running
+        time.sleep(0.05)
+        self.stage.submit(lambda: None)  # queued, fills the single slot
+        with self.assertRaises(queue.Full):
+            self.stage.submit(lambda: None, timeout=0.05)
+        release.set()
+
+    def test_cancel_pending(self):
+        """Cancelling drops queued jobs, the running one finishes."""
+        release = threading.Event()
+        running = self.stage.submit(release.wait, 5)
+        time.sleep(0.05)
+        queued = self.stage.submit(lambda: "never")
+        self.assertEqual(self.stage.cancel_pending(), 1)
+        release.set()
+        self.assertTrue(running.result(5))
+        with self.assertRaises(CancelledError):
+            queued.result(5)
+
+    def test_closed_stage_rejects_jobs(self):
+        """Nothing can be submitted after close."""
+        self.stage.close()
+        with self.assertRaises(RuntimeError):
+            self.stage.submit(lambda: None)
+
+
+class TestPipeline(unittest.TestCase):
+    def test_stages_overlap(self):
+        """Work on different stages runs concurrently and the overlap is measurable."""
+        recorded = []
+        pipeline = Pipeline({"a": 1, "b": 1}, on_job=lambda name, busy: recorded.append(name))
+        a = pipeline.submit("a", time.sleep, 0.2)
+        b = pipeline.submit("b", time.sleep, 0.2)
+        with pipeline.timed("inline"):
+            time.sleep(0.2)
+        a.result(5)
+        b.result(5)
+        pipeline.close()
+        self.assertGreater(pipeline.overlap(), 2.0)
+        timings = pipeline.timings()
+        self.assertEqual(set(timings), {"a", "b", "inline"})
+        self.assertGreaterEqual(timings["a"]["busy_ms"], 190)
+        self.assertEqual(sorted(recorded), ["a", "b", "inline"])
+
+
+if __name__ == "__main__":
+    unittest.main()
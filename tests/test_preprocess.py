@@ -0,0 +1,76 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from montage import MontageBuilder
+from preprocess import ImageSettings, Preprocessor, calibrate, main, sweep
+from tests.fakes import FakeOllamaServer, make_jpeg
+
+
+def size_and_mode(jpeg):
+    image = Image.open(BytesIO(jpeg))
+    return image.size, image.mode
+
+
+class TestPreprocessor(unittest.TestCase):
+    def setUp(self):
+        self.frames = [make_jpeg((40 * i, 100, 200), (640, 480)) for i in range(5)]
+
+    def build(self, settings):
+        builder = MontageBuilder(settings=settings)
+        return builder.build(range(len(self.frames) - builder.slots, len(self.frames)), self.frames.__getitem__)
+
+    def test_default_grid_unchanged(self):
+        """Without settings the montage is the full resolution 2x2 grid it always was."""
+        self.assertEqual(size_and_mode(self.build(ImageSettings())), ((1280, 960), "RGB"))
+
+    def test_latest_layout(self):
+        """The latest layout sends just the newest frame."""
+        montage = self.build(ImageSettings(layout="latest"))
+        self.assertEqual(size_and_mode(montage), ((640, 480), "RGB"))
+        r, g, b = Image.open(BytesIO(montage)).getpixel((320, 240))
+        self.assertAlmostEqual(r, 160, delta=10)
+
+    def test_roi_size_cap_and_grayscale(self):
+        """Frames are cropped, scaled to fit the cap and made grayscale."""
+        settings = ImageSettings(roi=(0.25, 0.0, 0.75, 0.5), max_size=(320, 240), grayscale=True)
+        self.assertEqual(size_and_mode(self.build(settings)), ((320, 240), "L"))
+        frame = Preprocessor(settings).decode(self.frames[0])
+        self.assertEqual(frame.size, (160, 120))
+
+    def test_unknown_layout(self):
+        with self.assertRaises(ValueError):
+            Preprocessor(ImageSettings(layout="filmstrip"))
+
+
+class TestCalibration(unittest.TestCase):
+    def test_sweep_sorted_by_payload(self):
+        """Every candidate is measured and smaller settings give smaller payloads."""
+        frames = [make_jpeg((10 * i, 50, 90)) for i in range(4)]
+        results = calibrate(frames, sweep())
+        self.assertEqual(len(results), len(sweep()))
+        self.assertEqual([r.payload_bytes for r in results], sorted(r.payload_bytes for r in results))
+        self.assertEqual(results[0].settings.layout, "latest")
+        self.assertTrue(all(r.prompt_eval_ms is None for r in results))
+
+    def test_main_against_stub(self):
+        """The calibration script reads a frame directory and asks the chat endpoint for prompt-eval time."""
+        with tempfile.TemporaryDirectory() as directory, FakeOllamaServer(["{}"]) as ollama:
+            for i in range(2):
+                with open(os.path.join(directory, f"{i}.jpg"), "wb") as f:
+                    f.write(make_jpeg((i * 100, 0, 0), (64, 48)))
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                results = main(["--frames", directory, "--ollama", ollama.chat_url])
+        self.assertEqual(len(ollama.received), len(results))
+        self.assertEqual(ollama.received[0]["options"]["num_predict"], 1)
+        self.assertEqual(results[0].prompt_eval_ms, 0)
+        self.assertIn("payload", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import base64
+import json
+import os
+import unittest
+
+from request_builder import ChatRequest
+
+
+def expected(prompt):
+    images = [image if isinstance(image, str) else base64.b64encode(image).decode() for image in prompt.get("images", [])]
+    return dict(prompt, images=images)
+
+
+class TestChatRequest(unittest.TestCase):
+    def test_body_matches_json(self):
+        """The streamed body parses to the prompt with its images base64-encoded, whatever the chunk size."""
+        prompt = {"model": "m", "messages": [{"role": "user", "content": "quote \" and\nnewline é"}],
+                  "images": [os.urandom(1000), os.urandom(1001), os.urandom(1002)]}
+        for chunk_size in (3, 48, 999, 3000):
+            with self.subTest(chunk_size=chunk_size):
+                body = ChatRequest(prompt, chunk_size=chunk_size)
+                data = b"".join(body)
+                self.assertEqual(json.loads(data), expected(prompt))
+                self.assertEqual(len(body), len(data))
+
+    def test_string_images_and_edge_cases(self):
+        """Already encoded images pass through, and empty prompts still make valid JSON."""
+        for prompt in ({"images": ["aGk="]}, {"model": "m"}, {}, {"model": "m", "images": []}, {"images": [b""]}):
+            with self.subTest(prompt=prompt):
+                body = ChatRequest(prompt)
+                data = b"".join(body)
+                self.assertEqual(json.loads(data), expected(prompt))
+                self.assertEqual(int(body.headers()["Content-Length"]), len(data))
+
+    def test_chunks_bounded(self):
+        """No piece of the body is much larger than the chunk size, so the payload is never held twice."""
+        body = ChatRequest({"messages": [], "images": [os.urandom(300 * 1024)]}, chunk_size=3 * 1024)
+        self.assertLessEqual(max(len(piece) for piece in body), 4 * 1024)
+
+    def test_chunk_size_multiple_of_three(self):
+        with self.assertRaises(ValueError):
+            ChatRequest({}, chunk_size=1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
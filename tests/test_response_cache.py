@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from change_detector import hamming_distance, perceptual_hash
+from response_cache import ResponseCache, normalize_prompt, quantize_pose
+from tests.fakes import make_jpeg
+
+
+PAIRS = os.path.join(os.path.dirname(__file__), "data", "frame_pairs")
+POSE = {1: 1500, 2: 1210, 3: 980}
+
+
+def reply(servo_id, position):
+    return {"message": {"role": "assistant", "content": f'{{"tool_calls": [{{"servo_id": {servo_id}, "position": {position}}}]}}'}}
+
+
+class TestKey(unittest.TestCase):
+    def test_prompt_normalized(self):
+        self.assertEqual(normalize_prompt("  Continue\n  with  the task "), normalize_prompt("continue with the task"))
+
+    def test_pose_quantized(self):
+        """Small servo jitter maps to the same pose."""
+        self.assertEqual(quantize_pose({2: 1210, 1: 1500}, 50), quantize_pose({1: 1490, 2: 1195}, 50))
+        self.assertNotEqual(quantize_pose({2: 1210}, 50), quantize_pose({2: 1300}, 50))
+
+    def test_perceptual_hash_tolerates_recompression(self):
+        """The hash of a scene survives JPEG re-encoding but not a different scene."""
+        with open(os.path.join(PAIRS, "still_reencoded_before.jpg"), "rb") as f:
+            before = perceptual_hash(f.read())
+        with open(os.path.join(PAIRS, "still_reencoded_after.jpg"), "rb") as f:
+            after = perceptual_hash(f.read())
+        self.assertLessEqual(hamming_distance(before, after), 3)
+        self.assertGreater(hamming_distance(before, perceptual_hash(make_jpeg((120, 60, 30)))), 6)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "responses.sqlite")
+        self.cache = ResponseCache(self.path, confidence=0.9)
+
+    def tearDown(self):
+        self.cache.close()
+        self.dir.cleanup()
+
+    def test_hit_within_confidence(self):
+        """A montage hash a few bits away still hits, a distant one misses."""
+        key = self.cache.key("continue", 0xFFFF_0000_FFFF_0000, POSE)
+        self.cache.put(key, reply(2, 900), latency=42.0)
+        near = self.cache.key("Continue", 0xFFFF_0000_FFFF_0003, {1: 1510, 2: 1200, 3: 990})
+        hit = self.cache.get(near)
+        self.assertEqual(hit.reply, reply(2, 900))
+        self.assertAlmostEqual(hit.confidence, 62 / 64)
+        self.assertIsNone(self.cache.get(self.cache.key("continue", 0x0000_FFFF_0000_FFFF, POSE)))
+        self.assertIsNone(self.cache.get(self.cache.key("pick up the die", 0xFFFF_0000_FFFF_0000, POSE)))
+        self.assertEqual(self.cache.stats(), {"entries": 1, "lookups": 3, "hits": 1, "hit_rate": 0.333, "saved_s": 42.0})
+
+    def test_high_bit_hashes(self):
+        """Hashes with the top bit set survive SQLite's signed integers."""
+        key = self.cache.key("continue", (1 << 64) - 1, POSE)
+        self.cache.put(key, reply(2, 900), latency=1.0)
+        self.assertEqual(self.cache.get(key).confidence, 1.0)
+
+    def test_persistent(self):
+        """Entries survive reopening the cache file."""
+        key = self.cache.key("continue", 12345, POSE)
+        self.cache.put(key, reply(3, 700), latency=30.0)
+        self.cache.close()
+        self.cache = ResponseCache(self.path)
+        self.assertEqual(self.cache.get(key).reply, reply(3, 700))
+
+    def test_ttl(self):
+        """Expired entries are not returned."""
+        key = self.cache.key("continue", 12345, POSE)
+        self.cache.put(key, reply(3, 700), latency=30.0)
+        with patch("time.time", return_value=time.time() + self.cache.ttl + 1):
+            self.assertIsNone(self.cache.get(key))
+
+    def test_lru_eviction(self):
+        """Past max_entries the least recently used entry goes first."""
+        self.cache.max_entries = 2
+        hashes = [0, 0xFFFF_FFFF_0000_0000, 0x0000_0000_FFFF_FFFF]
+        keys = [self.cache.key("continue", image_hash, POSE) for image_hash in hashes]
+        with patch("time.time", side_effect=[1000, 1001, 1002, 1003]):
+            self.cache.put(keys[0], reply(2, 600), latency=1.0)
+            self.cache.put(keys[1], reply(2, 700), latency=1.0)
+            self.cache.get(keys[0])
+            self.cache.put(keys[2], reply(2, 800), latency=1.0)
+        self.cache.ttl = float("inf")
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import os
+import unittest
+
+import ollama
+import prompts
+from lsc_servo_client import LSCServoController
+from response_validator import ResponseValidator, compile_schema, schema_errors
+
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "replies.jsonl")
+
+
+def load_corpus():
+    with open(CORPUS) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class TestCompiledSchema(unittest.TestCase):
+    def test_matches_schema_walk(self):
+        """The compiled check agrees with the errors found by walking the schema."""
+        check = compile_schema(ollama.FORMAT)
+        values = [{"message": "done"}, {"tool_calls": [{"servo_id": 2, "position": 900}]},
+                  {"waypoints": [[{"servo_id": 1, "position": 1500}]]}, {"tool_calls": [{"servo_id": 2}]},
+                  {"waypoints": [[{"servo_id": 9, "position": 900}]]}, {"message": 3},
+                  {"tool_calls": [{"servo_id": True, "position": 900}]}, {"tool_calls": "none"}, [], "done", None]
+        for value in values:
+            with self.subTest(value=value):
+                self.assertEqual(check(value), not schema_errors(value, ollama.FORMAT))
+
+    def test_errors_name_the_path(self):
+        def errors(value):
+            return schema_errors(value, ollama.FORMAT)
+        self.assertEqual(errors({"tool_calls": [{"servo_id": 2}]}), ["reply.tool_calls[0].position is missing"])
+        self.assertEqual(errors({"waypoints": [[{"servo_id": 9, "position": 900}]]}),
+                         ["reply.waypoints[0][0].servo_id must be between 1 and 6, not 9"])
+        self.assertEqual(errors({"message": 3}), ["reply.message must be a string"])
+        self.assertEqual(errors({"tool_calls": [{"servo_id": True, "position": 900}]}),
+                         ["reply.tool_calls[0].servo_id must be an integer"])
+        self.assertEqual(errors([]), ["reply must be an object"])
+
+
+class TestResponseValidator(unittest.TestCase):
+    def setUp(self):
+        self.validator = ResponseValidator(limits=LSCServoController.SERVO_LIMITS)
+
+    def test_corpus(self):
+        for entry in load_corpus():
+            with self.subTest(content=entry["content"]):
+                checked = self.validator.parse(entry["content"])
+                self.assertEqual(checked.valid, entry["valid"], checked.errors)
+                if entry["valid"]:
+                    self.assertEqual(len(checked.repairs), entry["repairs"], checked.repairs)
+                else:
+                    self.assertTrue(checked.errors)
+                if "expected" in entry:
+                    self.assertEqual(checked.content, entry["expected"])
+
+    def test_clamped_to_servo_limits(self):
+        checked = self.validator.parse('{"tool_calls": [{"servo_id": 1, "position": 900}]}')
+        self.assertEqual(checked.content["tool_calls"], [{"servo_id": 1, "position": 1200}])
+        self.assertEqual(checked.repairs, ("servo 1 position 900 clamped to 1200",))
+
+    def test_schema_limits_by_default(self):
+        checked = ResponseValidator().parse('{"tool_calls": [{"servo_id": 1, "position": 2000}]}')
+        self.assertTrue(checked.valid)
+        self.assertEqual(checked.repairs, ())
+
+    def test_command(self):
+        self.assertEqual(self.validator.command({"servo_id": 1, "position": 2000}), (1, 1800))
+        self.assertEqual(self.validator.command({"servo_id": "3", "position": 1000.0}), (3, 1000))
+        self.assertIsNone(self.validator.command({"servo_id": 7, "position": 1000}))
+        self.assertIsNone(self.validator.command({"servo_id": 2}))
+        self.assertIsNone(self.validator.command("servo 2 to 1000"))
+
+    def test_malformed_waypoints(self):
+        checked = self.validator.parse('{"waypoints": 5}')
+        self.assertEqual(checked.errors, ("reply.waypoints must be an array",))
+
+    def test_retry_prompt_lists_errors(self):
+        checked = self.validator.parse('{"tool_calls": [{"servo_id": 2}]}')
+        prompt = self.validator.retry_prompt(checked)
+        self.assertTrue(prompt.startswith(prompts.RETRY.split("\n")[0]))
+        self.assertIn("- reply.tool_calls[0].position is missing", prompt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from lsc_servo_client import LSCServoController
+from serial_transport import SerialTransport, merge_moves
+from tests.fakes import FakeSerial
+
+
+MOVE = LSCServoController.CMD_SERVO_MOVE
+POS_READ = LSCServoController.CMD_MULT_SERVO_POS_READ
+BATTERY = LSCServoController.CMD_GET_BATTERY_VOLTAGE
+
+
+def move_params(time_ms, *servos):
+    params = [len(servos), time_ms & 0xFF, time_ms >> 8]
+    for servo_id, position in servos:
+        params += [servo_id, position & 0xFF, position >> 8]
+    return params
+
+
+class BlockingSerial(FakeSerial):
+    """Holds the first write until released, so later packets pile up in the outbound queue."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+
+    def write(self, data):
+        self.release.wait(5)
+        return super().write(data)
+
+
+class TestMergeMoves(unittest.TestCase):
+    def test_superseded_servos_merge(self):
+        """A newer move covering the same servos replaces the older one."""
+        merged = merge_moves(move_params(1000, (2, 900)), move_params(500, (2, 1200), (3, 700)))
+        self.assertEqual(merged, move_params(500, (2, 1200), (3, 700)))
+
+    def test_same_time_merges_union(self):
+        """Moves with the same time are combined into one packet."""
+        merged = merge_moves(move_params(1000, (2, 900)), move_params(1000, (3, 700)))
+        self.assertEqual(merged, move_params(1000, (2, 900), (3, 700)))
+
+    def test_different_servos_and_times_kept(self):
+        """Unrelated moves with different timing stay separate."""
+        self.assertIsNone(merge_moves(move_params(1000, (2, 900)), move_params(500, (3, 700))))
+
+
+class TestSerialTransport(unittest.TestCase):
+    def test_moves_coalesced_while_port_busy(self):
+        """Moves queued behind a busy port go out as a single packet."""
+        ser = BlockingSerial(responder=lambda data: b"")
+        transport = SerialTransport(ser)
+        first = transport.send(BATTERY, [])
+        futures = [transport.send(MOVE, move_params(200, (2, 1000 + i))) for i in range(5)]
+        ser.release.set()
+        for future in [first] + futures:
+            future.result(5)
+        transport.close()
+        self.assertEqual(transport.coalesced, 4)
+        self.assertEqual(len(ser.writes), 2)
+        self.assertEqual(ser.writes[1], bytes([0x55, 0x55, 8, MOVE] + move_params(200, (2, 1004))))
+
+    def test_replies_routed_by_command(self):
+        """Replies arriving out of order reach the request that is waiting for them."""
+        ser = FakeSerial(responder=lambda data: b"")
+        transport = SerialTransport(ser)
+        positions = transport.request(POS_READ, [1, 2])
+        battery = transport.request(BATTERY, [])
+        transport.drain(5)
+        ser.feed(bytes([0x55, 0x55, 0x04, BATTERY, 0x34, 0x12]))
+        ser.feed(bytes([0x55, 0x55, 0x06, POS_READ, 0x01, 0x02, 0x05, 0xDC]))
+        self.assertEqual(battery.result(5), bytes([0x34, 0x12]))
+        self.assertEqual(positions.result(5), bytes([0x01, 0x02, 0x05, 0xDC]))
+        transport.close()
+
+    def test_late_reply_to_cancelled_request_dropped(self):
+        """A reply that turns up after its request was given up on does not answer the next request."""
+        ser = FakeSerial(responder=lambda data: b"")
+        transport = SerialTransport(ser)
+        transport.request(BATTERY, []).cancel()
+        battery = transport.request(BATTERY, [])
+        transport.drain(5)
+        ser.feed(bytes([0x55, 0x55, 0x04, BATTERY, 0x11, 0x11]))
+        ser.feed(bytes([0x55, 0x55, 0x04, BATTERY, 0x34, 0x12]))
+        self.assertEqual(battery.result(5), bytes([0x34, 0x12]))
+        transport.close()
+
+    def test_reply_after_late_window(self):
+        """Once a cancelled request's reply is no longer expected, the next reply is routed as usual."""
+        ser = FakeSerial(responder=lambda data: b"")
+        transport = SerialTransport(ser, late_window=0.05)
+        transport.request(BATTERY, []).cancel()
+        time.sleep(0.1)
+        battery = transport.request(BATTERY, [])
+        transport.drain(5)
+        ser.feed(bytes([0x55, 0x55, 0x04, BATTERY, 0x34, 0x12]))
+        self.assertEqual(battery.result(5), bytes([0x34, 0x12]))
+        transport.close()
+
+    def test_send_does_not_wait_for_write(self):
+        """Callers are not held up by the serial link."""
+        ser = BlockingSerial(responder=lambda data: b"")
+        transport = SerialTransport(ser)
+        start = time.monotonic()
+        future = transport.send(MOVE, move_params(200, (2, 1000)))
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertFalse(future.done())
+        ser.release.set()
+        future.result(5)
+        transport.close()
+
+
+class TestBackgroundController(unittest.TestCase):
+    @patch("serial.Serial")
+    def setUp(self, mock_serial):
+        self.reply = bytes([0x55, 0x55, 0x06, POS_READ, 0x01, 0x02, 0x05, 0xDC])
+        self.fake = FakeSerial(responder=lambda data: self.reply if data[3] == POS_READ else b"")
+        mock_serial.return_value = self.fake
+        self.controller = LSCServoController("/dev/ttyUSB0", background_io=True, ready_timeout=0)
+
+    def tearDown(self):
+        self.controller.transport.close()
+
+    def test_public_api_wraps_transport(self):
+        """The controller API works unchanged on top of the transport."""
+        self.controller.move_servos([2, 3], [1500, 1600], 1000)
+        self.assertEqual(self.controller.read_servo_positions([2]), {2: 1500})
+        self.controller.transport.drain(5)
+        self.assertEqual(self.fake.writes[0], bytes([0x55, 0x55, 0x0B, MOVE, 2, 0xE8, 0x03, 2, 0xDC, 0x05, 3, 0x40, 0x06]))
+
+
+if __name__ == "__main__":
+    unittest.main()
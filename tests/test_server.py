@@ -0,0 +1,284 @@
+import base64
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+
+import server
+from frame_store import FrameStore
+from montage import MontageBuilder
+from response_cache import ResponseCache
+from speech import NullEngine, SpeechWorker
+from supervisor import Checkpointer
+from trajectory import profile_duration
+from tests.fakes import FakeMJPEGServer, FakeOllamaServer, VirtualLSCSerial, load_recorded_stream, make_jpeg
+
+
+RECORDED_STREAM = os.path.join(os.path.dirname(__file__), "data", "chat_stream.ndjson")
+
+
+class TestChat(unittest.TestCase):
+    def test_non_streamed(self):
+        """Without a callback the reply is fetched in one request."""
+        content = json.dumps({"message": "hi", "tool_calls": []})
+        with FakeOllamaServer([content]) as ollama:
+            response = server.chat(ollama.chat_url, {"messages": [], "stream": False})
+        self.assertEqual(response["message"]["content"], content)
+        self.assertFalse(ollama.received[0]["stream"])
+
+    def test_images_sent_as_base64(self):
+        """Raw JPEG bytes in the prompt reach the server base64-encoded."""
+        jpeg = make_jpeg((10, 20, 30), (64, 48))
+        with FakeOllamaServer([json.dumps({"message": "hi", "tool_calls": []})]) as ollama:
+            server.chat(ollama.chat_url, {"messages": [], "stream": False, "images": [jpeg]})
+        self.assertEqual(ollama.received[0]["images"], [base64.b64encode(jpeg).decode()])
+
+    def test_streamed_tool_calls_arrive_early(self):
+        """Streamed tool calls are handed over while the reply is still being generated."""
+        chunks = load_recorded_stream(RECORDED_STREAM)
+        with FakeOllamaServer([chunks]) as ollama:
+            ollama.chunk_delay = 0.01
+            calls = []
+            start = time.monotonic()
+            response = server.chat(ollama.chat_url, {"messages": [], "stream": False},
+                                   lambda call: calls.append((time.monotonic() - start, call)))
+            total = time.monotonic() - start
+        content = json.loads(response["message"]["content"])
+        self.assertEqual([call for _, call in calls], content["tool_calls"])
+        self.assertLess(calls[0][0], total - 0.1)
+        self.assertEqual(response["prompt_eval_duration"], chunks[-1]["prompt_eval_duration"])
+        self.assertTrue(ollama.received[0]["stream"])
+
+    def test_stream_errors(self):
+        """An error chunk or a stream that stops short is a request failure, which the session gives up on."""
+        started = {"message": {"role": "assistant", "content": "{"}, "done": False}
+        for reply in ([{"error": "model not found"}], [started]):
+            with FakeOllamaServer([reply]) as ollama, self.assertRaises(requests.exceptions.RequestException):
+                server.chat(ollama.chat_url, {"messages": []}, lambda call: None)
+
+
+class FakeArm:
+    def __init__(self):
+        self.moves = []
+
+    def move_servos(self, servo_ids, positions, time_ms):
+        self.moves.append((time.monotonic(), servo_ids, positions, time_ms))
+
+    def read_servo_positions(self):
+        return {1: 1500}
+
+
+class TestLoop(unittest.TestCase):
+    def setUp(self):
+        self.saved = {name: getattr(server, name) for name in
+                      ("WEBCAM_URL", "OLLAMA_URL", "SERVO_MAX_VELOCITY", "SERVO_MAX_ACCELERATION",
+                       "FRAME_HISTORY", "MONTAGE", "SCENE_UNCHANGED_ACTION", "RESPONSE_CACHE", "CHECKPOINTER")}
+        self.camera = FakeMJPEGServer([make_jpeg((200, 10, 10), (64, 48))]).start()
+        server.WEBCAM_URL = self.camera.url
+        server.SERVO_MAX_VELOCITY = 5000
+        server.SERVO_MAX_ACCELERATION = 20000
+        server.FRAME_HISTORY = FrameStore(capacity=4)
+        server.MONTAGE = MontageBuilder()
+        server.CHECKPOINTER = Checkpointer()
+        # the stub camera never sees the arm move
+        server.SCENE_UNCHANGED_ACTION = "infer"
+        self.arm = FakeArm()
+        self.speech = SpeechWorker(NullEngine, max_pending=4)
+
+    def tearDown(self):
+        self.camera.stop()
+        self.speech.close()
+        for name, value in self.saved.items():
+            setattr(server, name, value)
+
+    def run_loop(self, replies, instruction="start"):
+        with FakeOllamaServer(replies) as ollama:
+            server.OLLAMA_URL = ollama.chat_url
+            chat = {"messages": [], "stream": False}
+            server.loop(self.arm, self.speech, chat, instruction)
+            self.speech.flush(5)
+        return chat, ollama
+
+    def test_turns_until_no_tool_calls(self):
+        """The loop moves the arm each turn and stops when the model sends no commands."""
+        replies = [
+            json.dumps({"message": "moving", "tool_calls": [{"servo_id": 2, "position": 900}]}),
+            json.dumps({"message": "done", "tool_calls": []}),
+        ]
+        chat, ollama = self.run_loop(replies)
+        self.assertEqual({tuple(move[1]) for move in self.arm.moves}, {(2,)})
+        self.assertEqual(self.arm.moves[-1][2], [900])
+        self.assertEqual(self.speech.engine.spoken, ["moving", "done"])
+        self.assertEqual(len(server.FRAME_HISTORY), 2)
+        self.assertEqual([m["role"] for m in chat["messages"]], ["user", "assistant", "user", "assistant"])
+        self.assertTrue(ollama.received[1]["messages"][2]["content"].startswith(server.prompts.CONTINUE))
+
+    def test_waypoints_followed(self):
+        """Waypoints after the tool calls are visited in order within the same turn."""
+        replies = [
+            json.dumps({"message": "", "tool_calls": [{"servo_id": 2, "position": 1400}],
+                        "waypoints": [[{"servo_id": 2, "position": 1300}], [{"servo_id": 3, "position": 1600}]]}),
+            json.dumps({"message": "", "tool_calls": []}),
+        ]
+        self.run_loop(replies)
+        finals = [move[2][-1] for move in self.arm.moves]
+        self.assertIn(1400, finals)
+        self.assertEqual(self.arm.moves[-1][1:3], ([3], [1600]))
+        self.assertLess(finals.index(1400), finals.index(1300))
+
+    def test_next_request_waits_for_arm(self):
+        """The next prompt is only sent once the arm has had time to arrive."""
+        replies = [
+            json.dumps({"message": "", "tool_calls": [{"servo_id": 3, "position": 1000}]}),
+            json.dumps({"message": "", "tool_calls": []}),
+        ]
+        start = time.monotonic()
+        self.run_loop(replies)
+        # servo 3 starts from the centre of its range
+        travel = profile_duration(500, server.SERVO_MAX_VELOCITY, server.SERVO_MAX_ACCELERATION)
+        self.assertGreaterEqual(time.monotonic() - start, travel)
+        self.assertEqual(self.speech.engine.spoken, [])
+
+    def test_unchanged_scene_stops(self):
+        """When the moves leave the scene as it was, the model is not asked again."""
+        server.SCENE_UNCHANGED_ACTION = "stop"
+        replies = [json.dumps({"message": "", "tool_calls": [{"servo_id": 2, "position": 1400}]})]
+        chat, ollama = self.run_loop(replies)
+        self.assertEqual(len(ollama.received), 1)
+        self.assertEqual(len(server.FRAME_HISTORY), 2)
+        self.assertEqual(self.arm.moves[-1][2], [1400])
+
+    def test_unusable_reply_retried(self):
+        """An unusable reply is sent back with what was wrong, about the same image, and repairs are applied."""
+        replies = [
+            json.dumps({"message": "", "tool_calls": [{"servo_id": 2}]}),
+            "```json\n" + json.dumps({"message": "squeeze", "tool_calls": [{"servo_id": 1, "position": 2000}]}) + "\n```",
+            json.dumps({"message": "done", "tool_calls": []}),
+        ]
+        chat, ollama = self.run_loop(replies)
+        self.assertEqual(len(ollama.received), 3)
+        retry = ollama.received[1]["messages"][-1]["content"]
+        self.assertIn("reply.tool_calls[0].position is missing", retry)
+        self.assertEqual(ollama.received[1]["images"], ollama.received[0]["images"])
+        self.assertEqual(len(server.FRAME_HISTORY), 2)
+        self.assertEqual(self.arm.moves[-1][1:3], ([1], [1800]))
+        self.assertEqual(json.loads(chat["messages"][3]["content"])["tool_calls"], [{"servo_id": 1, "position": 1800}])
+
+    def test_unusable_replies_give_up(self):
+        chat, ollama = self.run_loop(["I can't see the arm."])
+        self.assertEqual(len(ollama.received), server.RESPONSE_RETRIES + 1)
+        self.assertEqual(self.arm.moves, [])
+        self.assertIn("please try again", self.speech.engine.spoken[-1])
+
+    def test_cached_reply_reused(self):
+        """The same prompt, scene and pose reuse the earlier plan without asking the model."""
+        server.TELEMETRY.reset()
+        server.RESPONSE_CACHE = ResponseCache(":memory:")
+        move = json.dumps({"message": "moving", "tool_calls": [{"servo_id": 2, "position": 900}]})
+        self.run_loop([move, json.dumps({"message": "done", "tool_calls": []})])
+        server.FRAME_HISTORY = FrameStore(capacity=4)
+        server.MONTAGE = MontageBuilder()
+        self.arm.moves.clear()
+        chat, ollama = self.run_loop([json.dumps({"message": "done again", "tool_calls": []})])
+        self.assertEqual(len(ollama.received), 1)
+        self.assertTrue(ollama.received[0]["messages"][-1]["content"].startswith(server.prompts.CONTINUE))
+        self.assertEqual(self.arm.moves[-1][2], [900])
+        self.assertEqual(server.RESPONSE_CACHE.stats()["hits"], 1)
+        # Ollama's timings are only recorded for the three replies it actually gave
+        self.assertEqual(server.TELEMETRY.summary()["ollama.total_duration"]["count"], 3)
+        server.RESPONSE_CACHE.close()
+
+    def test_cached_reply_per_instruction(self):
+        """A plan is not replayed for another instruction, even with the same scene, pose and follow-up prompt."""
+        server.RESPONSE_CACHE = ResponseCache(":memory:")
+        move = json.dumps({"message": "moving", "tool_calls": [{"servo_id": 2, "position": 900}]})
+        wave = json.dumps({"message": "waving", "tool_calls": [{"servo_id": 3, "position": 1100}]})
+        self.run_loop([move, wave, json.dumps({"message": "waved", "tool_calls": []})], "wave")
+        server.FRAME_HISTORY = FrameStore(capacity=4)
+        server.MONTAGE = MontageBuilder()
+        self.arm.moves.clear()
+        chat, ollama = self.run_loop([move, json.dumps({"message": "pointed", "tool_calls": []})], "point")
+        self.assertEqual(len(ollama.received), 2)
+        self.assertEqual(server.RESPONSE_CACHE.stats()["hits"], 0)
+        self.assertNotIn([3], [servo_ids for _, servo_ids, _, _ in self.arm.moves])
+        server.RESPONSE_CACHE.close()
+
+    def test_scene_facts_in_prompt(self):
+        """What local vision sees in the frame goes along with the prompt, but is not kept in the history."""
+        chat, ollama = self.run_loop([json.dumps({"message": "done", "tool_calls": []})])
+        sent = ollama.received[0]["messages"][-1]["content"]
+        self.assertTrue(sent.startswith("start\nLocal vision found 1 coloured objects"))
+        self.assertIn("red at x=0.50 y=0.50", sent)
+        self.assertEqual(chat["messages"][0]["content"], "start")
+
+    def test_question_answered_locally(self):
+        """A question local vision can answer is answered from a fresh frame without asking the model."""
+        questions = iter(["How many red things can you see?", "Where is the red one? Pick it up"])
+
+        def next_instruction():
+            question = next(questions, None)
+            if question is None:
+                raise StopIteration  # ends the session
+            return question
+
+        with FakeOllamaServer([json.dumps({"message": "a die", "tool_calls": []})]) as ollama:
+            server.OLLAMA_URL = ollama.chat_url
+            chat = {"messages": [], "stream": False}
+            with self.assertRaises(StopIteration):
+                server.session(self.arm, self.speech, None, chat, next_instruction)
+            self.speech.flush(5)
+        # the introduction and the question that came with an instruction went to the model
+        self.assertEqual(len(ollama.received), 2)
+        self.assertIn("I can see 1 red object.", self.speech.engine.spoken)
+        self.assertEqual(chat["messages"][2:4], [
+            {"role": "user", "content": "How many red things can you see?"},
+            {"role": "assistant", "content": json.dumps({"message": "I can see 1 red object.", "tool_calls": []})}])
+        self.assertEqual(chat["messages"][4]["content"], "Where is the red one? Pick it up")
+        self.assertIn("Local vision found", ollama.received[1]["messages"][-1]["content"])
+
+
+class TestRun(unittest.TestCase):
+    def test_import_leaves_audio_alone(self):
+        """Importing the server neither loads the audio stack nor sets up logging."""
+        script = ("import logging, sys; import server; "
+                  "print(sorted({'pyttsx3', 'speech_recognition', 'listener'} & set(sys.modules)), "
+                  "len(logging.getLogger().handlers))")
+        src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+        output = subprocess.run([sys.executable, "-c", script], cwd=src, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.split(), ["[]", "0"])
+
+    def test_headless(self):
+        """Headless, instructions come from standard input and the run ends with it."""
+        names = ("WEBCAM_URL", "OLLAMA_URL", "SERIAL_PORT", "FRAME_HISTORY", "MONTAGE", "CHECKPOINTER", "SCENE_UNCHANGED_ACTION")
+        saved = {name: getattr(server, name) for name in names}
+        device = VirtualLSCSerial()
+        replies = ["{}", json.dumps({"message": "hello", "tool_calls": [{"servo_id": 2, "position": 900}]}),
+                   json.dumps({"message": "done", "tool_calls": []}), json.dumps({"message": "waved", "tool_calls": []})]
+        try:
+            with FakeOllamaServer(replies) as ollama, FakeMJPEGServer([make_jpeg((200, 10, 10), (64, 48))]) as camera:
+                server.WEBCAM_URL = camera.url
+                server.OLLAMA_URL = ollama.chat_url
+                server.SERIAL_PORT = "/dev/ttyUSB0"
+                server.FRAME_HISTORY = FrameStore(capacity=4)
+                server.MONTAGE = MontageBuilder()
+                server.CHECKPOINTER = Checkpointer()
+                server.SCENE_UNCHANGED_ACTION = "infer"
+                with patch("serial.Serial", return_value=device), patch("sys.stdin", io.StringIO("wave\n")), \
+                        patch("sys.stdout", io.StringIO()), self.assertRaises(SystemExit):
+                    server.run(headless=True)
+        finally:
+            for name, value in saved.items():
+                setattr(server, name, value)
+        self.assertEqual(ollama.received[0]["messages"], [])  # the warm-up
+        self.assertEqual(device.positions[2], 900)
+        self.assertTrue(ollama.received[-1]["messages"][-1]["content"].startswith("wave"))
+
+
+if __name__ == "__main__":
+    unittest.main()
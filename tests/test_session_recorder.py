@@ -0,0 +1,29 @@
+import os
+import tempfile
+import unittest
+
+from session_recorder import SessionRecorder, load_session
+from tests.fakes import make_fake_jpeg, ollama_stream_chunks
+
+
+class TestSessionRecorder(unittest.TestCase):
+    def test_round_trip(self):
+        """Frames, timed reply chunks and turn times come back in order."""
+        chunks = [(0.1 * i, chunk) for i, chunk in enumerate(ollama_stream_chunks('{"message": "hi"}'))]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "session.jsonl")
+            recorder = SessionRecorder(path)
+            recorder.frame(make_fake_jpeg(b"first"))
+            recorder.reply(chunks)
+            recorder.turn(1.5)
+            recorder.frame(make_fake_jpeg(b"second"))
+            recorder.close()
+            recorder.turn(2.0)  # after close, ignored
+            session = load_session(path)
+        self.assertEqual(session.frames, [make_fake_jpeg(b"first"), make_fake_jpeg(b"second")])
+        self.assertEqual(session.replies, [[(round(after, 4), chunk) for after, chunk in chunks]])
+        self.assertEqual(session.turns, [1.5])
+
+
+if __name__ == "__main__":
+    unittest.main()
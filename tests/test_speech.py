@@ -0,0 +1,75 @@
+import threading
+import time
+import unittest
+
+from speech import NullEngine, SpeechWorker
+
+
+class TestSpeechWorker(unittest.TestCase):
+    def setUp(self):
+        self.worker = SpeechWorker(lambda: NullEngine(seconds_per_word=0.02))
+
+    def tearDown(self):
+        self.worker.close()
+
+    def test_say_async_does_not_block(self):
+        """Queueing speech returns immediately and flush waits for it."""
+        start = time.monotonic()
+        self.worker.say_async("one two three four five")
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertTrue(self.worker.flush(5))
+        self.assertEqual(self.worker.engine.spoken, ["one two three four five"])
+
+    def test_busy(self):
+        """Busy from queueing speech until it has been spoken."""
+        self.assertFalse(self.worker.busy)
+        self.worker.say_async("one two three")
+        self.assertTrue(self.worker.busy)
+        self.worker.flush(5)
+        self.assertFalse(self.worker.busy)
+
+    def test_stale_messages_dropped(self):
+        """Only the newest pending utterance is kept while another is being spoken."""
+        self.worker.say_async("first message is quite long indeed")
+        time.sleep(0.05)
+        for i in range(5):
+            self.worker.say_async(f"turn {i}")
+        self.worker.flush(5)
+        self.assertEqual(self.worker.engine.spoken, ["first message is quite long indeed", "turn 4"])
+        self.assertEqual(self.worker.dropped, 4)
+
+    def test_interrupt(self):
+        """A superseding utterance cuts off the one being spoken."""
+        self.worker.say_async(" ".join(["word"] * 100))
+        time.sleep(0.05)
+        self.worker.say_async("urgent", interrupt=True)
+        self.assertTrue(self.worker.flush(1))
+        self.assertEqual(self.worker.engine.spoken, ["urgent"])
+        self.assertEqual(len(self.worker.engine.interrupted), 1)
+
+    def test_engine_owned_by_worker_thread(self):
+        """The engine is created on the worker thread, not the caller's."""
+        threads = []
+
+        def factory():
+            threads.append(threading.current_thread())
+            return NullEngine()
+
+        worker = SpeechWorker(factory)
+        worker.close()
+        self.assertEqual(threads[0].name, "SpeechWorker")
+
+    def test_broken_engine_falls_back_to_silence(self):
+        """An engine that fails to initialise leaves a silent worker rather than an exception."""
+        def factory():
+            raise RuntimeError("no audio device")
+
+        worker = SpeechWorker(factory)
+        worker.say_async("hello")
+        self.assertTrue(worker.flush(5))
+        self.assertIsInstance(worker.engine, NullEngine)
+        worker.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import os
+import unittest
+
+from stream_parser import ToolCallStreamParser
+from tests.fakes import load_recorded_stream
+
+
+RECORDED_STREAM = os.path.join(os.path.dirname(__file__), "data", "chat_stream.ndjson")
+
+
+def feed_all(pieces):
+    parser = ToolCallStreamParser()
+    emitted = []
+    for piece in pieces:
+        emitted.append(parser.feed(piece))
+    return emitted
+
+
+class TestToolCallStreamParser(unittest.TestCase):
+    def test_recorded_stream(self):
+        """Each tool call in a recorded Ollama stream is emitted the moment it is complete."""
+        chunks = load_recorded_stream(RECORDED_STREAM)
+        pieces = [chunk["message"]["content"] for chunk in chunks]
+        emitted = feed_all(pieces)
+        calls = [call for batch in emitted for call in batch]
+        self.assertEqual(calls, json.loads("".join(pieces))["tool_calls"])
+        # the first call is available well before the stream ends
+        first = next(i for i, batch in enumerate(emitted) if batch)
+        self.assertLess(first, len(pieces) - 10)
+
+    def test_any_fragmentation(self):
+        """Splitting the content anywhere yields the same tool calls."""
+        content = json.dumps({"tool_calls": [{"servo_id": 2, "position": 900}, {"servo_id": 5, "position": 2100}],
+                              "message": "done"})
+        for size in (1, 2, 3, 7, len(content)):
+            with self.subTest(size=size):
+                pieces = [content[i:i + size] for i in range(0, len(content), size)]
+                calls = [call for batch in feed_all(pieces) for call in batch]
+                self.assertEqual(calls, [{"servo_id": 2, "position": 900}, {"servo_id": 5, "position": 2100}])
+
+    def test_strings_do_not_confuse(self):
+        """Brackets, escapes and the key name inside strings are ignored."""
+        content = ('{"message": "not \\"tool_calls\\": [{\\"servo_id\\": 1}] {", '
+                   '"tool_calls": [{"servo_id": 3, "position": 1000, "note": "}]"}]}')
+        calls = [call for batch in feed_all(list(content)) for call in batch]
+        self.assertEqual(calls, [{"servo_id": 3, "position": 1000, "note": "}]"}])
+
+    def test_nested_arrays_elsewhere_ignored(self):
+        """Only items of the top level tool_calls array are emitted."""
+        content = '{"other": [{"servo_id": 1}], "message": "x", "tool_calls": []}'
+        self.assertEqual(ToolCallStreamParser().feed(content), [])
+
+    def test_empty_stream(self):
+        """An empty reply emits nothing."""
+        parser = ToolCallStreamParser()
+        self.assertEqual(parser.feed(""), [])
+        self.assertEqual(parser.emitted, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,278 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import server
+from camera import MJPEGGrabber
+from frame_store import FrameStore
+from montage import MontageBuilder
+from serial_transport import SerialTransport
+from speech import NullEngine, SpeechWorker
+from supervisor import Checkpoint, Checkpointer, Supervisor, atomic_write_json
+from tests.fakes import FakeMJPEGServer, FakeOllamaServer, FakeSerial, make_jpeg
+
+
+def checkpoint(instruction="Pick up the die", pose=None):
+    return Checkpoint(instruction, [{"role": "user", "content": instruction}], "", 3, pose if pose is not None else {2: 900})
+
+
+def dead_thread() -> threading.Thread:
+    thread = threading.Thread(target=lambda: None)
+    thread.start()
+    thread.join()
+    return thread
+
+
+class TempDirTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "checkpoint.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+class TestAtomicWrite(TempDirTestCase):
+    def test_failed_write_keeps_previous(self):
+        atomic_write_json(self.path, {"n": 1})
+        with self.assertRaises(TypeError):
+            atomic_write_json(self.path, {"n": object()})
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {"n": 1})
+        self.assertEqual(os.listdir(self.dir), ["checkpoint.json"])
+
+    def test_crash_before_rename_keeps_previous(self):
+        atomic_write_json(self.path, {"n": 1})
+        with mock.patch("os.replace", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                atomic_write_json(self.path, {"n": 2})
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {"n": 1})
+
+
+class TestCheckpointer(TempDirTestCase):
+    def test_round_trip(self):
+        Checkpointer(self.path).save(checkpoint(), force=True)
+        loaded = Checkpointer(self.path).load()
+        self.assertEqual(loaded.pose, {2: 900})
+        self.assertEqual(loaded.instruction, "Pick up the die")
+        self.assertEqual(loaded.frame_index, 3)
+        self.assertGreater(loaded.saved, 0)
+
+    def test_writes_throttled(self):
+        """Between intervals only the in-memory checkpoint is updated, unless forced."""
+        checkpointer = Checkpointer(self.path, interval=60)
+        self.assertTrue(checkpointer.save(checkpoint("first")))
+        self.assertFalse(checkpointer.save(checkpoint("second")))
+        self.assertEqual(checkpointer.latest().instruction, "second")
+        self.assertEqual(Checkpointer(self.path).load().instruction, "first")
+        self.assertTrue(checkpointer.save(checkpoint(None), force=True))
+        self.assertIsNone(Checkpointer(self.path).load().instruction)
+
+    def test_pose_carried_over(self):
+        checkpointer = Checkpointer()
+        checkpointer.save(checkpoint())
+        checkpointer.save(checkpoint(None, pose={}))
+        self.assertEqual(checkpointer.latest().pose, {2: 900})
+        self.assertIsNone(checkpointer.load())
+
+    def test_unreadable_ignored(self):
+        with open(self.path, "w") as f:
+            f.write('{"version": 1, "messages": [')
+        self.assertIsNone(Checkpointer(self.path).load())
+
+
+class FakeWorker:
+    def __init__(self, alive=True, fail=False):
+        self.alive = alive
+        self.fail = fail
+        self.restarts = 0
+
+    def is_alive(self):
+        return self.alive
+
+    def restart(self):
+        if self.fail:
+            raise OSError("device missing")
+        self.restarts += 1
+        self.alive = True
+
+
+class TestSupervisor(unittest.TestCase):
+    def test_dead_workers_restarted(self):
+        supervisor = Supervisor()
+        alive, dead, broken = FakeWorker(), FakeWorker(alive=False), FakeWorker(alive=False, fail=True)
+        for name, worker in (("alive", alive), ("dead", dead), ("broken", broken)):
+            supervisor.watch(name, worker.is_alive, worker.restart)
+        self.assertEqual(supervisor.check_workers(), ["dead"])
+        self.assertEqual((alive.restarts, dead.restarts), (0, 1))
+        self.assertEqual(supervisor.worker_restarts, {"alive": 0, "dead": 1, "broken": 0})
+
+    def test_monitor_thread(self):
+        supervisor = Supervisor(poll_interval=0.01)
+        worker = FakeWorker(alive=False)
+        supervisor.watch("worker", worker.is_alive, worker.restart)
+        supervisor.start()
+        try:
+            deadline = time.monotonic() + 2
+            while not worker.alive and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            supervisor.stop()
+        self.assertEqual(worker.restarts, 1)
+
+    def test_session_resumed_from_checkpoint(self):
+        checkpointer = Checkpointer()
+        supervisor = Supervisor(checkpointer)
+        seen = []
+
+        def session(resumed):
+            seen.append(resumed)
+            checkpointer.save(checkpoint(f"turn {len(seen)}"))
+            if len(seen) < 3:
+                raise RuntimeError("crash")
+            return "done"
+
+        self.assertEqual(supervisor.run(session), "done")
+        self.assertEqual([c and c.instruction for c in seen], [None, "turn 1", "turn 2"])
+        self.assertEqual(supervisor.restarts, 2)
+        self.assertLess(supervisor.last_restart, supervisor.restart_budget)
+
+    def test_gives_up_after_repeated_crashes(self):
+        supervisor = Supervisor(max_restarts=2)
+        calls = []
+
+        def session(resumed):
+            calls.append(resumed)
+            raise RuntimeError("crash")
+
+        with self.assertRaises(RuntimeError):
+            supervisor.run(session)
+        self.assertEqual(len(calls), 3)
+
+
+class TestWorkerRestart(unittest.TestCase):
+    def test_serial_transport(self):
+        """Packets queued while the I/O thread was down are written once it is restarted."""
+        ser = FakeSerial()
+        transport = SerialTransport(ser)
+        try:
+            with transport._cond:
+                transport._thread = dead_thread()
+            self.assertFalse(transport.is_alive())
+            transport.restart()
+            self.assertTrue(transport.is_alive())
+            transport.send(server.LSCServoController.CMD_SERVO_MOVE, [1, 20, 0, 2, 0x84, 0x03]).result(2)
+            self.assertEqual(len(ser.writes), 1)
+        finally:
+            transport.close()
+
+    def test_speech_worker(self):
+        speech = SpeechWorker(NullEngine, max_pending=4)
+        try:
+            with speech._cond:
+                speech._thread = dead_thread()
+            speech.say_async("still here")
+            speech.restart()
+            self.assertTrue(speech.flush(2))
+            self.assertEqual(speech.engine.spoken, ["still here"])
+        finally:
+            speech.close()
+
+    def test_camera(self):
+        with FakeMJPEGServer([make_jpeg((0, 0, 200), (64, 48))]) as stub:
+            camera = MJPEGGrabber(stub.url).start()
+            try:
+                supervisor = Supervisor()
+                supervisor.watch("camera", camera.is_alive, camera.start)
+                camera.stop()
+                seq = camera.seq
+                self.assertEqual(supervisor.check_workers(), ["camera"])
+                self.assertIsNotNone(camera.wait_for_frame(seq, timeout=2))
+            finally:
+                camera.stop()
+
+
+class CrashingArm:
+    """Arm whose serial link fails the first time a given servo is moved."""
+
+    def __init__(self, crash_servo: int):
+        self.crash_servo = crash_servo
+        self.moves = []
+
+    def move_servos(self, servo_ids, positions, time_ms):
+        if self.crash_servo in servo_ids:
+            self.crash_servo = None
+            raise IOError("serial port went away")
+        self.moves.append((servo_ids, positions))
+
+    def read_servo_positions(self):
+        return {1: 1500}
+
+
+class TestSessionRestart(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.saved = {name: getattr(server, name) for name in
+                      ("WEBCAM_URL", "OLLAMA_URL", "SERVO_MAX_VELOCITY", "SERVO_MAX_ACCELERATION", "FRAME_HISTORY",
+                       "MONTAGE", "SCENE_UNCHANGED_ACTION", "RESPONSE_CACHE", "CHECKPOINTER", "CONTEXT")}
+        self.camera = FakeMJPEGServer([make_jpeg((200, 10, 10), (64, 48))]).start()
+        server.WEBCAM_URL = self.camera.url
+        server.SERVO_MAX_VELOCITY = 5000
+        server.SERVO_MAX_ACCELERATION = 20000
+        server.FRAME_HISTORY = FrameStore(capacity=4)
+        server.MONTAGE = MontageBuilder()
+        server.SCENE_UNCHANGED_ACTION = "infer"
+        server.RESPONSE_CACHE = None
+        server.CHECKPOINTER = Checkpointer(self.path, interval=0)
+        server.CONTEXT = server.ChatContext(max_tokens=server.CONTEXT_MAX_TOKENS)
+        self.speech = SpeechWorker(NullEngine, max_pending=4)
+
+    def tearDown(self):
+        self.camera.stop()
+        self.speech.close()
+        for name, value in self.saved.items():
+            setattr(server, name, value)
+        super().tearDown()
+
+    def test_crash_mid_instruction_resumes(self):
+        """A device failure mid-instruction resumes the same instruction, from the checkpoint, in well under the budget."""
+        replies = [
+            json.dumps({"message": "moving", "tool_calls": [{"servo_id": 2, "position": 900}]}),
+            json.dumps({"message": "lowering", "tool_calls": [{"servo_id": 3, "position": 1000}]}),
+            json.dumps({"message": "done", "tool_calls": []}),
+        ]
+        arm = CrashingArm(crash_servo=3)
+        supervisor = Supervisor(server.CHECKPOINTER, restart_budget=1.0)
+
+        def next_instruction():
+            raise KeyboardInterrupt  # ends the session once the first instruction is done
+
+        with FakeOllamaServer(replies) as ollama:
+            server.OLLAMA_URL = ollama.chat_url
+            chat = server.ollama.build_prompt("llama3.2-vision")
+            with self.assertRaises(KeyboardInterrupt):
+                supervisor.run(lambda resumed: server.session(arm, self.speech, None, chat, next_instruction, resumed))
+
+        self.assertEqual(supervisor.restarts, 1)
+        self.assertLess(supervisor.last_restart, 1.0)
+        self.assertEqual(len(ollama.received), 3)
+        resumed = ollama.received[2]["messages"]
+        self.assertEqual([m["role"] for m in resumed], ["user", "assistant", "user", "assistant", "user"])
+        self.assertTrue(resumed[-1]["content"].startswith(server.prompts.CONTINUE))
+        self.assertEqual(arm.moves[-1], ([2], [900]))
+        # a fresh process picks up the finished state from disk
+        on_disk = Checkpointer(self.path).load()
+        self.assertIsNone(on_disk.instruction)
+        self.assertEqual(on_disk.pose[2], 900)
+        self.assertNotIn(3, on_disk.pose)  # its move is the one that failed
+        self.assertEqual(json.loads(on_disk.messages[-1]["content"])["message"], "done")
+
+
+if __name__ == "__main__":
+    unittest.main()
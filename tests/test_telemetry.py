@@ -0,0 +1,88 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import unittest
+
+from telemetry import Histogram, Telemetry
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles_within_bucket_error(self):
+        """Percentiles land within one bucket of the exact value."""
+        values = [random.Random(1).lognormvariate(3, 1) for _ in range(10000)]
+        histogram = Histogram()
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for p in (50, 95, 99):
+            exact = values[int(p / 100 * len(values)) - 1]
+            self.assertAlmostEqual(histogram.percentile(p) / exact, 1, delta=0.06)
+        self.assertEqual(histogram.percentile(100), values[-1])
+
+    def test_concurrent_records(self):
+        """Samples recorded from several threads are all counted."""
+        histogram = Histogram()
+        threads = [threading.Thread(target=lambda: [histogram.record(5) for _ in range(1000)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(histogram.snapshot()["count"], 4000)
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "telemetry.jsonl")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_summary_and_dump(self):
+        """The on-demand dump reports percentiles per name."""
+        telemetry = Telemetry()
+        for ms in range(1, 101):
+            telemetry.record("inference", ms)
+        with telemetry.timed("montage"):
+            pass
+        summary_path = os.path.join(self.dir.name, "summary.json")
+        summary = telemetry.dump(summary_path)
+        self.assertEqual(list(summary), ["inference", "montage"])
+        self.assertEqual(summary["inference"]["count"], 100)
+        self.assertAlmostEqual(summary["inference"]["p95_ms"], 95, delta=95 * 0.05)
+        with open(summary_path) as f:
+            self.assertEqual(json.load(f), summary)
+
+    def test_jsonl_events(self):
+        """Each sample becomes one JSON line with its extra fields."""
+        telemetry = Telemetry(self.path, flush_interval=0.01)
+        telemetry.record("ollama.eval_duration", 812.5, eval_tokens=40)
+        telemetry.close()
+        with open(self.path) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["name"], "ollama.eval_duration")
+        self.assertEqual(events[0]["ms"], 812.5)
+        self.assertEqual(events[0]["eval_tokens"], 40)
+
+    def test_rotation(self):
+        """The file is rotated once it passes max_bytes, keeping backup_count old files."""
+        telemetry = Telemetry(self.path, max_bytes=200, backup_count=2, flush_interval=60)
+        for batch in range(5):
+            for _ in range(5):
+                telemetry.record("serial.write", 1.0)
+            telemetry._flush()
+        telemetry.close()
+        self.assertEqual(sorted(os.listdir(self.dir.name)), ["telemetry.jsonl", "telemetry.jsonl.1", "telemetry.jsonl.2"])
+
+    def test_no_events_without_path(self):
+        """Without a file only the histograms are kept."""
+        telemetry = Telemetry()
+        telemetry.record("tts", 10)
+        self.assertEqual(len(telemetry.events), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
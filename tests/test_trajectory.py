@@ -0,0 +1,89 @@
+import time
+import unittest
+
+from lsc_servo_client import LSCServoController
+from trajectory import TrajectoryPlanner, profile_duration, profile_fraction
+
+
+class RecordingArm:
+    def __init__(self, positions=None):
+        self.positions = positions or {}
+        self.moves = []
+
+    def move_servos(self, servo_ids, positions, time_ms):
+        self.moves.append((time.monotonic(), servo_ids, positions, time_ms))
+
+    def read_servo_positions(self):
+        return dict(self.positions)
+
+
+class TestProfile(unittest.TestCase):
+    def test_duration_from_distance(self):
+        """Longer moves take longer, short ones never reach full speed."""
+        self.assertEqual(profile_duration(0, 1000, 2000), 0)
+        self.assertAlmostEqual(profile_duration(200, 1000, 2000), 2 * (200 / 2000) ** 0.5)
+        self.assertAlmostEqual(profile_duration(2000, 1000, 2000), 2.5)
+
+    def test_fraction_is_monotonic(self):
+        """The profile starts and ends at rest and never moves backwards."""
+        duration = profile_duration(1500, 1000, 2000)
+        fractions = [profile_fraction(duration * i / 100, 1500, 1000, 2000) for i in range(101)]
+        self.assertEqual(fractions[0], 0)
+        self.assertAlmostEqual(fractions[-1], 1)
+        self.assertEqual(fractions, sorted(fractions))
+
+
+class TestTrajectoryPlanner(unittest.TestCase):
+    def setUp(self):
+        self.arm = RecordingArm({2: 1500, 3: 1500})
+        self.planner = TrajectoryPlanner(self.arm, max_velocity=1000, max_acceleration=2000)
+        self.planner.refresh_pose()
+
+    def test_plan_respects_caps(self):
+        """Consecutive packets never exceed the velocity and acceleration caps."""
+        points = self.planner.plan([{2: 2500, 3: 1000}])
+        self.assertAlmostEqual(points[-1].at + points[-1].time_ms / 1000, profile_duration(1000, 1000, 2000), places=2)
+        previous, velocities = 1500, []
+        for point in points:
+            velocity = abs(point.positions[2] - previous) / (point.time_ms / 1000)
+            self.assertLessEqual(velocity, 1000 * 1.05)
+            velocities.append(velocity)
+            previous = point.positions[2]
+        self.assertEqual(points[-1].positions, {2: 2500, 3: 1000})
+        self.assertLess(velocities[0], velocities[len(velocities) // 2])
+
+    def test_rate_within_link_budget(self):
+        """Packets are spaced no faster than the serial link allows."""
+        self.planner.max_rate_hz = 1000
+        points = self.planner.plan([{s: 2000 for s in range(2, 7)}])
+        duration = points[-1].at + points[-1].time_ms / 1000
+        packet_bytes = 5 + 3 * 5
+        bytes_per_second = len(points) * packet_bytes / duration
+        self.assertLessEqual(bytes_per_second, self.planner.link_budget * LSCServoController.BAUD_RATE / 10 * 1.05)
+
+    def test_limits_clamped(self):
+        """Targets outside SERVO_LIMITS are clamped."""
+        points = self.planner.plan([{1: 2000}], start={1: 1500})
+        self.assertEqual(points[-1].positions, {1: 1800})
+
+    def test_waypoints_in_order(self):
+        """Each waypoint is reached before heading to the next."""
+        points = self.planner.plan([{2: 2000}, {2: 1000}, {3: 1700}])
+        twos = [p.positions[2] for p in points if 2 in p.positions]
+        self.assertIn(2000, twos)
+        self.assertLess(twos.index(2000), twos.index(1000))
+        self.assertEqual(points[-1].positions, {3: 1700})
+
+    def test_follow_streams_on_schedule(self):
+        """follow() sends each packet at its time and reports the arrival time."""
+        self.planner.max_velocity, self.planner.max_acceleration = 4000, 20000
+        start = time.monotonic()
+        arrival = self.planner.follow([{2: 1800}])
+        self.assertGreaterEqual(arrival, self.arm.moves[-1][0])
+        self.assertAlmostEqual(arrival - start, profile_duration(300, 4000, 20000), places=1)
+        self.assertEqual(self.planner.pose[2], 1800)
+        self.assertEqual(self.planner.plan([{2: 1800}]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import json
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+
+import server
+from transport import CircuitBreaker, CircuitOpenError, Endpoint, RetryPolicy, warm_up
+from tests.fakes import FakeOllamaServer
+
+
+REPLY = json.dumps({"message": "hi", "tool_calls": []})
+
+
+def endpoint(**kwargs):
+    kwargs.setdefault("sleep", lambda seconds: None)
+    return Endpoint("test", **kwargs)
+
+
+def post(ep, ollama):
+    return ep.post(ollama.chat_url, json={"messages": [], "stream": False})
+
+
+class TestEndpoint(unittest.TestCase):
+    def test_connections_reused(self):
+        """Consecutive requests share one keep-alive connection."""
+        ep = endpoint()
+        with FakeOllamaServer([REPLY]) as ollama:
+            for _ in range(3):
+                post(ep, ollama).raise_for_status()
+        ep.close()
+        self.assertEqual(ollama.connections, 1)
+
+    def test_transient_faults_retried(self):
+        """Dropped connections and 503s are retried until a reply comes back."""
+        ep = endpoint()
+        with FakeOllamaServer([REPLY], faults=["reset", 503]) as ollama:
+            response = post(ep, ollama)
+        self.assertEqual(response.json()["message"]["content"], REPLY)
+        self.assertEqual(ep.retries, 2)
+        self.assertEqual(len(ollama.received), 1)
+
+    def test_read_timeout_not_retried(self):
+        """A stalled reply fails on its first read timeout rather than waiting it out once per attempt."""
+        ep = endpoint(read_timeout=0.2)
+        with FakeOllamaServer([REPLY], faults=[1.0, 1.0, 1.0, 1.0]) as ollama:
+            started = time.monotonic()
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                post(ep, ollama)
+            self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual(ep.retries, 0)
+        self.assertEqual(ep.breaker.failures, 1)
+
+    def test_gives_up_after_attempts(self):
+        """Persistent failures end with the last error or status."""
+        ep = endpoint(retry=RetryPolicy(attempts=2))
+        with FakeOllamaServer([REPLY], faults=[503, 503, 503]) as ollama:
+            self.assertEqual(post(ep, ollama).status_code, 503)
+        with FakeOllamaServer([REPLY], faults=["reset"] * 3) as ollama:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                post(ep, ollama)
+
+    def test_client_errors_not_retried(self):
+        ep = endpoint()
+        with FakeOllamaServer([REPLY], faults=[404]) as ollama:
+            self.assertEqual(post(ep, ollama).status_code, 404)
+        self.assertEqual(ep.retries, 0)
+
+    def test_circuit_opens_and_recovers(self):
+        """After repeated failures calls fail fast, a trial call after the reset timeout closes it again."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+        ep = endpoint(retry=RetryPolicy(attempts=1), breaker=breaker)
+        with FakeOllamaServer([REPLY], faults=[500, 500]) as ollama:
+            post(ep, ollama)
+            post(ep, ollama)
+            self.assertEqual(breaker.state, "open")
+            with self.assertRaises(CircuitOpenError):
+                post(ep, ollama)
+            self.assertEqual(ollama.requests, 0)
+            time.sleep(0.25)
+            self.assertEqual(breaker.state, "half-open")
+            self.assertEqual(post(ep, ollama).status_code, 200)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_trial_error_reopens(self):
+        """A half-open trial that fails with an unexpected error reopens the circuit instead of wedging it."""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+        ep = endpoint(retry=RetryPolicy(attempts=1), breaker=breaker)
+        breaker.failure()
+        time.sleep(0.15)
+        with patch.object(ep.session, "request", side_effect=requests.exceptions.ChunkedEncodingError("torn")):
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                ep.get("http://127.0.0.1:9/")
+        self.assertEqual(breaker.state, "open")
+        time.sleep(0.15)
+        with FakeOllamaServer([REPLY]) as ollama:
+            self.assertEqual(post(ep, ollama).status_code, 200)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_jittered_backoff(self):
+        policy = RetryPolicy(backoff=1, max_backoff=4, jitter=0.5)
+        for attempt, base in enumerate([1, 2, 4, 4]):
+            delays = [policy.delay(attempt) for _ in range(50)]
+            self.assertTrue(all(base * 0.5 <= d <= base * 1.5 for d in delays))
+            self.assertGreater(len(set(delays)), 1)
+
+
+class TestWarmUp(unittest.TestCase):
+    def test_loads_model_with_keep_alive(self):
+        """The probe asks Ollama to load the model without sending a prompt."""
+        with FakeOllamaServer([REPLY]) as ollama:
+            warm_up(endpoint(), ollama.chat_url, "llama3.2-vision", 1200)
+        self.assertEqual(ollama.received[0]["messages"], [])
+        self.assertEqual(ollama.received[0]["keep_alive"], 1200)
+
+
+class TestServerChat(unittest.TestCase):
+    def setUp(self):
+        self.saved = server.OLLAMA
+        server.OLLAMA = endpoint()
+
+    def tearDown(self):
+        server.OLLAMA.close()
+        server.OLLAMA = self.saved
+
+    def test_stream_survives_transient_fault(self):
+        """A streamed chat is retried when the request fails before the reply starts."""
+        calls = []
+        reply = json.dumps({"message": "", "tool_calls": [{"servo_id": 2, "position": 900}]})
+        with FakeOllamaServer([reply], faults=["reset"]) as ollama:
+            response = server.chat(ollama.chat_url, {"messages": [], "stream": False, "images": [b"jpeg"]}, calls.append)
+        self.assertEqual(response["message"]["content"], reply)
+        self.assertEqual(calls, [{"servo_id": 2, "position": 900}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from vision import Query, SceneAnalyzer, SceneFacts, answer, simple_query
+
+GREY = (110, 110, 105)
+
+
+def scene(*bricks, size=(640, 480)) -> bytes:
+    """A JPEG of a grey table with a rectangle of each (colour, (left, top, right, bottom)) in pixels."""
+    image = Image.new("RGB", size, GREY)
+    draw = ImageDraw.Draw(image)
+    for color, box in bricks:
+        draw.rectangle(box, fill=color)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class TestSceneAnalyzer(unittest.TestCase):
+    def test_blobs(self):
+        """Each coloured rectangle is one blob with its colour, centroid and box, largest first."""
+        jpeg = scene(((220, 30, 30), (80, 80, 239, 199)), ((30, 60, 220), (400, 300, 479, 399)))
+        facts = SceneAnalyzer().analyse(jpeg)
+        self.assertEqual([blob.color for blob in facts.blobs], ["red", "blue"])
+        red, blue = facts.blobs
+        self.assertAlmostEqual(red.centroid[0], 160 / 640, delta=0.02)
+        self.assertAlmostEqual(red.centroid[1], 140 / 480, delta=0.02)
+        self.assertAlmostEqual(red.area, 160 * 120 / (640 * 480), delta=0.01)
+        self.assertAlmostEqual(blue.centroid[0], 440 / 640, delta=0.02)
+        for got, expected in zip(blue.bbox, (400 / 640, 300 / 480, 480 / 640, 400 / 480)):
+            self.assertAlmostEqual(got, expected, delta=0.03)
+        self.assertIsNone(facts.occupied)
+
+    def test_same_colour_apart(self):
+        """Two bricks of one colour that do not touch are two blobs."""
+        jpeg = scene(((40, 180, 40), (40, 40, 119, 119)), ((40, 180, 40), (400, 40, 479, 119)))
+        facts = SceneAnalyzer().analyse(jpeg)
+        self.assertEqual([blob.color for blob in facts.blobs], ["green", "green"])
+
+    def test_grey_and_specks_ignored(self):
+        """Unsaturated pixels are background and blobs below min_area are dropped."""
+        self.assertEqual(SceneAnalyzer().analyse(scene(((60, 60, 60), (0, 0, 320, 240)))).blobs, ())
+        speck = scene(((230, 200, 20), (300, 200, 319, 219)))
+        self.assertEqual(SceneAnalyzer().analyse(speck).blobs, ())
+        self.assertEqual(len(SceneAnalyzer(min_area=0).analyse(speck).blobs), 1)
+
+    def test_pincer_occupancy(self):
+        analyzer = SceneAnalyzer(pincer_region=(0.4, 0.6, 0.6, 0.8))
+        empty = analyzer.analyse(scene(((220, 30, 30), (20, 20, 99, 99))))
+        self.assertFalse(empty.occupied)
+        held = analyzer.analyse(scene(((230, 120, 20), (270, 300, 369, 379))))
+        self.assertTrue(held.occupied)
+        self.assertEqual(held.pincer_color, "orange")
+        self.assertIs(analyzer.last, held)
+
+    def test_other_sizes(self):
+        """Frames of any size are scaled to the analyser's size, which must be whole blocks."""
+        facts = SceneAnalyzer().analyse(scene(((220, 30, 30), (0, 0, 31, 23)), size=(64, 48)))
+        self.assertEqual([blob.color for blob in facts.blobs], ["red"])
+        with self.assertRaises(ValueError):
+            SceneAnalyzer(size=(150, 120))
+
+
+class TestQueries(unittest.TestCase):
+    FACTS = SceneAnalyzer(pincer_region=(0.4, 0.6, 0.6, 0.8)).analyse(
+        scene(((220, 30, 30), (20, 20, 99, 99)), ((220, 30, 30), (500, 20, 599, 99)),
+              ((30, 60, 220), (280, 300, 359, 379))))
+
+    def test_simple_query(self):
+        self.assertEqual(simple_query("Is there anything between the pincers?"), Query("pincer"))
+        self.assertEqual(simple_query("How many red bricks are there"), Query("count", "red"))
+        self.assertEqual(simple_query("how many things can you see"), Query("count"))
+        self.assertEqual(simple_query("Where is the blue one?"), Query("where", "blue"))
+        self.assertEqual(simple_query("What colours can you see?"), Query("colors"))
+        self.assertIsNone(simple_query("Pick up the red brick"))
+        self.assertIsNone(simple_query("Where should you put it?"))
+        self.assertIsNone(simple_query(""))
+        self.assertEqual(simple_query("is the gripper empty"), Query("pincer"))
+
+    def test_instructions_not_answered(self):
+        """A question that comes with something to do is left to the model."""
+        for text in ("Where is the red brick? Put it in the bowl", "How many red bricks are there, then stack them",
+                     "where is the red brick put it in the bowl", "how many blue bricks are there and sort them",
+                     "Is there anything between the pincers? If not pick up the red one"):
+            self.assertIsNone(simple_query(text), text)
+
+    def test_answers(self):
+        self.assertEqual(answer(Query("pincer"), self.FACTS), "I am holding something blue.")
+        self.assertEqual(answer(Query("count", "red"), self.FACTS), "I can see 2 red objects.")
+        self.assertEqual(answer(Query("count"), self.FACTS), "I can see 3 objects: 2 red, 1 blue.")
+        self.assertEqual(answer(Query("where", "blue"), self.FACTS), "The blue object is at the bottom centre of the picture.")
+        self.assertEqual(answer(Query("colors"), self.FACTS), "I can see red, blue.")
+        self.assertEqual(answer(Query("pincer"), self.FACTS._replace(occupied=False)), "There is nothing between my pincers.")
+        self.assertIsNone(answer(Query("pincer"), self.FACTS._replace(occupied=None)))
+
+    def test_describe(self):
+        text = self.FACTS.describe()
+        self.assertTrue(text.startswith("Local vision found 3 coloured objects"))
+        self.assertIn("blue at x=0.50 y=0.71", text)
+        self.assertTrue(text.endswith("There is something blue between the pincers."))
+        self.assertEqual(SceneFacts((), None, None, None).describe(),
+                         "Local vision found no coloured objects in the latest image.")
+
+
+if __name__ == "__main__":
+    unittest.main()